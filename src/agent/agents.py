@@ -2,9 +2,12 @@ import os
 from autogen import AssistantAgent, UserProxyAgent, register_function
 from src.tools.file_tools import get_file_tools
 from src.tools.shell_tools import get_shell_tools
+from src.tools.patch_tools import get_patch_tools
 from src.tools.git_tools import get_git_tools
 from src.tools.index_tools import semantic_code_search
+from src.tools.digest_tools import project_digest
 from src.tools.lsp_tools import get_lsp_tools
+from src.tools.read_cache import track_read_session
 import warnings
 
 def load_role_prompt(role: str) -> str:
@@ -197,7 +200,26 @@ def create_agents(api_key: str, base_url: str, mcp_manager=None):
             description=semantic_code_search.__doc__
         )
 
-        # 2. 为 Coder 注册 Shell 工具（用于运行构建、测试等命令）
+        # 5. 注册项目摘要工具（索引阶段预生成的文件摘要）
+        register_function(
+            project_digest,
+            caller=architect,
+            executor=user_proxy,
+            name="project_digest",
+            description=project_digest.__doc__
+        )
+
+        # 6. 为 Coder 注册补丁工具（以统一 diff 修改文件，输出 token 与改动量成正比）
+        for tool in get_patch_tools():
+            register_function(
+                tool,
+                caller=coder,
+                executor=coder,
+                name=tool.__name__,
+                description=tool.__doc__
+            )
+
+        # 7. 为 Coder 注册 Shell 工具（用于运行构建、测试等命令）
         for tool in get_shell_tools():
             register_function(
                 tool,
@@ -221,7 +243,7 @@ def create_agents(api_key: str, base_url: str, mcp_manager=None):
                 description=tool.__doc__
             )
 
-    # 5. 注册 MCP 工具
+    # 8. 注册 MCP 工具
     if mcp_manager:
         # Register definitions for Agents (Callers)
         for tool_def in mcp_manager.tools:
@@ -252,4 +274,8 @@ def create_agents(api_key: str, base_url: str, mcp_manager=None):
                 function_map={name: func}
             )
 
+    # 记录执行工具的 agent 所在的对话与轮次，重复读取未修改的文件时只返回简短说明
+    for executor in (coder, reviewer, tester, user_proxy):
+        track_read_session(executor)
+
     return architect, coder, reviewer, tester, user_proxy, make_manager_config()
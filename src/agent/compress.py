@@ -1,6 +1,54 @@
 from autogen.agentchat.contrib.capabilities.transforms import MessageTransform
+import threading
+import weakref
+from collections import OrderedDict
+from contextvars import ContextVar
 from typing import Any
 from opentelemetry import trace 
+from src.agent.extractive import ExtractiveCompressor, HybridTextCompressor
+from src.agent.tokenizer import MessageTokenCache, TokenLedger, count_tools_tokens, get_tokenizer, message_key
+from src.tools.read_cache import conversation_id, read_cache
+
+# 当前正在生成回复的 (agent 名称, 对话方名称)，由 track_conversation_partner 设置
+_conversation_context = ContextVar("compression_conversation", default=None)
+
+# 创建过后台预压缩线程的压缩器，程序退出时由 shutdown_precompress_workers 统一关闭
+_speculative_compressors = weakref.WeakSet()
+_speculative_lock = threading.Lock()
+
+
+def shutdown_precompress_workers():
+    """
+    关闭所有压缩器的后台预压缩线程（程序退出时调用）。
+    ThreadPoolExecutor 的工作线程不是守护线程，不关闭时排队的预压缩会让解释器迟迟不能退出；
+    排队中的任务直接取消，正在进行的请求结束后线程退出。
+    """
+    with _speculative_lock:
+        compressors = list(_speculative_compressors)
+        _speculative_compressors.clear()
+    for compressor in compressors:
+        executor, compressor._executor = compressor._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def track_conversation_partner(agent):
+    """
+    包装 agent.generate_reply，在生成回复期间记录 (agent, 对话方)。
+    process_all_messages_before_reply 钩子只拿得到消息列表，压缩器据此区分同一 agent 与不同对象的对话。
+    """
+    original_generate_reply = agent.generate_reply
+
+    def generate_reply(*args, **kwargs):
+        sender = kwargs.get("sender", args[1] if len(args) > 1 else None)
+        token = _conversation_context.set((agent.name, getattr(sender, "name", None)))
+        try:
+            return original_generate_reply(*args, **kwargs)
+        finally:
+            _conversation_context.reset(token)
+
+    agent.generate_reply = generate_reply
+    return agent
 
 
 class LLMTextCompressor:
@@ -16,6 +64,8 @@ class LLMTextCompressor:
             llm_config: 大模型配置，包含 api_key、base_url、model 等信息
         """
         self.llm_config = llm_config
+        # LLM 不可用或出错时的兜底：本地抽取式压缩，保留最相关、最近的内容，而不是简单截断
+        self.fallback_compressor = ExtractiveCompressor()
     
     def compress(self, text, **kwargs):
         """
@@ -29,7 +79,7 @@ class LLMTextCompressor:
             压缩后的文本内容
         """
         try:
-            from openai import OpenAI
+            from src.llm_clients import chat_completion, get_openai_client
             
             # 获取压缩参数
             target_token = kwargs.get("target_token", 500)
@@ -39,23 +89,20 @@ class LLMTextCompressor:
             # 获取 LLM 配置
             config_list = self.llm_config.get("config_list", [])
             if not config_list:
-                return f"[警告：LLM 配置为空，无法压缩文本]\n{text[:1000]}..."  # 返回截断文本
+                return f"[警告：LLM 配置为空，使用本地抽取式压缩]\n{self.fallback_compressor.compress(text, target_token=target_token)}"
             
             # 使用第一个配置
             config = config_list[0]
             
-            # 构建 OpenAI 客户端
-            client_params = {
-                "api_key": config.get("api_key"),
-                "base_url": config.get("base_url")
-            }
-            # api_type 参数在新版本 OpenAI 客户端中不再支持
-            client = OpenAI(**client_params)
+            # 复用共享的连接池客户端
+            client = get_openai_client(api_key=config.get("api_key"), base_url=config.get("base_url"))
             
             # 构建压缩请求
             system_prompt = compression_prompt.format(target_token=target_token)
             
-            response = client.chat.completions.create(
+            response = chat_completion(
+                client,
+                "context_compression",
                 model=config.get("model"),
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -70,12 +117,32 @@ class LLMTextCompressor:
                 compressed_text = response.choices[0].message.content.strip()
                 return compressed_text
             
-            # 如果生成失败，返回截断文本
-            return text[:target_token * 4]  # 粗略估计每个token对应4个字符
+            # 如果生成失败，使用本地抽取式压缩
+            return self.fallback_compressor.compress(text, target_token=target_token)
         except Exception as e:
-            # 如果发生任何异常，返回截断文本
+            # 如果发生任何异常，使用本地抽取式压缩
             target_token = kwargs.get("target_token", 500)
-            return f"[警告：压缩时出错 - {str(e)}]\n{text[:target_token * 4]}..."
+            return f"[警告：压缩时出错 - {str(e)}]\n{self.fallback_compressor.compress(text, target_token=target_token)}"
+
+
+class CompressionState:
+    """单个对话的压缩状态：摘要缓存、分层片段、token 前缀和以及预压缩任务。"""
+
+    def __init__(self, token_cache):
+        # 缓存压缩后的消息和原始消息索引
+        self.compression_cache = {
+            "compressed_message": None,  # 压缩后的消息
+            "compressed_up_to_index": 0,  # 压缩到的消息索引
+            "compressed_token_count": 0  # 压缩后的 token 数
+        }
+        # 分层摘要：segment_levels[k] 为第 k 层片段列表，层级越高覆盖的历史越早
+        self.segment_levels = []
+        self.ledger = TokenLedger(token_cache)
+        self.precompute = None
+        # read_cache 中的对话标识，摘要替换消息后据此作废对应的读取记录
+        self.conversation = None
+        # append 策略：每条消息第一次发送给模型时的样子，之后原样重发
+        self.frozen = []
 
 
 class LLMMessagesCompressor(MessageTransform):
@@ -88,9 +155,21 @@ class LLMMessagesCompressor(MessageTransform):
     4. 压缩时，会将需要压缩的 messages 列表，最终压缩成一个 message，并与最后几轮消息组成最终的 message 列表
     5. 缓存压缩后的消息，并且记录位置，后续压缩的时候，利用之前已经压缩好的缓存，而不是重复压缩
     6. 如果复用已经压缩好的缓存之后，没有超过大小，也不需要压缩
+    7. 分层摘要（hierarchical，默认）：每段被移出的历史只摘要一次成为第 0 层片段，
+       某一层片段数达到 fanout 时才合并成上一层摘要，每次压缩的开销只与新增消息有关；
+       rolling 策略则沿用"旧摘要 + 新消息"整体重新压缩的方式
+    8. 预压缩模式（speculative）：token 数超过低水位后在后台线程提前生成摘要，
+       达到阈值时直接换入已完成的摘要，只有预压缩覆盖不足时才同步等待 LLM
+    9. 前缀缓存友好（append）：摘要以独立的消息块依次追加，已有的块及其之前的系统提示、
+       固定消息字节级不变，便于命中服务端的前缀缓存；每次压缩多压一些（只保留约
+       cache_retain_ratio * max_tokens 的尾部），使压缩低频发生；摘要块超出预算时才一次性合并。
+       已经发送过的消息也原样重发，预处理变换对它们的改写推迟到下一次超过阈值时生效：
+       先由冻结的消息吸收这些改写，仍然放不下才生成新的摘要
+    10. 同一个压缩器可以挂到多个 agent 上：压缩状态按 (agent, 对话方, 对话) 分别保存，
+       最多保留 max_conversations 个，超出后淘汰最久未使用的
     """
     
-    def __init__(self, llm_config, max_tokens=10000, recent_rounds=5, compression_prompt=None, target_token=500, keep_first_n=0):
+    def __init__(self, llm_config, max_tokens=10000, recent_rounds=5, compression_prompt=None, target_token=500, keep_first_n=0, tokenizer=None, tool_schemas=None, speculative=False, precompress_ratio=0.7, summary_strategy="hierarchical", segment_fanout=4, max_conversations=16, cache_retain_ratio=0.5, compressor_mode="llm"):
         """
         初始化 LLMMessagesCompressor。
         
@@ -101,6 +180,15 @@ class LLMMessagesCompressor(MessageTransform):
             compression_prompt: 压缩时使用的 prompt
             target_token: 压缩目标 token 数
             keep_first_n: 保留最前面的消息数量，不参与压缩（默认 0）
+            tokenizer: token 计数器（需实现 count(text)），默认由 COMPRESS_TOKENIZER 环境变量决定
+            tool_schemas: 随每次请求发送的工具 schema，其 token 数计入阈值判断
+            speculative: 是否开启后台预压缩
+            precompress_ratio: 预压缩的低水位，占 max_tokens 的比例
+            summary_strategy: 摘要策略，hierarchical（分层片段）、rolling（整体重新压缩）或 append（前缀缓存友好的追加式摘要块）
+            segment_fanout: 分层摘要中每层最多保留的片段数，达到后合并到上一层
+            max_conversations: 最多保留压缩状态的对话数量（LRU）
+            cache_retain_ratio: append 策略下，每次压缩后保留的尾部 token 数占 max_tokens 的比例
+            compressor_mode: llm（大模型摘要）、extractive（本地抽取式，无网络调用）或 hybrid（先抽取再由大模型精炼）
         """
         self.llm_config = llm_config
         self.max_tokens = max_tokens
@@ -110,31 +198,94 @@ class LLMMessagesCompressor(MessageTransform):
         self.keep_first_n = keep_first_n
         self.agent_name = "Agent" # 默认值，由 orchestrator 设置
         
-        # 缓存压缩后的消息和原始消息索引
-        self._compression_cache = {
-            "compressed_message": None,  # 压缩后的消息
-            "compressed_up_to_index": 0,  # 压缩到的消息索引
-            "compressed_token_count": 0  # 压缩后的 token 数
-        }
+        # token 计数：按消息缓存 + 前缀和，每轮只需对新增消息计数
+        self.tokenizer = tokenizer or get_tokenizer()
+        self._token_cache = MessageTokenCache(self.tokenizer)
+        self.schema_tokens = count_tools_tokens(tool_schemas, self.tokenizer)
+        
+        # 分层摘要
+        self.summary_strategy = summary_strategy
+        self.segment_fanout = max(2, segment_fanout)
+        # 每个片段的目标大小，保证各层片段拼起来与 target_token 同一量级
+        self.segment_target_token = max(self.target_token // self.segment_fanout, 100)
+        self.cache_retain_ratio = cache_retain_ratio
         
-        # 创建 LLMTextCompressor 实例用于实际压缩
-        self.llm_compressor = LLMTextCompressor(llm_config=llm_config)
+        # 按对话保存的压缩状态（LRU）
+        self.max_conversations = max_conversations
+        self._states = OrderedDict()
+        self._state = CompressionState(self._token_cache)
+        
+        # 创建实际执行压缩的压缩器
+        self.compressor_mode = compressor_mode
+        if compressor_mode == "extractive":
+            self.llm_compressor = ExtractiveCompressor(tokenizer=self.tokenizer)
+        elif compressor_mode == "hybrid":
+            self.llm_compressor = HybridTextCompressor(
+                LLMTextCompressor(llm_config=llm_config),
+                ExtractiveCompressor(tokenizer=self.tokenizer)
+            )
+        else:
+            self.llm_compressor = LLMTextCompressor(llm_config=llm_config)
+        
+        # 后台预压缩：单线程执行器 + 当前预压缩任务
+        self.speculative = speculative
+        self.low_watermark = int(max_tokens * precompress_ratio)
+        self._executor = None
+    
+    # === 当前对话的压缩状态 ===
+    @property
+    def _compression_cache(self):
+        return self._state.compression_cache
+    
+    @property
+    def _ledger(self):
+        return self._state.ledger
+    
+    @property
+    def _segment_levels(self):
+        return self._state.segment_levels
+    
+    @_segment_levels.setter
+    def _segment_levels(self, value):
+        self._state.segment_levels = value
+    
+    @property
+    def _precompute(self):
+        return self._state.precompute
+    
+    @_precompute.setter
+    def _precompute(self, value):
+        self._state.precompute = value
+    
+    def _conversation_key(self, messages):
+        """(agent, 对话方, 对话标识)；对话标识取第一条消息，新开的对话即使对象相同也不会混用状态。"""
+        agent_name, partner = _conversation_context.get() or (None, None)
+        return (agent_name, partner, hash(message_key(messages[0])))
+    
+    def _activate_state(self, messages):
+        key = self._conversation_key(messages)
+        state = self._states.get(key)
+        if state is None:
+            state = CompressionState(self._token_cache)
+            self._states[key] = state
+            while len(self._states) > self.max_conversations:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+        state.conversation = conversation_id(messages)
+        self._state = state
     
     def _count_tokens(self, message):
         """
-        估算消息的 token 数。
+        估算消息的 token 数（带缓存）。
         
         Args:
             message: 消息字典
         
         Returns:
-            token 数估算值
+            token 数估算值，包含正文与 tool_calls 参数
         """
-        content = message.get("content", "")
-        # 粗略估计：1 个 token 约等于 3 个汉字或 4 个英文单词
-        # 这里使用更通用的估算方式：(中文数 * 0.6 + 英文单词数 * 1.3)
-        # 简化版：字符数 // 3 (对于混合文本较实用)
-        return len(content) // 3
+        return self._token_cache.count(message)
     
     def _count_total_tokens(self, messages):
         """
@@ -148,6 +299,275 @@ class LLMMessagesCompressor(MessageTransform):
         """
         return sum(self._count_tokens(msg) for msg in messages)
     
+    def _find_recent_start_index(self, messages):
+        """计算最近消息的起始位置，确保不会切断 assistant.tool_calls 和 tool 结果的关联。"""
+        recent_start_index = len(messages) - self.recent_rounds
+        if self.summary_strategy == "append":
+            # 一次多压缩一些，只保留预算内的尾部，下一次压缩要很多轮之后才会触发
+            budget = int(self.max_tokens * self.cache_retain_ratio)
+            cut = len(messages)
+            while cut > self.keep_first_n and self._ledger.range(cut - 1, len(messages)) <= budget:
+                cut -= 1
+            recent_start_index = min(recent_start_index, cut)
+        # 如果起始消息是 tool，我们必须向前追溯到起始的 assistant 消息
+        while recent_start_index > self.keep_first_n and messages[recent_start_index].get("role") == "tool":
+            recent_start_index -= 1
+        return recent_start_index
+    
+    @staticmethod
+    def _same_origin(sent, message):
+        """两条消息是否来自同一条原始消息：预处理变换只改写工具输出的正文，其余字段保持不变。"""
+        if sent.get("role") != message.get("role") or sent.get("tool_calls") != message.get("tool_calls"):
+            return False
+        if message.get("tool_responses") or message.get("role") == "tool":
+            ids = lambda msg: [response.get("tool_call_id") for response in msg.get("tool_responses") or [msg]]
+            return ids(sent) == ids(message)
+        return sent.get("content") == message.get("content")
+    
+    def _freeze(self, messages):
+        """
+        append 策略下，已经发送过的消息原样重发：SupersessionPruner / ToolOutputElider 之后对它们的改写
+        会让服务端的前缀缓存从改写处失效，因此推迟到下一次压缩（新摘要块之后的缓存本来就会失效）时才生效。
+        """
+        frozen = self._state.frozen
+        result = list(messages)
+        for i, sent in enumerate(frozen[:len(messages)]):
+            if not self._same_origin(sent, messages[i]):
+                break
+            result[i] = sent
+        self._state.frozen = result
+        return result
+    
+    def _refreeze(self, messages):
+        """压缩后换用预处理变换的最新结果，重新冻结新摘要块之后的消息。"""
+        self._state.frozen = list(messages)
+        self._ledger.sync(messages)
+        return messages
+    
+    def _uncompressed_start_index(self):
+        """尚未被摘要覆盖的第一条消息（keep_first_n 之前的消息始终保留原文）。"""
+        return max(self._compression_cache["compressed_up_to_index"], self.keep_first_n)
+    
+    def _estimate_total(self, message_count):
+        """
+        估算最终发送给模型的 token 数：
+        保留的前 keep_first_n 条 + 摘要 + 未压缩的消息 + 工具 schema。
+        """
+        if self._compression_cache["compressed_message"] is None:
+            return self._ledger.range(0, message_count) + self.schema_tokens
+        return (
+            self._ledger.range(0, self.keep_first_n)
+            + self._compression_cache["compressed_token_count"]
+            + self._ledger.range(self._uncompressed_start_index(), message_count)
+            + self.schema_tokens
+        )
+    
+    def _build_view(self, messages):
+        """用缓存的摘要替换已压缩的部分，构建最终的消息列表。"""
+        if self._compression_cache["compressed_message"] is None:
+            return messages
+        keep_first_messages = messages[:self.keep_first_n]
+        recent_messages = messages[self._compression_cache["compressed_up_to_index"]:]
+        if self.summary_strategy == "append":
+            summary_messages = [block["message"] for block in self._segment_levels[0]]
+        else:
+            summary_messages = [self._compression_cache["compressed_message"]]
+        return keep_first_messages + summary_messages + recent_messages
+    
+    def _build_compress_text(self, messages_to_compress):
+        """把上一次的摘要与新增需要压缩的消息拼接成待压缩文本。"""
+        text_to_compress = ""
+        # 分层 / 追加式摘要只压缩新增的消息，旧摘要保持不变
+        if self.summary_strategy == "rolling" and self._compression_cache["compressed_message"] is not None:
+            # 先将缓存中的压缩消息转换为可读文本
+            compressed_content = self._compression_cache["compressed_message"].get("content", "")
+            # 移除可能的标记
+            if "### [历史对话模拟摘要]" in compressed_content:
+                compressed_content = compressed_content.replace("### [历史对话模拟摘要]\n", "")
+            elif "[历史对话摘要]: " in compressed_content:
+                compressed_content = compressed_content.replace("[历史对话摘要]: ", "")
+            text_to_compress = compressed_content + "\n"
+        text_to_compress += "\n".join([
+            f"[{msg.get('role', 'unknown')}]: {msg.get('content', '')}"
+            for msg in messages_to_compress
+        ])
+        return text_to_compress
+    
+    def _compress_target(self):
+        return self.target_token if self.summary_strategy == "rolling" else self.segment_target_token
+    
+    def _reset_cache(self):
+        self._compression_cache.update(compressed_message=None, compressed_up_to_index=0, compressed_token_count=0)
+        self._segment_levels = []
+        self._precompute = None
+    
+    def _push_segment(self, summary, start_index, end_index):
+        """新增一个第 0 层片段；某层片段数达到 fanout 时合并为上一层的一个片段。"""
+        if not self._segment_levels:
+            self._segment_levels.append([])
+        self._segment_levels[0].append({"summary": summary, "start": start_index, "end": end_index})
+        
+        level = 0
+        while len(self._segment_levels[level]) >= self.segment_fanout:
+            group = self._segment_levels[level]
+            self._segment_levels[level] = []
+            print(f"  - [{self.agent_name}] 合并第 {level} 层的 {len(group)} 个摘要片段")
+            merged = self.llm_compressor.compress(
+                text="\n\n".join(segment["summary"] for segment in group),
+                target_token=self.segment_target_token,
+                compression_prompt=self.compression_prompt
+            )
+            if len(self._segment_levels) == level + 1:
+                self._segment_levels.append([])
+            self._segment_levels[level + 1].append({"summary": merged, "start": group[0]["start"], "end": group[-1]["end"]})
+            level += 1
+    
+    def _render_segments(self):
+        """按时间顺序拼接各层片段：高层（更早的历史）在前。"""
+        parts = []
+        for segments in reversed(self._segment_levels):
+            for segment in segments:
+                parts.append(f"[消息 {segment['start']}-{segment['end'] - 1}]\n{segment['summary']}")
+        return "\n\n".join(parts)
+    
+    def _make_block(self, summary, start_index, end_index, number):
+        """构造一个摘要块；块消息创建后不再修改，保证字节级稳定。"""
+        message = {
+            "role": "user",
+            "content": f"### [历史对话模拟摘要 {number}] 消息 {start_index}-{end_index - 1}\n{summary}",
+            "name": "compressed_history"
+        }
+        return {"summary": summary, "start": start_index, "end": end_index, "message": message, "tokens": self._count_tokens(message)}
+    
+    def _append_block(self, summary, start_index, end_index):
+        """追加摘要块；所有块的总 token 数超出预算时，一次性合并为一个块。"""
+        if not self._segment_levels:
+            self._segment_levels.append([])
+        blocks = self._segment_levels[0]
+        blocks.append(self._make_block(summary, start_index, end_index, len(blocks) + 1))
+        # 摘要块最多占用压缩后剩余空间的一半，否则压缩后仍可能很快再次触发
+        budget = min(self.target_token, int(self.max_tokens * (1 - self.cache_retain_ratio) / 2))
+        if len(blocks) > 1 and sum(block["tokens"] for block in blocks) > budget:
+            print(f"  - [{self.agent_name}] 摘要块超出预算，合并 {len(blocks)} 个摘要块")
+            merged = self.llm_compressor.compress(
+                text="\n\n".join(block["summary"] for block in blocks),
+                target_token=self.segment_target_token,
+                compression_prompt=self.compression_prompt
+            )
+            self._segment_levels[0] = [self._make_block(merged, blocks[0]["start"], blocks[-1]["end"], 1)]
+    
+    def _update_cache(self, compressed_text, up_to_index):
+        # 被摘要替换的工具输出已不在上下文中，之后的 read_file 不能再用“未修改”说明指向它们
+        read_cache.invalidate(self._state.conversation, up_to_index)
+        if self.summary_strategy == "append":
+            self._append_block(compressed_text, self._uncompressed_start_index(), up_to_index)
+            blocks = self._segment_levels[0]
+            self._compression_cache["compressed_message"] = blocks[-1]["message"]
+            self._compression_cache["compressed_up_to_index"] = up_to_index
+            self._compression_cache["compressed_token_count"] = sum(block["tokens"] for block in blocks)
+            return
+        if self.summary_strategy == "hierarchical":
+            self._push_segment(compressed_text, self._uncompressed_start_index(), up_to_index)
+            compressed_text = self._render_segments()
+        compressed_message = {
+            "role": "user",
+            "content": f"### [历史对话模拟摘要]\n{compressed_text}",
+            "name": "compressed_history"
+        }
+        self._compression_cache["compressed_message"] = compressed_message
+        self._compression_cache["compressed_up_to_index"] = up_to_index
+        self._compression_cache["compressed_token_count"] = self._count_tokens(compressed_message)
+    
+    def _schedule_precompression(self, messages):
+        """超过低水位时，在后台提前压缩当前可压缩的前缀。"""
+        if self._precompute is not None:
+            # 已有任务在运行，或已有可用的预压缩结果
+            if not self._precompute["future"].done() or self._precompute_valid(self._precompute, messages):
+                return
+            self._precompute = None
+        
+        start_index = self._uncompressed_start_index()
+        recent_start_index = self._find_recent_start_index(messages)
+        if recent_start_index <= max(start_index, 1):
+            return
+        
+        text_to_compress = self._build_compress_text(messages[start_index:recent_start_index])
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="precompress")
+            with _speculative_lock:
+                _speculative_compressors.add(self)
+        future = self._executor.submit(
+            self.llm_compressor.compress,
+            text=text_to_compress,
+            target_token=self._compress_target(),
+            compression_prompt=self.compression_prompt
+        )
+        self._precompute = {
+            "future": future,
+            # 预压缩基于的摘要，换入时必须与当前缓存一致
+            "base_message": self._compression_cache["compressed_message"],
+            "start_index": start_index,
+            "up_to_index": recent_start_index,
+            # 被覆盖的消息指纹，用于检测历史是否被改写
+            "keys": self._ledger.keys(start_index, recent_start_index),
+        }
+        print(f"  - [{self.agent_name}] 超过预压缩水位 {self.low_watermark}，后台预压缩前 {recent_start_index} 条消息")
+    
+    def _precompute_valid(self, precompute, messages):
+        return (
+            precompute["base_message"] is self._compression_cache["compressed_message"]
+            and precompute["up_to_index"] <= len(messages)
+            and self._ledger.keys(precompute["start_index"], precompute["up_to_index"]) == precompute["keys"]
+        )
+    
+    def _adopt_precomputed(self, messages):
+        """
+        尝试换入后台预压缩的摘要。
+        任务尚未完成时，只有在它足以让 token 数回到阈值以下的情况下才等待，否则直接走同步压缩。
+        
+        Returns:
+            是否换入了预压缩的摘要
+        """
+        precompute, self._precompute = self._precompute, None
+        if precompute is None or not self._precompute_valid(precompute, messages):
+            return False
+        
+        future = precompute["future"]
+        if not future.done():
+            # 以目标 token 数估算摘要大小；分层 / 追加式摘要会保留已有片段
+            existing = self._compression_cache["compressed_token_count"] if self.summary_strategy != "rolling" else 0
+            estimated = (
+                self._ledger.range(0, self.keep_first_n)
+                + existing
+                + self._compress_target()
+                + self._ledger.range(precompute["up_to_index"], len(messages))
+                + self.schema_tokens
+            )
+            if estimated > self.max_tokens:
+                return False
+            print(f"  - [{self.agent_name}] 等待后台预压缩完成...")
+        
+        try:
+            compressed_text = future.result()
+        except Exception as e:
+            print(f"  - [{self.agent_name}] 后台预压缩失败: {e}")
+            return False
+        
+        self._update_cache(compressed_text, precompute["up_to_index"])
+        return True
+    
+    def _set_result_attributes(self, span, original_tokens, compressed_result):
+        """记录压缩结果；压缩后的 token 数由前缀和直接得出，无需再次遍历消息。"""
+        compressed_tokens = self._estimate_total(self._ledger.size) - self.schema_tokens
+        saved_tokens = original_tokens - compressed_tokens
+        span.set_attribute("messages.compressed_count", len(compressed_result))
+        span.set_attribute("messages.compressed_tokens", compressed_tokens)
+        span.set_attribute("compression.saved_tokens", saved_tokens)
+        span.set_attribute("compression.compressed", True)
+        span.set_attribute("compression.compression_ratio", 
+                          (saved_tokens / original_tokens) * 100 if original_tokens > 0 else 0)
+    
     def apply_transform(self, messages):
         """
         实现 MessageTransform 接口的方法，应用压缩策略处理消息。
@@ -163,210 +583,113 @@ class LLMMessagesCompressor(MessageTransform):
             
         print(f"[{getattr(self, 'agent_name', 'Agent')}] 检查上下文压缩...")
         
+        # 切换到当前对话的压缩状态
+        self._activate_state(messages)
+        transformed = messages
+        if self.summary_strategy == "append":
+            messages = self._freeze(messages)
+        
+        # 同步前缀和：历史消息命中缓存，只有新增消息需要计数
+        self._ledger.sync(messages)
+        
+        # 消息列表变短说明换了新的对话，之前的摘要不再适用
+        if self._compression_cache["compressed_up_to_index"] > len(messages):
+            self._reset_cache()
+        
         # 1. 计算当前消息的总 token 数
         # 如果有缓存的压缩消息，计算方式是：压缩消息的 token 数 + 未压缩消息的 token 数
-        if self._compression_cache["compressed_message"] is not None:
-            # 复用缓存
-            # 未压缩的消息是从上次压缩的位置到最新消息中除了最近几轮的部分
-            # 考虑keep_first_n参数，确保最前面的消息不参与压缩
-            uncompressed_start_index = max(self._compression_cache["compressed_up_to_index"], self.keep_first_n)
-            uncompressed_end_index = len(messages) - self.recent_rounds
-            
-            # 计算未压缩消息的 token 数
-            if uncompressed_start_index < uncompressed_end_index:
-                uncompressed_messages = messages[uncompressed_start_index:uncompressed_end_index]
-                uncompressed_token_count = self._count_total_tokens(uncompressed_messages)
-            else:
-                uncompressed_token_count = 0
+        total_token_count = self._estimate_total(len(messages))
+        
+        # append 策略：超过阈值时先让冻结的消息吸收预处理变换的改写，放得下就不需要新的摘要
+        if total_token_count > self.max_tokens and messages is not transformed:
+            messages = self._refreeze(transformed)
+            total_token_count = self._estimate_total(len(messages))
+            print(f"  - [{self.agent_name}] 已应用预处理变换的改写，当前 token 数: {total_token_count}")
+        
+        # 如果总 token 数未超过阈值，复用已有摘要即可，不需要压缩
+        if total_token_count <= self.max_tokens:
+            print(f"  - [{self.agent_name}] 当前 token 数: {total_token_count} (阈值: {self.max_tokens}) -> 跳过压缩")
+            if self.speculative and total_token_count >= self.low_watermark:
+                self._schedule_precompression(messages)
+            return self._build_view(messages)
+        
+        print(f"  - [{self.agent_name}] 当前 token 数: {total_token_count} (阈值: {self.max_tokens}) -> 触发压缩!")
+        
+        original_tokens = self._ledger.total
+        tracer = trace.get_tracer(__name__)
+        
+        # 2. 优先换入后台预压缩的摘要
+        if self.speculative and self._adopt_precomputed(messages):
+            if self.summary_strategy == "append":
+                messages = self._refreeze(transformed)
+            total_token_count = self._estimate_total(len(messages))
+            if total_token_count <= self.max_tokens:
+                print(f"  - [{self.agent_name}] 已换入后台预压缩摘要，当前 token 数: {total_token_count}")
+                compressed_result = self._build_view(messages)
+                with tracer.start_as_current_span("llm_context_compression") as span:
+                    span.set_attribute("messages.original_count", len(messages))
+                    span.set_attribute("messages.original_tokens", original_tokens)
+                    span.set_attribute("compression.precomputed", True)
+                    self._set_result_attributes(span, original_tokens, compressed_result)
+                return compressed_result
+        
+        # 3. 同步压缩
+        # 需要压缩，计算需要压缩的消息范围
+        if len(messages) <= self.recent_rounds:
+            # 消息数量不足，无法压缩（需要保留所有消息）
+            return self._build_view(messages)
+        
+        use_cache = self._compression_cache["compressed_message"] is not None
+        
+        # 开始压缩span
+        with tracer.start_as_current_span("llm_context_compression") as span:
+            # 添加压缩前的属性
+            span.set_attribute("messages.original_count", len(messages))
+            span.set_attribute("messages.original_tokens", original_tokens)
+            span.set_attribute("compression.schema_tokens", self.schema_tokens)
+            span.set_attribute("compression.max_tokens", self.max_tokens)
+            span.set_attribute("compression.recent_rounds", self.recent_rounds)
+            span.set_attribute("compression.target_token", self._compress_target())
+            span.set_attribute("compression.strategy", self.summary_strategy)
+            span.set_attribute("compression.use_cache", use_cache)
+            span.set_attribute("compression.precomputed", False)
             
-            # 计算最近消息的范围
-            recent_start_index = len(messages) - self.recent_rounds
+            # 计算压缩消息和最近消息的范围
+            recent_start_index = self._find_recent_start_index(messages)
             
-            # 优化：确保不会因为压缩而切断 assistant.tool_calls 和 tool 结果的关联
-            # 如果起始消息是 tool，我们必须向前追溯到起始的 assistant 消息
-            while recent_start_index > self.keep_first_n and messages[recent_start_index].get("role") == "tool":
-                recent_start_index -= 1
-
             # 只显示消息的角色和内容前50个字符，避免输出过长
-            # msg = messages[recent_start_index]
-            # msg_content = msg.get("content", "")[:50] + "..." if len(msg.get("content", "")) > 50 else msg.get("content", "")
-            # print(f"messageCount: {len(messages)}, recent_start_index: {recent_start_index}, recent_start_msg: {{'role': '{msg.get('role')}', 'content': '{msg_content}'}}")
-            
-            recent_messages = messages[recent_start_index:]
-            recent_token_count = self._count_total_tokens(recent_messages)
-            
-            # 总 token 数 = 压缩消息的 token 数 + 未压缩消息的 token 数 + 最近几轮消息的 token 数
-            total_token_count = self._compression_cache["compressed_token_count"] + uncompressed_token_count + recent_token_count
+            msg = messages[recent_start_index]
+            msg_content = msg.get("content") or ""
+            msg_content = msg_content[:50] + "..." if len(msg_content) > 50 else msg_content
+            print(f"messageCount: {len(messages)}, recent_start_index: {recent_start_index}, recent_start_msg: {{'role': '{msg.get('role')}', 'content': '{msg_content}'}}")
             
-            # 如果总 token 数未超过阈值，直接返回原始消息
-            if total_token_count <= self.max_tokens:
-                print(f"  - [{self.agent_name}] 当前 token 数: {total_token_count} (阈值: {self.max_tokens}) -> 跳过压缩")
-                return messages
-            
-            print(f"  - [{self.agent_name}] 当前 token 数: {total_token_count} (阈值: {self.max_tokens}) -> 触发压缩!")
-            
-            # 需要压缩，计算需要压缩的消息范围
-            # 新的需要压缩的消息是从上次压缩的位置到最新消息中除了最近几轮的部分
-            messages_to_compress = messages[uncompressed_start_index:recent_start_index]
-
+            # 考虑keep_first_n参数，只压缩keep_first_n之后、且尚未被摘要覆盖的消息
+            # 待压缩的文本取预处理变换后的最新结果，冻结的原文可能更长
+            messages_to_compress = transformed[self._uncompressed_start_index():recent_start_index]
             if not messages_to_compress or recent_start_index <=1:
                 print(f"compress failed, no message to compress, recent_start_index:{recent_start_index}")
-                return messages
-            else: 
-                # 获取tracer
-                tracer = trace.get_tracer(__name__)
-                
-                # 开始压缩span
-                with tracer.start_as_current_span("llm_context_compression") as span:
-                    # 添加压缩前的属性
-                    span.set_attribute("messages.original_count", len(messages))
-                    span.set_attribute("messages.original_tokens", self._count_total_tokens(messages))
-                    span.set_attribute("compression.max_tokens", self.max_tokens)
-                    span.set_attribute("compression.recent_rounds", self.recent_rounds)
-                    span.set_attribute("compression.target_token", self.target_token)
-                    span.set_attribute("compression.use_cache", True)
-                    
-                    # 先将缓存中的压缩消息转换为可读文本
-                    compressed_content = self._compression_cache["compressed_message"].get("content", "")
-                    # 移除可能的标记
-                    if "### [历史对话模拟摘要]" in compressed_content:
-                        compressed_content = compressed_content.replace("### [历史对话模拟摘要]\n", "")
-                    elif "[历史对话摘要]: " in compressed_content:
-                        compressed_content = compressed_content.replace("[历史对话摘要]: ", "")
-                    
-                    # 构建需要再次压缩的文本
-                    text_to_compress = compressed_content + "\n"
-                    text_to_compress += "\n".join([
-                        f"[{msg.get('role', 'unknown')}]: {msg.get('content', '')}"
-                        for msg in messages_to_compress
-                    ])
-                    
-                    # 调用 LLM 压缩
-                    compressed_text = self.llm_compressor.compress(
-                        text=text_to_compress,
-                        target_token=self.target_token,
-                        compression_prompt=self.compression_prompt
-                    )
-                    
-                    # 更新缓存
-                    self._compression_cache["compressed_message"] = {
-                        "role": "user",
-                        "content": f"### [历史对话模拟摘要]\n{compressed_text}",
-                        "name": "compressed_history"
-                    }
-                    # 使用调整后的索引更新缓存
-                    self._compression_cache["compressed_up_to_index"] = recent_start_index
-                    self._compression_cache["compressed_token_count"] = self._count_tokens(
-                        self._compression_cache["compressed_message"]
-                    )
-                    
-                    # 构建最终的消息列表（使用已经计算好的recent_start_index）
-                    recent_messages = messages[recent_start_index:]
-                    # 确保包含最前面的keep_first_n条消息
-                    keep_first_messages = messages[:self.keep_first_n]
-                    compressed_result = keep_first_messages + [self._compression_cache["compressed_message"]] + recent_messages
-                    
-                    # 添加压缩后的属性
-                    span.set_attribute("messages.compressed_count", len(compressed_result))
-                    span.set_attribute("messages.compressed_tokens", self._count_total_tokens(compressed_result))
-                    span.set_attribute("compression.saved_tokens", self._count_total_tokens(messages) - self._count_total_tokens(compressed_result))
-                    span.set_attribute("compression.compressed", True)
-                    span.set_attribute("compression.compression_ratio", 
-                                      ((self._count_total_tokens(messages) - self._count_total_tokens(compressed_result)) / 
-                                       self._count_total_tokens(messages)) * 100 if self._count_total_tokens(messages) > 0 else 0)
-                    
-                    return compressed_result
-        else:
-            # 没有缓存，计算所有消息的 token 数
-            total_token_count = self._count_total_tokens(messages)
+                return self._build_view(messages)
             
-            # 如果总 token 数未超过阈值，直接返回原始消息
-            if total_token_count <= self.max_tokens:
-                print(f"  - [{self.agent_name}] 当前 token 数: {total_token_count} (阈值: {self.max_tokens}) -> 跳过压缩")
-                return messages
+            # 调用 LLM 压缩
+            compressed_text = self.llm_compressor.compress(
+                text=self._build_compress_text(messages_to_compress),
+                target_token=self._compress_target(),
+                compression_prompt=self.compression_prompt
+            )
             
-            print(f"  - [{self.agent_name}] 当前 token 数: {total_token_count} (阈值: {self.max_tokens}) -> 触发压缩!")
+            # 更新缓存
+            self._update_cache(compressed_text, recent_start_index)
+            if self.summary_strategy == "append":
+                messages = self._refreeze(transformed)
             
-            # 需要压缩，计算需要压缩的消息范围
-            if len(messages) <= self.recent_rounds:
-                # 消息数量不足，无法压缩（需要保留所有消息）
-                return messages
+            # 构建最终的消息列表，包含最前面的keep_first_n条消息
+            compressed_result = self._build_view(messages)
             
-            # 获取tracer
-            tracer = trace.get_tracer(__name__)
+            # 添加压缩后的属性
+            span.set_attribute("compression.summary_levels", len(self._segment_levels))
+            self._set_result_attributes(span, original_tokens, compressed_result)
             
-            # 开始压缩span
-            with tracer.start_as_current_span("llm_context_compression") as span:
-                # 添加压缩前的属性
-                span.set_attribute("messages.original_count", len(messages))
-                span.set_attribute("messages.original_tokens", self._count_total_tokens(messages))
-                span.set_attribute("compression.max_tokens", self.max_tokens)
-                span.set_attribute("compression.recent_rounds", self.recent_rounds)
-                span.set_attribute("compression.target_token", self.target_token)
-                span.set_attribute("compression.use_cache", False)
-                
-                # 计算压缩消息和最近消息的范围
-                recent_start_index = len(messages) - self.recent_rounds
-                
-                # 优化：确保不会因为压缩而切断 assistant.tool_calls 和 tool 结果的关联
-                # 如果起始消息是 tool，我们必须向前追溯到起始的 assistant 消息
-                while recent_start_index > self.keep_first_n and messages[recent_start_index].get("role") == "tool":
-                    recent_start_index -= 1
-                
-                # 只显示消息的角色和内容前50个字符，避免输出过长
-                msg = messages[recent_start_index]
-                msg_content = msg.get("content", "")[:50] + "..." if len(msg.get("content", "")) > 50 else msg.get("content", "")
-                print(f"messageCount: {len(messages)}, recent_start_index: {recent_start_index}, recent_start_msg: {{'role': '{msg.get('role')}', 'content': '{msg_content}'}}")
-                
-                # 考虑keep_first_n参数，只压缩keep_first_n之后的消息
-                messages_to_compress = messages[self.keep_first_n:recent_start_index]
-                if not messages_to_compress or recent_start_index <=1:
-                    print(f"compress failed, no message to compress, recent_start_index:{recent_start_index}")
-                    return messages
-                recent_messages = messages[recent_start_index:]
-                
-                # 构建需要压缩的文本
-                text_to_compress = "\n".join([
-                    f"[{msg.get('role', 'unknown')}]: {msg.get('content', '')}"
-                    for msg in messages_to_compress
-                ])
-                
-                # 调用 LLM 压缩
-                compressed_text = self.llm_compressor.compress(
-                    text=text_to_compress,
-                    target_token=self.target_token,
-                    compression_prompt=self.compression_prompt
-                )
-                
-                # 创建压缩后的消息
-                compressed_message = {
-                    "role": "user",
-                    "content": f"### [历史对话模拟摘要]\n{compressed_text}",
-                    "name": "compressed_history"
-                }
-
-                # 更新缓存
-                self._compression_cache["compressed_message"] = compressed_message
-                self._compression_cache["compressed_up_to_index"] = recent_start_index
-                self._compression_cache["compressed_token_count"] = self._count_tokens(compressed_message)
-                
-                # 构建最终的消息列表，包含最前面的keep_first_n条消息
-                keep_first_messages = messages[:self.keep_first_n]
-                compressed_result = keep_first_messages + [compressed_message] + recent_messages
-                
-                # 添加压缩后的属性
-                span.set_attribute("messages.compressed_count", len(compressed_result))
-                span.set_attribute("messages.compressed_tokens", self._count_total_tokens(compressed_result))
-                span.set_attribute("compression.saved_tokens", self._count_total_tokens(messages) - self._count_total_tokens(compressed_result))
-                span.set_attribute("compression.compressed", True)
-                span.set_attribute("compression.compression_ratio", 
-                                  ((self._count_total_tokens(messages) - self._count_total_tokens(compressed_result)) / 
-                                   self._count_total_tokens(messages)) * 100 if self._count_total_tokens(messages) > 0 else 0)
-                
-                return compressed_result
-        
-        # 默认返回原始消息
-        return messages
+            return compressed_result
 
     def get_logs(
         self, pre_transform_messages: list[dict[str, Any]], post_transform_messages: list[dict[str, Any]]
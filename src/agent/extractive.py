@@ -0,0 +1,174 @@
+import re
+from typing import List
+
+import numpy as np
+
+from src.agent.tokenizer import HeuristicTokenizer
+
+# 英文标识符 / 数字 / 连续中文
+_TERM_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]+|\d+|[\u4e00-\u9fff]+")
+_SENTENCE_SPLIT = re.compile(r"(?<=[。！？；.!?;])\s+|(?<=[。！？；])")
+# 错误信号：这类行通常是后续排查所需的关键信息
+_ERROR_PATTERN = re.compile(
+    r"(error|exception|traceback|failed|failure|assert|fatal|warning|错误|失败|异常|报错|警告|退出码)",
+    re.IGNORECASE,
+)
+# 调用栈中的帧：信息量低，保留异常行即可
+_FRAME_PATTERN = re.compile(r"^\s*(File \".*\", line \d+|at \S)")
+# 用户 / Architect 的指令
+_INSTRUCTION_PATTERN = re.compile(r"^\[(user|system)\]:|TODO:")
+
+
+def _split_units(text: str, max_unit_chars: int = 400) -> List[str]:
+    """按行切分，过长的行再按句子切分，便于细粒度取舍。"""
+    units = []
+    for line in text.split("\n"):
+        line = line.rstrip()
+        if not line.strip():
+            continue
+        if len(line) <= max_unit_chars:
+            units.append(line)
+            continue
+        current = ""
+        for sentence in _SENTENCE_SPLIT.split(line):
+            if current and len(current) + len(sentence) > max_unit_chars:
+                units.append(current)
+                current = ""
+            current += sentence
+            while len(current) > max_unit_chars:
+                units.append(current[:max_unit_chars])
+                current = current[max_unit_chars:]
+        if current.strip():
+            units.append(current)
+    return units
+
+
+def _terms(unit: str) -> set:
+    terms = set()
+    for token in _TERM_PATTERN.findall(unit.lower()):
+        if "\u4e00" <= token[0] <= "\u9fff":
+            # 中文没有分词，使用二元组
+            terms.update(token[i:i + 2] for i in range(max(1, len(token) - 1)))
+        else:
+            terms.add(token)
+    return terms
+
+
+def score_units(units: List[str]) -> np.ndarray:
+    """
+    为每个片段打分：TF-IDF 显著性 × 时间权重 × 信号权重。
+    - 显著性：片段内词项 IDF 之和，按长度开方归一化
+    - 时间权重：越靠后的片段权重越高（0.5 ~ 1.5）
+    - 信号权重：错误/异常行加分，指令行加分，调用栈帧降权；重复的片段只保留最后一次
+    """
+    n = len(units)
+    if n == 0:
+        return np.zeros(0)
+
+    vocab = {}
+    term_ids, unit_ids = [], []
+    for i, unit in enumerate(units):
+        for term in _terms(unit):
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            unit_ids.append(i)
+
+    if term_ids:
+        term_ids = np.asarray(term_ids)
+        unit_ids = np.asarray(unit_ids)
+        df = np.bincount(term_ids, minlength=len(vocab))
+        idf = np.log((1 + n) / (1 + df)) + 1.0
+        sums = np.bincount(unit_ids, weights=idf[term_ids], minlength=n)
+        counts = np.bincount(unit_ids, minlength=n)
+        salience = sums / np.sqrt(np.maximum(counts, 1))
+        salience = salience / salience.max() if salience.max() > 0 else salience
+    else:
+        salience = np.ones(n)
+
+    recency = 0.5 + np.arange(n) / max(n - 1, 1)
+
+    signal = np.ones(n)
+    seen = set()
+    for i in range(n - 1, -1, -1):
+        unit = units[i]
+        key = unit.strip()
+        if key in seen:
+            signal[i] = 0.0
+            continue
+        seen.add(key)
+        if _FRAME_PATTERN.match(unit):
+            signal[i] = 0.3
+        elif _ERROR_PATTERN.search(unit):
+            signal[i] = 2.0
+        if _INSTRUCTION_PATTERN.search(unit):
+            signal[i] += 0.5
+
+    return (salience + 0.1) * recency * signal
+
+
+class ExtractiveCompressor:
+    """
+    本地抽取式压缩器，不调用 LLM，毫秒级完成。
+    与 LLMTextCompressor 接口一致，可作为主压缩器、LLM 压缩的前置过滤，或 LLM 失败时的兜底。
+    """
+
+    def __init__(self, tokenizer=None, max_unit_chars: int = 400):
+        self.tokenizer = tokenizer or HeuristicTokenizer()
+        self.max_unit_chars = max_unit_chars
+
+    def compress(self, text, **kwargs):
+        """
+        在 target_token 预算内保留得分最高的片段，并按原顺序输出。
+
+        Args:
+            text: 要压缩的文本内容
+            **kwargs: 额外的压缩参数，如 target_token（compression_prompt 会被忽略）
+
+        Returns:
+            压缩后的文本内容
+        """
+        target_token = kwargs.get("target_token", 500)
+        if self.tokenizer.count(text) <= target_token:
+            return text
+
+        units = _split_units(text, self.max_unit_chars)
+        scores = score_units(units)
+        # 每个入选片段前后最多多出一个省略标记，计入其成本
+        marker_cost = self.tokenizer.count("...（省略 100 个片段）") + 1
+        costs = [self.tokenizer.count(unit) + 1 + marker_cost for unit in units]
+        budget = target_token - self.tokenizer.count(f"[本地抽取式摘要：保留 {len(units)}/{len(units)} 个片段]")
+
+        selected, used = [], 0
+        for i in np.argsort(-scores, kind="stable"):
+            if scores[i] <= 0:
+                break
+            if used + costs[i] > budget:
+                continue
+            selected.append(int(i))
+            used += costs[i]
+        selected.sort()
+
+        lines = [f"[本地抽取式摘要：保留 {len(selected)}/{len(units)} 个片段]"]
+        previous = -1
+        for i in selected:
+            if i - previous > 1:
+                lines.append(f"...（省略 {i - previous - 1} 个片段）")
+            lines.append(units[i])
+            previous = i
+        if previous < len(units) - 1:
+            lines.append(f"...（省略 {len(units) - 1 - previous} 个片段）")
+        return "\n".join(lines)
+
+
+class HybridTextCompressor:
+    """两阶段压缩：先用抽取式压缩把输入缩小到 prefilter_ratio 倍目标大小，再交给 LLM 精炼。"""
+
+    def __init__(self, llm_compressor, extractive_compressor=None, prefilter_ratio: int = 4):
+        self.llm_compressor = llm_compressor
+        self.extractive_compressor = extractive_compressor or ExtractiveCompressor()
+        self.prefilter_ratio = prefilter_ratio
+
+    def compress(self, text, **kwargs):
+        target_token = kwargs.get("target_token", 500)
+        prefilter_target = target_token * self.prefilter_ratio
+        text = self.extractive_compressor.compress(text, target_token=prefilter_target)
+        return self.llm_compressor.compress(text, **kwargs)
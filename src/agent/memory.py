@@ -2,9 +2,9 @@ import os
 import threading
 import json
 from typing import List, Dict, Any
-from openai import OpenAI
 from opentelemetry import trace
 from rich.console import Console
+from src.llm_clients import chat_completion, get_openai_client
 
 console = Console()
 tracer = trace.get_tracer(__name__)
@@ -95,14 +95,16 @@ def _perform_memory_update(project_root: str, chat_history: List[Dict]):
                     conversation_text += f"[{role}]: {content}\n\n"
 
             # 2. Call LLM
-            client = OpenAI(api_key=api_key, base_url=base_url)
+            client = get_openai_client(api_key=api_key, base_url=base_url)
             
             messages = [
                 {"role": "system", "content": SUMMARY_PROMPT},
                 {"role": "user", "content": f"### CURRENT SUMMARY:\n{existing_summary}\n\n### RECENT CONVERSATION:\n{conversation_text}"}
             ]
 
-            response = client.chat.completions.create(
+            response = chat_completion(
+                client,
+                "project_memory",
                 model=model_id,
                 messages=messages,
                 temperature=0.1 # Low temperature for consistent documentation
@@ -4,7 +4,9 @@ from src.tools.shell_tools import get_shell_tools
 from src.tools.git_tools import get_git_tools
 from autogen.agentchat.contrib.capabilities.transforms import TextMessageCompressor, MessageTransform
 from autogen.agentchat.contrib.capabilities import transform_messages
-from src.agent.compress import LLMTextCompressor, LLMMessagesCompressor
+from src.agent.compress import LLMTextCompressor, LLMMessagesCompressor, track_conversation_partner
+from src.agent.overflow import enable_overflow_recovery
+from src.agent.transforms import SupersessionPruner, ToolOutputElider
 import copy
 import os
 import config
@@ -46,6 +48,8 @@ def setup_orchestration(architect, coder,  tester,  user_proxy,manager_config):
         trigger=task_trigger_condition
     )
 
+    speculative = os.getenv("COMPRESS_SPECULATIVE", "true").lower() == "true"
+    summary_strategy = os.getenv("COMPRESS_SUMMARY_STRATEGY", "hierarchical")
     compressor = LLMMessagesCompressor(
         llm_config=manager_config,
         max_tokens=int(os.getenv("COMPRESS_MAX_TOKENS_IMPLEMENTATION", "10000")),  
@@ -55,7 +59,11 @@ def setup_orchestration(architect, coder,  tester,  user_proxy,manager_config):
         你是一个专业的大模型对话压缩专家, 下面是 coder, tester 两个角色的对话。请将以下对话压缩到约 {target_token} 个token.
         请以**对话摘要**的形式进行总结，保留核心信息、关键细节和重要结论。格式要求如下：\n- User: [用户的主要需求及最新指令]\n- Assistant: [Agent 的核心进展、已执行的关键操作及目前状态]\n对于已完成的任务，请简要概括；对于未解决的错误，请详细说明其行为和报错信息。不要包含具体的工具调用明细或代码段。
         """,
-        target_token=2000  # 压缩目标 token 数
+        target_token=2000,  # 压缩目标 token 数
+        tool_schemas=(coder.llm_config or {}).get("tools"),  # 工具 schema 每轮都会随请求发送
+        speculative=speculative,  # 后台预压缩，避免压缩阻塞 Agent 回复
+        summary_strategy=summary_strategy,  # 分层摘要，每段历史只摘要一次
+        compressor_mode=os.getenv("COMPRESS_MODE_IMPLEMENTATION", "llm")  # llm / extractive / hybrid
     )
     compressor.agent_name = "ImplementationGroup"
 
@@ -67,16 +75,31 @@ def setup_orchestration(architect, coder,  tester,  user_proxy,manager_config):
         compression_prompt="""你是一个专业的大模型对话压缩专家, 下面是 architect 正在调研项目或者是正在推进开发计划。请将以下对话压缩到约 {target_token} 个token。
         请简要介绍当前的工作内容及最新进度，**重点关注任务进度而非具体文件细节**。要求：以对话摘要的形式呈现，清晰说明目前完成了什么，下一步计划是什么。不要包含具体的代码内容。
         """,
-        target_token=2000  # 压缩目标 token 数
+        target_token=2000,  # 压缩目标 token 数
+        tool_schemas=(architect.llm_config or {}).get("tools"),
+        speculative=speculative,
+        summary_strategy=summary_strategy
     )
     architectCompressor.agent_name = "Architect"
 
+    # 在 LLM 压缩之前，先用过期观察剔除与工具输出截断做确定性的精简（无需网络调用）
+    tool_output_max_chars = int(os.getenv("COMPRESS_TOOL_OUTPUT_MAX_CHARS", "2000"))
+    elider = ToolOutputElider(keep_recent=3, max_chars=tool_output_max_chars)
+    architect_elider = ToolOutputElider(keep_recent=3, max_chars=tool_output_max_chars)
+
     # 包装并注入 Agent
-    context_handler = transform_messages.TransformMessages(transforms=[compressor])
+    # 压缩器被多个 agent 共享，记录每次回复的对话方，使压缩状态按 (agent, 对话方, 对话) 分别保存
+    for agent in (implementation_manager, coder, tester, architect):
+        track_conversation_partner(agent)
+    # token 估算偏低时模型仍可能拒绝请求：紧急压缩后自动重试，而不是让整个对话失败
+    overflow_retries = int(os.getenv("COMPRESS_OVERFLOW_RETRIES", "3"))
+    for agent in (coder, tester, architect):
+        enable_overflow_recovery(agent, max_attempts=overflow_retries)
+    context_handler = transform_messages.TransformMessages(transforms=[SupersessionPruner(), elider, compressor])
     context_handler.add_to_agent(implementation_manager)
     context_handler.add_to_agent(coder)
     context_handler.add_to_agent(tester)
-    architect_context_handler = transform_messages.TransformMessages(transforms=[architectCompressor])
+    architect_context_handler = transform_messages.TransformMessages(transforms=[SupersessionPruner(), architect_elider, architectCompressor])
     architect_context_handler.add_to_agent(architect)
 
     return architect
@@ -0,0 +1,147 @@
+import re
+import json
+import logging
+from typing import Any, Dict, List
+
+from opentelemetry import metrics, trace
+
+from src.agent.extractive import ExtractiveCompressor
+from src.agent.tokenizer import HeuristicTokenizer, count_message_tokens
+from src.agent.transforms import SupersessionPruner, ToolOutputElider
+from src.tools.read_cache import conversation_id, read_cache
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+overflow_counter = meter.create_counter(
+    "agent.context_overflow",
+    description="模型因上下文超长拒绝请求的次数，按 agent 与处理结果（recovered / failed）区分",
+)
+
+# 上下文溢出统计（进程内累计）
+overflow_stats = {"overflows": 0, "recovered": 0, "failed": 0}
+
+# OpenAI、DashScope 等兼容接口在上下文超长时返回的错误
+_OVERFLOW_CODES = ("context_length_exceeded", "string_above_max_length")
+_OVERFLOW_PATTERN = re.compile(
+    r"context[ _]length|maximum context|context window|too many tokens|prompt is too long|"
+    r"input (is )?too long|range of input length|reduce the length|上下文长度|超出.{0,10}长度",
+    re.IGNORECASE,
+)
+
+
+def is_context_overflow(error: Exception) -> bool:
+    """判断异常是否为上下文超长导致的请求失败。"""
+    code = getattr(error, "code", None)
+    body = getattr(error, "body", None)
+    if code is None and isinstance(body, dict):
+        code = body.get("code") or (body.get("error") or {}).get("code")
+    if code in _OVERFLOW_CODES:
+        return True
+    return bool(_OVERFLOW_PATTERN.search(str(error)))
+
+
+def _render_message(message: Dict[str, Any]) -> str:
+    parts = []
+    content = message.get("content")
+    if content:
+        parts.append(content if isinstance(content, str) else json.dumps(content, ensure_ascii=False))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        parts.append(f"调用 {function.get('name')}({function.get('arguments')})")
+    return f"[{message.get('name') or message.get('role', 'unknown')}]: " + "\n".join(parts)
+
+
+def _tail_start(messages: List[Dict[str, Any]], head: int, keep_tail: int) -> int:
+    """尾部保留的起始位置，不切断 assistant.tool_calls 与 tool 结果的关联。"""
+    start = max(head, len(messages) - keep_tail)
+    while start > head and messages[start].get("role") == "tool":
+        start -= 1
+    return start
+
+
+def emergency_compress(messages: List[Dict[str, Any]], attempt: int, tokenizer=None) -> List[Dict[str, Any]]:
+    """
+    对即将发送给模型的消息列表做激进的本地压缩，不调用任何模型：
+    - 第 1 次：剔除过期的工具输出，除最近一条外的工具输出都截断到很短
+    - 第 2 次起：所有工具输出都截断，中间的历史用抽取式压缩合并为一条摘要，尾部保留的消息逐次减少
+    开头的 system 消息与第一条任务消息始终保留。
+    """
+    tokenizer = tokenizer or HeuristicTokenizer()
+    elider = ToolOutputElider(
+        keep_recent=1 if attempt <= 1 else 0,
+        max_chars=max(300, 1200 // attempt),
+        head_lines=15,
+        tail_lines=10,
+        keep_frames=2,
+    )
+    result = elider.apply_transform(SupersessionPruner(keep_recent=0).apply_transform(messages))
+    if attempt <= 1:
+        return result
+
+    head = 0
+    while head < len(result) and result[head].get("role") == "system":
+        head += 1
+    head = min(head + 1, len(result))  # 第一条任务消息
+    tail = _tail_start(result, head, max(2, 8 // attempt))
+    middle = result[head:tail]
+    if not middle:
+        return result
+
+    middle_tokens = sum(count_message_tokens(msg, tokenizer) for msg in middle)
+    target_token = max(200, min(2000, middle_tokens // 4) // (attempt - 1))
+    text = "\n".join(_render_message(msg) for msg in middle)
+    summary = ExtractiveCompressor(tokenizer=tokenizer).compress(text, target_token=target_token)
+    summary_message = {
+        "role": "user",
+        "content": f"### [上下文超长，第 {head + 1}-{tail} 条消息已紧急压缩]\n{summary}",
+    }
+    return result[:head] + [summary_message] + result[tail:]
+
+
+def enable_overflow_recovery(agent, max_attempts: int = 3, tokenizer=None):
+    """
+    包装 agent._generate_oai_reply_from_client：模型因上下文超长拒绝请求时，
+    对消息列表做紧急压缩后透明重试，最多 max_attempts 次，避免整个 initiate_chat 失败、任务进度丢失。
+    """
+    original_generate = agent._generate_oai_reply_from_client
+
+    def generate(llm_client, messages, cache, **kwargs):
+        try:
+            return original_generate(llm_client, messages, cache, **kwargs)
+        except Exception as e:
+            if not is_context_overflow(e):
+                raise
+            error = e
+
+        overflow_stats["overflows"] += 1
+        # 紧急压缩会截断或丢弃之前的工具输出，该对话的读取记录全部作废
+        read_cache.invalidate(conversation_id(messages))
+        with tracer.start_as_current_span("context_overflow_recovery") as span:
+            span.set_attribute("agent.name", agent.name)
+            span.set_attribute("overflow.error", str(error))
+            span.set_attribute("overflow.original_messages", len(messages))
+            for attempt in range(1, max_attempts + 1):
+                compressed = emergency_compress(messages, attempt, tokenizer)
+                logger.warning(f"{agent.name} 上下文超长，第 {attempt} 次紧急压缩后重试（{len(messages)} -> {len(compressed)} 条消息）")
+                try:
+                    reply = original_generate(llm_client, compressed, cache, **kwargs)
+                except Exception as e:
+                    if not is_context_overflow(e):
+                        raise
+                    error = e
+                    continue
+                overflow_stats["recovered"] += 1
+                overflow_counter.add(1, {"agent": agent.name, "outcome": "recovered"})
+                span.set_attribute("overflow.attempts", attempt)
+                span.set_attribute("overflow.recovered", True)
+                return reply
+
+            overflow_stats["failed"] += 1
+            overflow_counter.add(1, {"agent": agent.name, "outcome": "failed"})
+            span.set_attribute("overflow.attempts", max_attempts)
+            span.set_attribute("overflow.recovered", False)
+            raise error
+
+    agent._generate_oai_reply_from_client = generate
+    return agent
@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# CJK 统一表意文字、假名、韩文及全角标点
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+class HeuristicTokenizer:
+    """
+    无依赖的本地估算：
+    - 中日韩字符按 1 字 ≈ 1 token 计算（原先的 字符数 // 3 会把中文低估约 3 倍）
+    - 其余字符沿用 字符数 // 3 的估算
+    """
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk + (len(text) - cjk) // 3
+
+
+class TiktokenTokenizer:
+    """基于 tiktoken 的 BPE 计数，比启发式估算更接近真实计费。"""
+    name = "tiktoken"
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+def get_tokenizer(name: Optional[str] = None):
+    """
+    按名称创建 tokenizer，默认读取 COMPRESS_TOKENIZER 环境变量。
+    - heuristic: 本地启发式估算（默认）
+    - tiktoken: 使用 tiktoken，不可用时回退到 heuristic
+    """
+    name = (name or os.getenv("COMPRESS_TOKENIZER", "heuristic")).lower()
+    if name == "tiktoken":
+        try:
+            return TiktokenTokenizer(os.getenv("COMPRESS_TIKTOKEN_ENCODING", "cl100k_base"))
+        except Exception as e:
+            logger.warning(f"加载 tiktoken 失败，回退到启发式估算: {e}")
+    return HeuristicTokenizer()
+
+
+def _content_text(content: Any) -> str:
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # 多模态消息：只统计文本部分
+        return "\n".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return str(content)
+
+
+def count_message_tokens(message: Dict[str, Any], tokenizer) -> int:
+    """统计单条消息的 token 数，包括正文、tool_calls 的函数名与参数以及旧版 function_call。"""
+    total = tokenizer.count(_content_text(message.get("content")))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        total += tokenizer.count(function.get("name") or "")
+        total += tokenizer.count(function.get("arguments") or "")
+    function_call = message.get("function_call")
+    if function_call:
+        total += tokenizer.count(function_call.get("name") or "")
+        total += tokenizer.count(function_call.get("arguments") or "")
+    return total
+
+
+def count_tools_tokens(tools: Optional[List[Dict[str, Any]]], tokenizer) -> int:
+    """统计 function/tool schema 的 token 数，它们每轮都会随请求发送。"""
+    if not tools:
+        return 0
+    return tokenizer.count(json.dumps(tools, ensure_ascii=False))
+
+
+def message_key(message: Dict[str, Any]) -> tuple:
+    """
+    为消息生成缓存键。
+    TransformMessages 每轮都会 deepcopy 消息列表，但 deepcopy 不会复制 str 对象，
+    因此以内容字符串本身作为键，哈希值只在首次计算，后续查找是 O(1)。
+    """
+    content = message.get("content")
+    if content is not None and not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    tool_calls = tuple(
+        (tc.get("id"), (tc.get("function") or {}).get("name"), (tc.get("function") or {}).get("arguments"))
+        for tc in message.get("tool_calls") or []
+    )
+    return (message.get("role"), message.get("name"), message.get("tool_call_id"), content, tool_calls)
+
+
+class MessageTokenCache:
+    """按消息内容缓存 token 数，容量有限，超出后淘汰最早的条目。"""
+
+    def __init__(self, tokenizer, max_entries: int = 20000):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self._cache: Dict[tuple, int] = {}
+
+    def count(self, message: Dict[str, Any], key: Optional[tuple] = None) -> int:
+        key = key if key is not None else message_key(message)
+        tokens = self._cache.get(key)
+        if tokens is None:
+            tokens = count_message_tokens(message, self.tokenizer)
+            if len(self._cache) >= self.max_entries:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = tokens
+        return tokens
+
+
+class TokenLedger:
+    """
+    维护一个消息列表的前缀和。
+    对话历史基本只追加，因此每轮只需对新增消息计数，任意区间的 token 数都是 O(1)。
+    """
+
+    def __init__(self, cache: MessageTokenCache):
+        self.cache = cache
+        self._keys: List[tuple] = []
+        self._prefix: List[int] = [0]
+
+    def sync(self, messages: List[Dict[str, Any]]) -> None:
+        keys = [message_key(msg) for msg in messages]
+        # 找到与上一轮第一个不同的位置，只重算之后的部分
+        common = 0
+        limit = min(len(keys), len(self._keys))
+        while common < limit and keys[common] == self._keys[common]:
+            common += 1
+        del self._prefix[common + 1:]
+        for i in range(common, len(messages)):
+            self._prefix.append(self._prefix[-1] + self.cache.count(messages[i], keys[i]))
+        self._keys = keys
+
+    def range(self, start: int, end: int) -> int:
+        start = max(0, min(start, len(self._keys)))
+        end = max(start, min(end, len(self._keys)))
+        return self._prefix[end] - self._prefix[start]
+
+    def keys(self, start: int, end: int) -> tuple:
+        """返回区间内消息的缓存键，用于判断一段历史是否被改写。"""
+        return tuple(self._keys[start:end])
+
+    @property
+    def total(self) -> int:
+        return self._prefix[-1]
+
+    @property
+    def size(self) -> int:
+        return len(self._keys)
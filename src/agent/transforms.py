@@ -0,0 +1,438 @@
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from autogen.agentchat.contrib.capabilities.transforms import MessageTransform
+
+from src.tools.read_cache import is_partial_read
+
+# ANSI 转义序列（颜色、光标移动等）
+_ANSI_PATTERN = re.compile(r"\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b[()][0-9A-Za-z]|\x1b[=>]")
+# 常见的进度条输出：tqdm、pip/npm 下载进度、[#####    ] 45% 之类
+_PROGRESS_PATTERNS = (
+    re.compile(r"^\s*\d{1,3}%\|"),
+    re.compile(r"^\s*[\[(]?[#=>\-.\s█▏▎▍▌▋▊▉]{10,}[\])]?\s*\d{1,3}(\.\d+)?%"),
+    re.compile(r"^\s*(Downloading|Progress|Receiving objects|Resolving deltas|Compressing objects)\b.*\d{1,3}%"),
+)
+_PY_TRACEBACK = "Traceback (most recent call last):"
+_PY_FRAME = re.compile(r"^\s*File \".*\", line \d+")
+_AT_FRAME = re.compile(r"^\s+at \S")
+
+
+def strip_terminal_noise(text: str) -> str:
+    """去掉 ANSI 转义、被 \\r 覆盖的进度刷新以及进度条行，并合并连续重复的行。"""
+    text = _ANSI_PATTERN.sub("", text).replace("\r\n", "\n")
+    lines = []
+    repeat = 0
+    for line in text.split("\n"):
+        # 终端中 \r 之前的内容会被覆盖，只保留最后一次刷新
+        if "\r" in line:
+            line = line.rstrip("\r").rsplit("\r", 1)[-1]
+        if any(pattern.search(line) for pattern in _PROGRESS_PATTERNS):
+            continue
+        if lines and line == lines[-1] and line.strip():
+            repeat += 1
+            continue
+        if repeat:
+            lines.append(f"... (上一行重复 {repeat} 次)")
+            repeat = 0
+        lines.append(line)
+    if repeat:
+        lines.append(f"... (上一行重复 {repeat} 次)")
+    return "\n".join(lines)
+
+
+def _collapse_frames(frames: List[List[str]], keep_frames: int) -> List[str]:
+    if len(frames) <= keep_frames + 1:
+        return [line for frame in frames for line in frame]
+    omitted = len(frames) - keep_frames - 1
+    kept = frames[:1] + [[f"  ... (省略 {omitted} 层调用栈) ..."]] + frames[-keep_frames:]
+    return [line for frame in kept for line in frame]
+
+
+def collapse_stack_traces(text: str, keep_frames: int = 3) -> str:
+    """
+    折叠过长的调用栈：保留最外层的一帧和最内层的 keep_frames 帧。
+    支持 Python 的 Traceback 以及 Java/JS 风格的 "at ..." 调用栈。
+    """
+    lines = text.split("\n")
+    result = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.strip() == _PY_TRACEBACK:
+            result.append(line)
+            i += 1
+            frames = []
+            # 每一帧由 File 行和其后缩进更深的代码行组成
+            while i < len(lines) and _PY_FRAME.match(lines[i]):
+                frame = [lines[i]]
+                i += 1
+                while i < len(lines) and lines[i].startswith("    ") and not _PY_FRAME.match(lines[i]):
+                    frame.append(lines[i])
+                    i += 1
+                frames.append(frame)
+            result.extend(_collapse_frames(frames, keep_frames))
+            continue
+        if _AT_FRAME.match(line):
+            frames = []
+            while i < len(lines) and _AT_FRAME.match(lines[i]):
+                frames.append([lines[i]])
+                i += 1
+            result.extend(_collapse_frames(frames, keep_frames))
+            continue
+        result.append(line)
+        i += 1
+    return "\n".join(result)
+
+
+def head_tail_excerpt(text: str, max_chars: int, head_lines: int = 40, tail_lines: int = 20, pointer: str = "") -> str:
+    """
+    超过 max_chars 的文本只保留开头和结尾，中间替换为省略说明。
+
+    Args:
+        text: 原始文本
+        max_chars: 允许保留的最大字符数
+        head_lines: 保留的开头行数
+        tail_lines: 保留的结尾行数
+        pointer: 附加在省略说明中的提示，例如如何重新获取完整内容
+    """
+    if len(text) <= max_chars:
+        return text
+    lines = text.split("\n")
+    if len(lines) > head_lines + tail_lines:
+        head = "\n".join(lines[:head_lines])
+        tail = "\n".join(lines[-tail_lines:]) if tail_lines else ""
+        omitted = f"省略第 {head_lines + 1}-{len(lines) - tail_lines} 行（共 {len(lines)} 行）"
+    else:
+        head, tail, omitted = text, "", ""
+    # 行数不多但单行很长（如压缩过的 JSON）时，再按字符截断
+    head_budget = max_chars * 2 // 3
+    tail_budget = max_chars - head_budget
+    if len(head) > head_budget or len(tail) > tail_budget:
+        if not omitted:
+            tail = head[-tail_budget:]
+            head = head[:head_budget]
+            omitted = f"省略中间 {len(text) - head_budget - tail_budget} 个字符（共 {len(text)} 个字符）"
+        else:
+            head = head[:head_budget]
+            tail = tail[-tail_budget:]
+            omitted += "，过长的行已截断"
+    marker = f"[... 工具输出已截断：{omitted}。{pointer}...]"
+    return "\n".join(part for part in (head, marker, tail) if part)
+
+
+def _tool_call_index(messages: List[Dict[str, Any]]) -> Dict[str, Tuple[str, str]]:
+    """tool_call_id -> (函数名, 参数)"""
+    index = {}
+    for message in messages:
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function") or {}
+            index[tool_call.get("id")] = (function.get("name") or "", function.get("arguments") or "")
+    return index
+
+
+def tool_outputs(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    返回消息中实际发送给模型的工具结果。
+    AutoGen 保存的 tool 消息中，tool_responses 才是发送给模型的内容，content 只是它们的拼接。
+    """
+    if message.get("tool_responses"):
+        return message["tool_responses"]
+    if message.get("role") == "tool":
+        return [message]
+    return []
+
+
+def reads_backing_partial(messages: List[Dict[str, Any]]) -> set:
+    """
+    返回之后被“未修改”说明或差异引用的完整 read_file 输出 {(消息位置, 输出位置)}。
+    这些说明不包含文件内容，被引用的完整输出必须原样保留。
+    """
+    calls = _tool_call_index(messages)
+    pending, backing = set(), set()
+    for i in range(len(messages) - 1, -1, -1):
+        outputs = tool_outputs(messages[i])
+        for j in range(len(outputs) - 1, -1, -1):
+            name, arguments = calls.get(outputs[j].get("tool_call_id"), ("", ""))
+            if name != "read_file":
+                continue
+            path = _normalize_path(_parse_arguments(arguments).get("path"))
+            if is_partial_read(outputs[j].get("content")):
+                pending.add(path)
+            elif path in pending:
+                pending.discard(path)
+                backing.add((i, j))
+    return backing
+
+
+def rebuild_tool_message(message: Dict[str, Any], contents: List[str]) -> Dict[str, Any]:
+    """用新的工具结果内容构造消息副本，同时保持 tool_call_id 与 tool_responses 结构不变。"""
+    message = dict(message)
+    if message.get("tool_responses"):
+        message["tool_responses"] = [
+            {**response, "content": content}
+            for response, content in zip(message["tool_responses"], contents)
+        ]
+        # 与 AutoGen 拼接 tool_responses 的方式保持一致
+        message["content"] = "\n\n".join(contents)
+    else:
+        message["content"] = contents[0]
+    return message
+
+
+class ToolOutputElider(MessageTransform):
+    """
+    在 LLM 压缩之前对工具输出做确定性的精简，不需要任何网络调用：
+    1. 所有工具输出去掉 ANSI 转义与进度条噪音
+    2. 除最近 keep_recent 条以外的工具输出，折叠过长的调用栈，并截断为开头 + 结尾 + 重新获取的提示
+    同一内容的处理结果是确定的，且按内容缓存，不会破坏前缀的稳定性。
+    """
+
+    def __init__(self, keep_recent: int = 3, max_chars: int = 2000, head_lines: int = 40, tail_lines: int = 20, keep_frames: int = 3):
+        """
+        Args:
+            keep_recent: 保留完整内容的最近工具输出条数
+            max_chars: 较早的工具输出允许保留的最大字符数
+            head_lines: 截断时保留的开头行数
+            tail_lines: 截断时保留的结尾行数
+            keep_frames: 折叠调用栈时保留的最内层帧数
+        """
+        self.keep_recent = keep_recent
+        self.max_chars = max_chars
+        self.head_lines = head_lines
+        self.tail_lines = tail_lines
+        self.keep_frames = keep_frames
+        self._cache: Dict[tuple, str] = {}
+        self._max_cache_entries = 5000
+        self._last_stats = {"elided": 0, "saved_chars": 0}
+
+    def _pointer(self, call: Optional[Tuple[str, str]]) -> str:
+        if not call or not call[0]:
+            return "如需完整内容，请重新调用对应的工具"
+        name, arguments = call
+        if len(arguments) > 200:
+            arguments = arguments[:200] + "..."
+        return f"如需完整内容，请重新调用 {name}({arguments})，或缩小读取/搜索范围"
+
+    def _process(self, content: str, recent: bool, call: Optional[Tuple[str, str]]) -> str:
+        key = (content, recent, call)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        result = strip_terminal_noise(content)
+        if not recent:
+            result = collapse_stack_traces(result, self.keep_frames)
+            result = head_tail_excerpt(result, self.max_chars, self.head_lines, self.tail_lines, self._pointer(call))
+        if len(self._cache) >= self._max_cache_entries:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = result
+        return result
+
+    def apply_transform(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        tool_positions = [i for i, message in enumerate(messages) if tool_outputs(message)]
+        recent_positions = set(tool_positions[-self.keep_recent:]) if self.keep_recent > 0 else set()
+        calls = _tool_call_index(messages)
+        backing = reads_backing_partial(messages)
+
+        elided, saved_chars = 0, 0
+        result = list(messages)
+        for i in tool_positions:
+            outputs = tool_outputs(messages[i])
+            contents = []
+            changed = False
+            for output in outputs:
+                content = output.get("content")
+                if not isinstance(content, str):
+                    contents.append(content)
+                    continue
+                keep = i in recent_positions or (i, len(contents)) in backing
+                new_content = self._process(content, keep, calls.get(output.get("tool_call_id")))
+                if new_content != content:
+                    changed = True
+                    elided += 1
+                    saved_chars += len(content) - len(new_content)
+                contents.append(new_content)
+            if changed:
+                result[i] = rebuild_tool_message(messages[i], contents)
+
+        self._last_stats = {"elided": elided, "saved_chars": saved_chars}
+        return result
+
+    def get_logs(
+        self, pre_transform_messages: List[Dict[str, Any]], post_transform_messages: List[Dict[str, Any]]
+    ) -> Tuple[str, bool]:
+        if self._last_stats["elided"]:
+            return (
+                f"Elided {self._last_stats['elided']} tool outputs, "
+                f"saving {self._last_stats['saved_chars']} characters.",
+                True,
+            )
+        return "No tool outputs elided.", False
+
+
+# 统一 diff 文件头中的路径（不含 /dev/null）
+_PATCH_PATH = re.compile(r"^(?:---|\+\+\+) (?:[ab]/)?(?!/dev/null)([^\t\n]+)", re.MULTILINE)
+# 修改文件的工具 -> 从参数中取出被修改的路径
+WRITE_TOOL_PATHS = {
+    "write_file": lambda args: [args.get("path")],
+    "insert_code": lambda args: [args.get("path")],
+    "edit_block": lambda args: [args.get("path")],
+    "delete_file": lambda args: [args.get("path")],
+    "move_file": lambda args: [args.get("src"), args.get("dst")],
+    "apply_edits": lambda args: [edit.get("path") for edit in args.get("edits") or [] if isinstance(edit, dict)],
+    "apply_patch": lambda args: _PATCH_PATH.findall(args.get("patch") or ""),
+}
+# 输出只反映当前状态的只读工具：参数相同、输出也相同时，旧的输出没有保留价值
+SNAPSHOT_TOOLS = ("git_status", "list_directory", "get_file_tree", "git_diff", "file_outline", "find_files")
+_FAILURE_PATTERN = re.compile(r"^\s*(Error|错误|命令执行失败|执行.{0,40}(失败|出错))")
+
+
+def _parse_arguments(arguments: str) -> dict:
+    try:
+        args = json.loads(arguments or "{}")
+        return args if isinstance(args, dict) else {}
+    except (TypeError, ValueError):
+        return {}
+
+
+def _normalize_path(path) -> Optional[str]:
+    return os.path.normpath(path) if isinstance(path, str) and path else None
+
+
+def _read_span(args: dict) -> Optional[Tuple[float, float]]:
+    """read_file 读取的行区间；分页读取（max_bytes / cursor）的实际范围未知，返回 None。"""
+    if args.get("max_bytes") is not None or args.get("cursor") is not None:
+        return None
+    start = args.get("start_line") or 1
+    end = args.get("end_line") or float("inf")
+    return (start, end)
+
+
+def _covers(later: Optional[Tuple[float, float]], earlier: Optional[Tuple[float, float]]) -> bool:
+    if later is None:
+        return False
+    if earlier is None:
+        return later == (1, float("inf"))
+    return later[0] <= earlier[0] and later[1] >= earlier[1]
+
+
+def is_failed_output(content: str) -> bool:
+    return bool(_FAILURE_PATTERN.match(content or ""))
+
+
+class SupersessionPruner(MessageTransform):
+    """
+    将已被后续观察取代的工具输出替换为一行说明，tool_calls 与 tool 结果的对应关系保持不变：
+    1. read_file 的旧输出：之后同一文件被修改，或被覆盖相同行范围的读取重新读取
+    2. git_status / list_directory 等快照类工具：之后以相同参数调用且输出完全相同
+    3. 失败的工具调用：之后以相同目标重试并成功
+    """
+
+    def __init__(self, keep_recent: int = 1):
+        """
+        Args:
+            keep_recent: 最近的若干条工具输出不做处理
+        """
+        self.keep_recent = keep_recent
+        self._last_pruned = 0
+
+    def _collect_calls(self, messages: List[Dict[str, Any]]) -> List[dict]:
+        """按时间顺序收集所有工具调用及其输出位置。"""
+        calls = _tool_call_index(messages)
+        observations = []
+        for i, message in enumerate(messages):
+            for j, output in enumerate(tool_outputs(message)):
+                name, arguments = calls.get(output.get("tool_call_id"), ("", ""))
+                content = output.get("content")
+                if not name or not isinstance(content, str):
+                    continue
+                observations.append({
+                    "message_index": i,
+                    "output_index": j,
+                    "name": name,
+                    "arguments": arguments,
+                    "args": _parse_arguments(arguments),
+                    "content": content,
+                })
+        return observations
+
+    def _find_superseded(self, observations: List[dict]) -> Dict[tuple, str]:
+        """倒序扫描，返回 (消息位置, 输出位置) -> 被取代的原因。"""
+        superseded = {}
+        later_reads = {}      # 路径 -> 之后的成功读取 [(消息位置, 行区间)]，由近及远
+        later_writes = {}     # 路径 -> 之后最近一次修改所在的消息位置
+        later_snapshots = {}  # (工具, 参数, 输出) -> 之后相同输出所在的消息位置
+        later_successes = {}  # (工具, 目标) -> 之后成功调用所在的消息位置
+
+        for obs in reversed(observations):
+            key = (obs["message_index"], obs["output_index"])
+            name, args, content = obs["name"], obs["args"], obs["content"]
+            failed = is_failed_output(content)
+            target = args.get("path") or args.get("file_path") or args.get("command")
+
+            if failed:
+                retry_at = later_successes.get((name, target))
+                if target is not None and retry_at is not None:
+                    superseded[key] = f"调用失败，已在第 {retry_at} 条消息重试成功"
+                continue
+
+            if name == "read_file":
+                path = _normalize_path(args.get("path"))
+                span = _read_span(args)
+                reread_at = next(
+                    (index for index, later_span in later_reads.get(path, []) if _covers(later_span, span)), None
+                )
+                if path in later_writes and (reread_at is None or later_writes[path] < reread_at):
+                    superseded[key] = f"该文件已在第 {later_writes[path]} 条消息被修改，内容已过期"
+                elif reread_at is not None:
+                    superseded[key] = f"该文件已在第 {reread_at} 条消息重新读取"
+                # “未修改”说明与差异不包含完整内容，不能取代之前的读取
+                if path and not is_partial_read(content):
+                    later_reads.setdefault(path, []).insert(0, (obs["message_index"], span))
+            elif name in WRITE_TOOL_PATHS:
+                for path in WRITE_TOOL_PATHS[name](args):
+                    path = _normalize_path(path)
+                    if path:
+                        later_writes[path] = obs["message_index"]
+            elif name in SNAPSHOT_TOOLS:
+                snapshot_key = (name, obs["arguments"], content)
+                if snapshot_key in later_snapshots:
+                    superseded[key] = f"与第 {later_snapshots[snapshot_key]} 条消息的输出完全相同"
+                later_snapshots[snapshot_key] = obs["message_index"]
+
+            later_successes[(name, target)] = obs["message_index"]
+        return superseded
+
+    def apply_transform(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        observations = self._collect_calls(messages)
+        superseded = self._find_superseded(observations)
+        for key in reads_backing_partial(messages):
+            superseded.pop(key, None)
+        if self.keep_recent > 0:
+            for obs in observations[-self.keep_recent:]:
+                superseded.pop((obs["message_index"], obs["output_index"]), None)
+
+        result = list(messages)
+        by_message: Dict[int, List[dict]] = {}
+        for obs in observations:
+            if (obs["message_index"], obs["output_index"]) in superseded:
+                by_message.setdefault(obs["message_index"], []).append(obs)
+        for i, pruned in by_message.items():
+            contents = [output.get("content") for output in tool_outputs(messages[i])]
+            for obs in pruned:
+                arguments = obs["arguments"] if len(obs["arguments"]) <= 120 else obs["arguments"][:120] + "..."
+                reason = superseded[(i, obs["output_index"])]
+                contents[obs["output_index"]] = f"[已省略过期的输出] {obs['name']}({arguments})：{reason}"
+            result[i] = rebuild_tool_message(messages[i], contents)
+
+        self._last_pruned = len(superseded)
+        return result
+
+    def get_logs(
+        self, pre_transform_messages: List[Dict[str, Any]], post_transform_messages: List[Dict[str, Any]]
+    ) -> Tuple[str, bool]:
+        if self._last_pruned:
+            return f"Replaced {self._last_pruned} superseded tool outputs with stubs.", True
+        return "No superseded tool outputs.", False
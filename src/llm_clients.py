@@ -0,0 +1,132 @@
+"""
+辅助模型调用（上下文压缩、命令分析、项目记忆、文件摘要、LlamaIndex）共享的客户端注册表。
+
+每个 (base_url, api_key) 只创建一个带连接池、keep-alive 的 httpx 客户端，
+统一超时、重试退避与可选的 HTTP/2，避免每次调用都重新握手。
+
+可通过环境变量调整：
+- LLM_HTTP_TIMEOUT: 读取超时（秒），默认 120
+- LLM_HTTP_CONNECT_TIMEOUT: 连接超时（秒），默认 10
+- LLM_MAX_RETRIES: 失败重试次数（指数退避），默认 2
+- LLM_MAX_CONNECTIONS: 每个客户端的最大连接数，默认 20
+- LLM_HTTP2: 是否启用 HTTP/2（需要安装 h2），默认 false
+"""
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+_lock = threading.Lock()
+_http_clients: Dict[Tuple[Optional[str], Optional[str]], Any] = {}
+_openai_clients: Dict[Tuple[Any, Optional[str], Optional[str]], Any] = {}
+
+
+def _timeout():
+    import httpx
+    read = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+    connect = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+    return httpx.Timeout(read, connect=connect)
+
+
+def max_retries() -> int:
+    return int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("LLM_HTTP2", "false").lower() != "true":
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("LLM_HTTP2=true 但未安装 h2，回退到 HTTP/1.1")
+        return False
+
+
+def get_http_client(base_url: Optional[str] = None, api_key: Optional[str] = None):
+    """返回 (base_url, api_key) 对应的共享 httpx.Client，首次调用时创建。"""
+    key = (base_url, api_key)
+    client = _http_clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _http_clients.get(key)
+        if client is None:
+            import httpx
+            max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+            client = httpx.Client(
+                timeout=_timeout(),
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                    keepalive_expiry=60,
+                ),
+                http2=_http2_enabled(),
+            )
+            _http_clients[key] = client
+    return client
+
+
+def get_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None):
+    """
+    返回共享的 OpenAI 客户端，底层使用 get_http_client 的连接池，重试退避由 OpenAI SDK 负责。
+    缓存键包含 OpenAI 类本身，测试中 patch("openai.OpenAI") 时会得到新的实例。
+    """
+    from openai import OpenAI
+
+    key = (OpenAI, base_url, api_key)
+    client = _openai_clients.get(key)
+    if client is not None:
+        return client
+    http_client = get_http_client(base_url, api_key)
+    with _lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=_timeout(),
+                max_retries=max_retries(),
+                http_client=http_client,
+            )
+            _openai_clients[key] = client
+    return client
+
+
+def chat_completion(client, purpose: str, **kwargs):
+    """调用 chat.completions.create，并把耗时与 token 用量记录到 span 中。"""
+    with tracer.start_as_current_span("llm_aux_call") as span:
+        span.set_attribute("llm.purpose", purpose)
+        span.set_attribute("llm.model", str(kwargs.get("model")))
+        started = time.perf_counter()
+        try:
+            response = client.chat.completions.create(**kwargs)
+        except Exception as e:
+            span.set_attribute("llm.error", str(e))
+            raise
+        finally:
+            span.set_attribute("llm.latency_ms", (time.perf_counter() - started) * 1000)
+        usage = getattr(response, "usage", None)
+        for name in ("prompt_tokens", "completion_tokens"):
+            value = getattr(usage, name, None)
+            if isinstance(value, int):
+                span.set_attribute(f"llm.usage.{name}", value)
+        return response
+
+
+def reset_clients():
+    """关闭并清空所有共享客户端（用于测试或进程退出前）。"""
+    with _lock:
+        for client in _http_clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _http_clients.clear()
+        _openai_clients.clear()
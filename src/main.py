@@ -21,7 +21,10 @@ from prompt_toolkit.key_binding import KeyBindings
 from src.agent.manager import ensure_project_setup, load_project_memory
 from src.agent.agents import create_agents
 from src.agent.orchestrator import setup_orchestration, start_multi_agent_session
-from src.tools.index_tools import build_index_async, update_index, start_index_watcher
+from src.tools.index_tools import build_index_async, update_index, start_index_watcher, start_index_vacuum_job, vacuum_index
+from src.tools.trigram_index import start_search_index
+from src.tools.path_index import start_path_index
+from src.tools.index_vacuum import format_vacuum_report
 
 from openinference.instrumentation.autogen import AutogenInstrumentor
 from opentelemetry import trace
@@ -31,7 +34,7 @@ from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExport
 from opentelemetry.sdk.resources import Resource
 from openinference.instrumentation.openai import OpenAIInstrumentor
 from src.cli.banner import print_banner
-from src.patch_autogen import patch_autogen_instrumentation
+from src.patch_autogen import patch_autogen_instrumentation, patch_prompt_cache_metrics
 from src.tools.mcp_manager import MCPManager
 import config
 import asyncio
@@ -70,6 +73,9 @@ async def main():
     except Exception as e:
         console.print(f"[bold red]检查 Phoenix 时发生错误: {e}，跳过 OpenInference 初始化。[/bold red]")
     
+    # 记录服务端前缀缓存命中（cached_tokens）
+    patch_prompt_cache_metrics()
+    
     project_root =os.getcwd()
     config.project_root = project_root
     # todo 没必要?
@@ -85,6 +91,15 @@ async def main():
     # 启动实时文件监听器
     start_index_watcher(project_root)
 
+    # 加载或构建 search_code 使用的三元组搜索索引
+    start_search_index(project_root)
+
+    # 构建 find_files 使用的文件路径索引
+    start_path_index(project_root)
+
+    # 启动后台索引 vacuum 任务
+    start_index_vacuum_job(project_root)
+
     # 2. 配置检查
     api_key = os.getenv("DASHSCOPE_API_KEY")
     base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
@@ -122,6 +137,12 @@ async def main():
             if not user_input.strip():
                 continue
 
+            if user_input.strip().lower() == "/vacuum":
+                # 手动维护索引：清理孤儿/重复节点并压缩存储
+                console.print("[dim]正在清理代码索引...[/dim]")
+                console.print(format_vacuum_report(vacuum_index(project_root)))
+                continue
+
             full_prompt = user_input
             if first_time:
                 # 第一次带上项目结构
@@ -167,12 +188,30 @@ async def get_advanced_input_async(session):
 
 
 
+def shutdown_background_workers():
+    """停止索引监听器、后台任务以及复用的线程/进程池；退出时未关闭的非守护线程会阻止解释器退出。"""
+    from src.tools.index_tools import stop_index_watcher, stop_index_vacuum_job, close_index
+    from src.tools.trigram_index import stop_search_index
+    from src.tools.path_index import stop_path_index
+    from src.tools.fs_watcher import stop_fs_watcher
+    from src.tools.search import shutdown_search_workers
+    from src.agent.compress import shutdown_precompress_workers
+    stop_index_watcher()
+    stop_search_index()
+    stop_path_index()
+    stop_fs_watcher()
+    stop_index_vacuum_job()
+    close_index()
+    shutdown_search_workers()
+    shutdown_precompress_workers()
+
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         console.print("\n[yellow]正在关闭...[/yellow]")
-        # 停止索引监听器
-        from src.tools.index_tools import stop_index_watcher
-        stop_index_watcher()
+        shutdown_background_workers()
         sys.exit(0)
+    # 输入 exit 正常退出时同样需要停止后台线程
+    shutdown_background_workers()
@@ -107,3 +107,58 @@ def patch_autogen_instrumentation():
         return self
 
     AutogenInstrumentor.instrument = patched_instrument
+
+
+# 服务端前缀缓存命中统计（进程内累计）
+prompt_cache_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+
+def _extract_cached_tokens(response: Any) -> tuple:
+    """从 OpenAI 兼容响应中取出 (prompt_tokens, cached_tokens)，DashScope 与 OpenAI 的字段一致。"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details") or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        cached_tokens = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", 0)
+    else:
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        cached_tokens = getattr(details, "cached_tokens", 0) if details is not None else 0
+    return prompt_tokens, cached_tokens or 0
+
+
+def patch_prompt_cache_metrics():
+    """
+    包装 OpenAIWrapper.create，把响应中的 cached_tokens 记录为 span 属性，
+    用于衡量上下文布局对服务端前缀缓存的命中率。
+    """
+    from autogen.oai.client import OpenAIWrapper
+
+    if getattr(OpenAIWrapper.create, "_records_prompt_cache", False):
+        return
+
+    original_create = OpenAIWrapper.create
+    tracer = trace.get_tracer(__name__)
+
+    def create(self, **config: Any):
+        with tracer.start_as_current_span("llm_prompt_cache") as span:
+            response = original_create(self, **config)
+            prompt_tokens, cached_tokens = _extract_cached_tokens(response)
+            prompt_cache_stats["requests"] += 1
+            prompt_cache_stats["prompt_tokens"] += prompt_tokens
+            prompt_cache_stats["cached_tokens"] += cached_tokens
+            span.set_attribute("llm.model", str(config.get("model") or ""))
+            span.set_attribute("llm.usage.prompt_tokens", prompt_tokens)
+            span.set_attribute("llm.usage.cached_tokens", cached_tokens)
+            span.set_attribute("llm.usage.cache_hit_ratio", cached_tokens / prompt_tokens if prompt_tokens else 0.0)
+            total_prompt = prompt_cache_stats["prompt_tokens"]
+            span.set_attribute(
+                "llm.usage.session_cache_hit_ratio",
+                prompt_cache_stats["cached_tokens"] / total_prompt if total_prompt else 0.0,
+            )
+            return response
+
+    create._records_prompt_cache = True
+    OpenAIWrapper.create = create
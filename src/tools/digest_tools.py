@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List
+from src.agent.tokenizer import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_FILENAME = "file_summaries.json"
+# 单次 LLM 调用最多包含的文件数与字符数
+BATCH_MAX_FILES = 8
+BATCH_MAX_CHARS = 24000
+# 每个文件送入 LLM 的最大字符数
+FILE_MAX_CHARS = 6000
+
+SUMMARY_PROMPT = """你是一个代码库分析助手。下面给出若干个源文件（以 ===== 路径 ===== 分隔）。
+请为每个文件写一段不超过 60 字的中文摘要，说明该文件的职责、核心类/函数以及与其他模块的关系。
+只返回 JSON 对象，键为文件路径（与输入完全一致），值为摘要字符串，不要包含其它内容。"""
+
+_summary_lock = threading.Lock()
+_pending = set()
+_worker = None
+
+
+def summaries_enabled() -> bool:
+    return os.getenv("ENABLE_FILE_SUMMARIES", "false").lower() == "true"
+
+
+def _cache_path(project_root: str) -> str:
+    return os.path.join(project_root, ".chaos", SUMMARY_CACHE_FILENAME)
+
+
+def load_summary_cache(project_root: str) -> dict:
+    """
+    摘要缓存结构：
+    - by_hash: 内容哈希 -> 摘要（内容不变的文件永远不会重复摘要，重命名也能复用）
+    - files: 相对路径 -> 内容哈希
+    """
+    path = _cache_path(project_root)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取文件摘要缓存失败: {e}")
+    return {"by_hash": {}, "files": {}}
+
+
+def _save_summary_cache(project_root: str, cache: dict):
+    path = _cache_path(project_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _make_batches(items: List[tuple]) -> List[List[tuple]]:
+    """按文件数和字符数把 (相对路径, 内容) 切分成批次。"""
+    batches, current, size = [], [], 0
+    for rel_path, content in items:
+        if current and (len(current) >= BATCH_MAX_FILES or size + len(content) > BATCH_MAX_CHARS):
+            batches.append(current)
+            current, size = [], 0
+        current.append((rel_path, content))
+        size += len(content)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _parse_summary_response(text: str) -> Dict[str, str]:
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    result = json.loads(text.strip())
+    return {str(k): str(v).strip() for k, v in result.items() if v}
+
+
+def _summarize_batch(client, model_id: str, batch: List[tuple]) -> Dict[str, str]:
+    body = "\n\n".join(f"===== {rel_path} =====\n{content}" for rel_path, content in batch)
+    from src.llm_clients import chat_completion
+
+    response = chat_completion(
+        client,
+        "file_summary",
+        model=model_id,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": body}
+        ],
+        temperature=0.1,
+    )
+    return _parse_summary_response(response.choices[0].message.content)
+
+
+def summarize_files(project_root: str, paths: Iterable[str]) -> int:
+    """
+    为变更的文件生成摘要并写入缓存。
+
+    Args:
+        project_root: 项目根目录
+        paths: 需要检查的文件路径（绝对路径）
+
+    Returns:
+        新生成的摘要数量
+    """
+    from src.llm_clients import get_openai_client
+
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    base_url = os.getenv("DASHSCOPE_BASE_URL")
+    model_id = os.getenv("GENERAL_MODEL_ID")
+    if not api_key or not model_id:
+        return 0
+
+    cache = load_summary_cache(project_root)
+    todo = []
+    for path in paths:
+        rel_path = os.path.relpath(str(path), project_root)
+        if not os.path.exists(path):
+            cache["files"].pop(rel_path, None)
+            continue
+        try:
+            content_hash = _hash_file(path)
+        except OSError:
+            continue
+        cache["files"][rel_path] = content_hash
+        if content_hash in cache["by_hash"]:
+            continue
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            todo.append((rel_path, content_hash, f.read(FILE_MAX_CHARS)))
+
+    created = 0
+    if todo:
+        hash_by_path = {rel_path: content_hash for rel_path, content_hash, _ in todo}
+        client = get_openai_client(api_key=api_key, base_url=base_url)
+        for batch in _make_batches([(rel_path, content) for rel_path, _, content in todo]):
+            try:
+                summaries = _summarize_batch(client, model_id, batch)
+            except Exception as e:
+                logger.warning(f"生成文件摘要失败: {e}")
+                continue
+            for rel_path, summary in summaries.items():
+                if rel_path in hash_by_path:
+                    cache["by_hash"][hash_by_path[rel_path]] = summary
+                    created += 1
+
+    # 清理已经没有文件引用的摘要
+    live_hashes = set(cache["files"].values())
+    cache["by_hash"] = {h: s for h, s in cache["by_hash"].items() if h in live_hashes}
+    _save_summary_cache(project_root, cache)
+    return created
+
+
+def schedule_file_summaries(project_root: str, paths: Iterable[str]):
+    """
+    在后台批量生成文件摘要（需要 ENABLE_FILE_SUMMARIES=true）。
+    多次调用会合并到同一个待处理队列，由单个后台线程串行消费。
+    """
+    global _worker
+
+    if not summaries_enabled():
+        return
+
+    with _summary_lock:
+        _pending.update(str(p) for p in paths)
+        if _worker is not None and _worker.is_alive():
+            return
+
+        def _run():
+            global _worker
+            while True:
+                # 在锁内决定是否退出并清空 _worker：入队方要么看到仍在运行的线程，要么启动新线程
+                with _summary_lock:
+                    batch = list(_pending)
+                    _pending.clear()
+                    if not batch:
+                        _worker = None
+                        return
+                started = time.time()
+                created = summarize_files(project_root, batch)
+                logger.info(f"文件摘要更新完成：新增 {created} 条，耗时 {time.time() - started:.1f} 秒")
+
+        _worker = threading.Thread(target=_run, daemon=True)
+        _worker.start()
+
+
+def project_digest(path_prefix: str = "", max_tokens: int = 2000) -> str:
+    """
+    获取项目文件摘要（索引阶段预先生成并缓存），用于快速了解代码库结构，避免逐个 read_file。
+
+    适用场景:
+    1. 新会话开始时快速了解项目各模块职责
+    2. 在修改某个目录前了解其中每个文件的作用
+
+    Args:
+        path_prefix: 相对路径前缀，例如 "src/agent"，为空表示整个项目
+        max_tokens: 返回内容的 token 上限，默认 2000
+
+    Returns:
+        "路径: 摘要" 列表；超出预算的文件只统计数量
+    """
+    cache = load_summary_cache(os.getcwd())
+    prefix = path_prefix.strip()
+    if prefix.startswith("./"):
+        prefix = prefix[2:]
+    if prefix == ".":
+        prefix = ""
+    entries = [
+        (rel_path, cache["by_hash"].get(content_hash))
+        for rel_path, content_hash in sorted(cache["files"].items())
+        if rel_path.startswith(prefix)
+    ]
+    entries = [(rel_path, summary) for rel_path, summary in entries if summary]
+    if not entries:
+        return "暂无可用的文件摘要（可能尚未生成，或未开启 ENABLE_FILE_SUMMARIES）。请改用 get_file_tree / read_file。"
+
+    tokenizer = get_tokenizer()
+    lines, used = [], 0
+    for rel_path, summary in entries:
+        line = f"- {rel_path}: {summary}"
+        cost = tokenizer.count(line)
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+
+    omitted = len(entries) - len(lines)
+    if omitted:
+        lines.append(f"\n[系统提示] 受 token 预算限制，另有 {omitted} 个文件未显示。请指定更具体的 path_prefix。")
+    return "\n".join(lines)
+project_digest.tool_type = "read"
@@ -1,27 +1,145 @@
 import os
 import re
 import shutil
+import tempfile
+from typing import Any, Dict, List, Optional
 from rich.prompt import Confirm
 from rich.console import Console
 
 console = Console()
 
-def read_file(path: str) -> str:
-    """读取文件内容"""
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+# 使用 cursor 分页读取且未指定 max_bytes 时，每页的字节数
+DEFAULT_PAGE_BYTES = 20000
+# 修改工具 show_diff=True 时返回的差异的最大字符数与上下文行数
+DIFF_MAX_CHARS = 3000
+DIFF_CONTEXT_LINES = 2
+
+def _compact_diff(path: str, old: str, new: str) -> str:
+    """生成修改前后的统一 diff（带行号的 hunk 头与少量上下文），超出预算时截断。"""
+    import difflib
+
+    diff = list(difflib.unified_diff(
+        old.splitlines(), new.splitlines(),
+        fromfile=f"{path}（修改前）", tofile=f"{path}（修改后）", n=DIFF_CONTEXT_LINES, lineterm="",
+    ))
+    if not diff:
+        return "[修改后的差异] 文件内容没有变化。"
+    lines, used = [], 0
+    for i, line in enumerate(diff):
+        if used + len(line) + 1 > DIFF_MAX_CHARS:
+            lines.append(f"...（差异过长，已省略剩余 {len(diff) - i} 行，可用 read_file 的 start_line / end_line 查看）")
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "[修改后的差异]\n" + "\n".join(lines)
+
+def read_file(path: str, start_line: int = None, end_line: int = None, max_bytes: int = None, cursor: str = None, force: bool = False) -> str:
+    """
+    读取文件内容。不指定任何参数时返回整个文件；大文件请按行范围或分页读取。
+    同一对话中再次读取整个文件时，如果文件未修改只返回简短说明，修改较少时只返回差异。
+
+    Args:
+        path: 文件路径
+        start_line: 起始行号（从 1 开始，包含）
+        end_line: 结束行号（包含），默认读到文件末尾
+        max_bytes: 本次最多返回的字节数，超出时在行边界截断，并返回继续读取用的 cursor
+        cursor: 上一次分页读取返回的游标，传入后从上次结束的位置继续读取
+        force: 为 True 时总是返回完整内容（上下文中已看不到之前读取的内容时使用）
+    """
+    if start_line is None and end_line is None and max_bytes is None and cursor is None:
+        from src.tools.read_cache import read_cache
+        return read_cache.read(path, force=force)
+
+    from src.tools.line_index import get_line_index, make_cursor, parse_cursor
+
+    if not os.path.isfile(path):
+        return f"错误：文件 '{path}' 不存在。"
+    index = get_line_index(path)
+    notes = []
+    if cursor is not None:
+        try:
+            start_line, version = parse_cursor(cursor)
+        except ValueError:
+            return f"错误：无效的 cursor '{cursor}'。"
+        if version is not None and version != (index.mtime_ns, index.size):
+            notes.append("[系统提示] 文件在上次读取后已被修改，行号可能已变化。")
+        if max_bytes is None:
+            max_bytes = DEFAULT_PAGE_BYTES
+
+    total = index.line_count
+    start = max(1, start_line or 1)
+    end = min(total, end_line) if end_line is not None else total
+    if start > end:
+        return "\n".join([f"[文件 '{path}' 共 {total} 行，第 {start}-{end_line or total} 行没有内容]"] + notes)
+
+    stop = index.end_line_within(start, end, max_bytes) if max_bytes is not None else end
+    text = index.read_lines(start, stop)
+    header = f"[文件 '{path}' 第 {start}-{stop} 行，共 {total} 行]"
+    if stop < end:
+        notes.append(
+            f"[系统提示] 已达到 max_bytes={max_bytes} 的限制，"
+            f"继续读取请调用 read_file(path=\"{path}\", cursor=\"{make_cursor(stop + 1, index)}\""
+            + (f", end_line={end_line}" if end_line is not None else "") + ")"
+        )
+    return "\n".join([header, text.rstrip("\n")] + notes)
 read_file.tool_type = "read"  # 添加工具类型标识
 
-def write_file(path: str, content: str) -> str:
-    """将内容写入文件。"""
+def file_outline(path: str) -> str:
+    """
+    返回文件的结构大纲（导入语句、类 / 函数签名及行范围、文档首行），体积远小于全文。
+    适合在读取大文件前先了解其结构，再用 read_file 的 start_line / end_line 精确读取需要的部分。
+    支持 .py / .js / .jsx / .ts / .tsx / .go / .java。
+
+    Args:
+        path: 文件路径
+    """
+    from src.tools.outline import OUTLINE_LANGUAGES, build_outline
+
+    if not os.path.isfile(path):
+        return f"错误：文件 '{path}' 不存在。"
+    language = OUTLINE_LANGUAGES.get(os.path.splitext(path)[1].lower())
+    if language is None:
+        return f"错误：不支持为 '{path}' 生成大纲，请使用 read_file 的 start_line / end_line 或 max_bytes 分段读取。"
+    with open(path, "rb") as f:
+        source = f.read()
+    outline = build_outline(source, language)
+    if outline is None:
+        return f"错误：{language} 解析器不可用，请使用 read_file 的 start_line / end_line 或 max_bytes 分段读取。"
+    total = source.count(b"\n") + (1 if source and not source.endswith(b"\n") else 0)
+    return f"[文件 '{path}' 的大纲，共 {total} 行]\n{outline}"
+file_outline.tool_type = "read"  # 添加工具类型标识
+
+def write_file(path: str, content: str, show_diff: bool = False) -> str:
+    """
+    将内容写入文件。
+
+    Args:
+        path: 文件路径
+        content: 文件内容
+        show_diff: 为 True 时在结果中附带修改前后的差异，无需再读取文件确认
+    """
 
+    old_content = None
+    if show_diff and os.path.isfile(path):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            old_content = f.read()
     with open(path, "w", encoding="utf-8") as f:
         f.write(content)
+    if show_diff:
+        return f"文件 '{path}' 写入成功\n{_compact_diff(path, old_content or '', content)}"
     return f"文件 '{path}' 写入成功"
 write_file.tool_type = "write"  # 添加工具类型标识
 
-def insert_code(path: str, line_number: int, content: str) -> str:
-    """在特定行号插入代码。"""
+def insert_code(path: str, line_number: int, content: str, show_diff: bool = False) -> str:
+    """
+    在特定行号插入代码。
+
+    Args:
+        path: 文件路径
+        line_number: 插入位置的行号，代码插入到该行之前
+        content: 要插入的代码
+        show_diff: 为 True 时在结果中附带插入位置附近的差异，无需再读取文件确认
+    """
 
     if not os.path.exists(path):
         return f"错误：文件 '{path}' 不存在。"
@@ -34,93 +152,53 @@ def insert_code(path: str, line_number: int, content: str) -> str:
     
     with open(path, "w", encoding="utf-8") as f:
         f.writelines(lines)
+    if show_diff:
+        old_lines = lines[:idx] + lines[idx + 1:]
+        return f"代码已成功插入到 '{path}' 的第 {line_number} 行。\n{_compact_diff(path, ''.join(old_lines), ''.join(lines))}"
     return f"代码已成功插入到 '{path}' 的第 {line_number} 行。"
 insert_code.tool_type = "write"  # 添加工具类型标识
 
-def search_code(query: str, path: str = ".", max_matches: int = 50) -> str:
+def search_code(
+    query: str,
+    path: str = ".",
+    max_matches: int = 50,
+    is_regex: bool = False,
+    glob: Optional[str] = None,
+    file_type: Optional[str] = None,
+    context_lines: int = 0,
+) -> str:
     """
-    在文件中搜索特定模式。
+    在文件中搜索特定模式，结果按文件分组，匹配行显示为“行号: 内容”，上下文行显示为“行号- 内容”。
     Args:
-        query: 搜索关键词
+        query: 搜索关键词（默认按固定字符串匹配）
         path: 搜索路径
-        max_matches: 最大返回匹配数，防止上下文溢出
+        max_matches: 全局最大返回匹配数，防止上下文溢出；达到后停止搜索并报告省略的匹配数
+        is_regex: 是否把 query 当作正则表达式
+        glob: 只搜索匹配该 glob 的文件，例如 "*.py" 或 "src/**/*.ts"，以 ! 开头表示排除
+        file_type: 只搜索该类型的文件，例如 "py"、"js"、"ts"、"go"、"java"、"md"
+        context_lines: 每个匹配前后显示的上下文行数
     """
+    from src.tools.search import (
+        SearchError, format_results, narrow_with_index, search_with_python, search_with_ripgrep,
+    )
+
+    context_lines = max(0, int(context_lines or 0))
     try:
-        from ripgrepy import Ripgrepy, RipGrepNotFound
-        
-        # 使用 ripgrepy 构造搜索
-        # fixed_strings(): 固定字符串搜索 (保持原函数行为，非正则)
-        # line_number(): 显示行号
-        # no_heading(): 不按文件分组，方便每行显示文件名
-        # with_filename(): 强制每行显示文件名
-        # max_columns(500): 忽略超长行
-        rg = Ripgrepy(query, path)
-        rg.fixed_strings().line_number().no_heading().with_filename().max_columns(500)
-        
-        # 执行搜索并获取结果列表
-        # 注意：ripgrep 的 max_count 是指每个文件的最大匹配数，
-        # 而我们的 max_matches 是全局最大匹配数。
-        # 所以我们先不设限地运行，然后在 Python 层截断。
-        # 如果担心性能，可以设一个较大的全局上限。
-        out = rg.run()
-        results = out.as_list
-        
-        if not results:
+        # 启用搜索索引时先用三元组索引缩小候选文件，再对候选文件做验证搜索
+        files = narrow_with_index(query, path, is_regex, glob, file_type)
+        if files is not None and not files:
             return "未找到匹配项。"
-            
-        count = len(results)
-        if count > max_matches:
-            results = results[:max_matches]
-            results.append(f"\n[系统提示] 搜索结果过多，已截断。仅显示前 {max_matches} 条。请尝试更精确的关键词或指定具体目录。")
-            
-        return "\n".join(results)
-
-    except (ImportError, RipGrepNotFound):
-        # 如果未安装 ripgrepy 或找不到 rg 引擎，回退到原生 Python 实现
-        pass
-    except Exception as e:
-        # 其他异常也回退
-        pass
-
-    # === 原生 Python 回退实现 ===
-    results = []
-    matches_count = 0
-    # 定义要忽略的目录和文件后缀
-    ignore_dirs = {".git", ".idea", ".vscode", "__pycache__", "node_modules", "dist", "build", "venv", ".chaos", ".venv"}
-    ignore_exts = {".exe", ".dll", ".so", ".bin", ".jpg", ".png", ".zip", ".pyc"}
-    
-    # 遍历文件
-    for root, dirs, files in os.walk(path, topdown=True):
-        dirs[:] = [d for d in dirs if d not in ignore_dirs]
-        
-        for file in files:
-            if any(file.endswith(ext) for ext in ignore_exts):
-                continue
-                
-            file_path = os.path.join(root, file)
-            
-            try:
-                with open(file_path, "r", encoding="utf-8", errors='ignore') as f:
-                    for i, line in enumerate(f, 1):
-                        if len(line) > 500: 
-                            continue
-                            
-                        if query in line:
-                            matches_count += 1
-                            results.append(f"{file_path}:{i}: {line.strip()}")
-                            
-                            if matches_count >= max_matches:
-                                results.append(f"\n[系统提示] 搜索结果过多，已截断。仅显示前 {max_matches} 条。请尝试更精确的关键词或指定具体目录。")
-                                return "\n".join(results)
-                                
-            except (PermissionError, OSError):
-                continue
-
-    return "\n".join(results) if results else "未找到匹配项。"
+        # 优先流式调用 rg --json，找不到 rg 时回退到原生 Python 实现
+        result = search_with_ripgrep(query, path, max_matches, is_regex, glob, file_type, context_lines, files)
+        if result is None:
+            result = search_with_python(query, path, max_matches, is_regex, glob, file_type, context_lines, files)
+    except SearchError as e:
+        return f"错误：{str(e)}"
+    return format_results(*result)
 
 search_code.tool_type = "read"
 
-def edit_block(path: str, pattern: str, replacement: str, is_regex: bool = False) -> str:
+def edit_block(path: str, pattern: str, replacement: str, is_regex: bool = False, show_diff: bool = False) -> str:
     """
     使用正则或字符串匹配替换文件中的代码块。
     
@@ -134,6 +212,7 @@ def edit_block(path: str, pattern: str, replacement: str, is_regex: bool = False
         pattern: 要匹配的模式（字符串或正则表达式）
         replacement: 替换内容
         is_regex: 是否使用正则表达式（默认 False）
+        show_diff: 为 True 时在结果中附带修改前后的差异（带行号与少量上下文），无需再读取文件确认
     
     Returns:
         操作结果描述，包含替换次数
@@ -163,6 +242,8 @@ def edit_block(path: str, pattern: str, replacement: str, is_regex: bool = False
         with open(path, "w", encoding="utf-8") as f:
             f.write(new_content)
         
+        if show_diff:
+            return f"成功替换 {count} 处匹配项\n{_compact_diff(path, content, new_content)}"
         return f"成功替换 {count} 处匹配项"
     except re.error as e:
         return f"正则表达式错误：{str(e)}"
@@ -170,6 +251,157 @@ def edit_block(path: str, pattern: str, replacement: str, is_regex: bool = False
         return f"编辑失败：{str(e)}"
 edit_block.tool_type = "write"  # 添加工具类型标识
 
+def _atomic_write(path: str, content: str):
+    """先写入同目录下的临时文件再重命名，写入过程中失败不会留下半截文件。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _apply_file_edits(content: str, edits: List[tuple]) -> tuple:
+    """
+    在内存中依次执行同一文件的修改，返回 (新内容, 每个修改的状态)。
+    行号均指批量修改前的原始文件：先自下而上执行按行范围的修改，再按顺序执行查找替换。
+    任何一个修改无法执行时抛出 ValueError。
+    """
+    statuses = {}
+    lines = content.splitlines(keepends=True)
+    ranges = sorted(
+        [(number, edit) for number, edit in edits if "start_line" in edit],
+        key=lambda item: item[1]["start_line"],
+    )
+    previous_end = 0
+    for number, edit in ranges:
+        start, end = int(edit["start_line"]), int(edit.get("end_line", edit["start_line"]))
+        if start < 1 or start > len(lines) + 1 or end < start - 1 or end > len(lines):
+            raise ValueError(f"[{number}] 行范围 {start}-{end} 超出文件范围（共 {len(lines)} 行）")
+        if start <= previous_end:
+            raise ValueError(f"[{number}] 行范围 {start}-{end} 与其他修改重叠")
+        previous_end = max(previous_end, end)
+    for number, edit in reversed(ranges):
+        start, end = int(edit["start_line"]), int(edit.get("end_line", edit["start_line"]))
+        new_text = edit.get("content", "")
+        if new_text and not new_text.endswith("\n"):
+            new_text += "\n"
+        lines[start - 1:end] = new_text.splitlines(keepends=True)
+        statuses[number] = f"替换第 {start}-{end} 行" if end >= start else f"在第 {start} 行前插入"
+    content = "".join(lines)
+
+    for number, edit in edits:
+        if "start_line" in edit:
+            continue
+        if "pattern" not in edit:
+            content = edit.get("content", "")
+            statuses[number] = "写入整个文件"
+            continue
+        pattern, replacement = edit["pattern"], edit.get("replacement", "")
+        if edit.get("is_regex"):
+            try:
+                content, count = re.subn(pattern, replacement, content)
+            except re.error as e:
+                raise ValueError(f"[{number}] 正则表达式错误：{str(e)}")
+        else:
+            count = content.count(pattern)
+            content = content.replace(pattern, replacement)
+        if count == 0:
+            raise ValueError(f"[{number}] 未找到匹配项 '{pattern[:80]}'")
+        if edit.get("expected_count") is not None and count != int(edit["expected_count"]):
+            raise ValueError(f"[{number}] 匹配到 {count} 处，与 expected_count={edit['expected_count']} 不符")
+        statuses[number] = f"替换 {count} 处匹配项"
+    return content, [statuses[number] for number, _ in edits]
+
+def apply_edits(edits: List[Dict[str, Any]]) -> str:
+    """
+    一次调用完成多个文件的多处修改，全部成功或全部不生效。
+
+    每个修改是一个对象，必须包含 path，以及以下三种形式之一：
+    - 查找替换：pattern、replacement，可选 is_regex（默认 False）、expected_count（期望的匹配数）
+    - 按行替换：start_line、end_line、content，用 content 替换第 start_line 到 end_line 行；
+      end_line = start_line - 1 表示在 start_line 之前插入
+    - 整个文件：只有 content，写入（或新建）整个文件
+    行号均指本次修改之前的原始文件。每个文件只读取一次，所有修改校验通过后才写入，
+    每个文件通过临时文件 + 重命名原子地写入；任何一步失败都会回滚已写入的文件。
+
+    Args:
+        edits: 修改列表
+
+    Returns:
+        每个修改的执行结果
+
+    示例：
+        >>> apply_edits([{"path": "a.py", "pattern": "old_name", "replacement": "new_name"},
+        ...              {"path": "b.py", "start_line": 10, "end_line": 12, "content": "pass"}])
+    """
+    if not edits:
+        return "错误：edits 为空。"
+
+    # 按真实路径分组，a.py 与 ./a.py 等别名只读写一次
+    by_file: Dict[str, List[tuple]] = {}
+    for number, edit in enumerate(edits, 1):
+        if not isinstance(edit, dict) or not edit.get("path"):
+            return f"错误：第 {number} 个修改缺少 path，所有文件均未修改。"
+        by_file.setdefault(os.path.realpath(edit["path"]), []).append((number, edit))
+
+    # 1. 校验并在内存中执行所有修改
+    originals, results, statuses = {}, {}, {}
+    for path, file_edits in by_file.items():
+        whole = [number for number, edit in file_edits if "pattern" not in edit and "start_line" not in edit]
+        if whole and len(file_edits) > 1:
+            return (
+                f"错误：[{whole[0]}] 写入整个文件的修改不能与同一文件的其他修改"
+                f"（{', '.join(str(number) for number, _ in file_edits if number != whole[0])}）合并，所有文件均未修改。"
+            )
+        shown = file_edits[0][1]["path"]
+        if not os.path.exists(path) and not whole:
+            return f"错误：[{file_edits[0][0]}] 文件 '{shown}' 不存在，所有文件均未修改。"
+        try:
+            original = None
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    original = f.read()
+            new_content, file_statuses = _apply_file_edits(original or "", file_edits)
+        except ValueError as e:
+            return f"错误：{shown}: {str(e)}。所有文件均未修改。"
+        except Exception as e:
+            return f"错误：读取 '{shown}' 失败：{str(e)}。所有文件均未修改。"
+        originals[path] = original
+        results[path] = new_content
+        for (number, edit), status in zip(file_edits, file_statuses):
+            statuses[number] = f"[{number}] {edit['path']}: {status}"
+
+    # 2. 逐个文件原子写入，失败时回滚已写入的文件
+    written = []
+    try:
+        for path, new_content in results.items():
+            if new_content == originals[path]:
+                continue
+            _atomic_write(path, new_content)
+            written.append(path)
+    except Exception as e:
+        for path in reversed(written):
+            try:
+                if originals[path] is None:
+                    os.remove(path)
+                else:
+                    _atomic_write(path, originals[path])
+            except Exception:
+                pass
+        return f"错误：写入 '{path}' 失败：{str(e)}。已回滚 {len(written)} 个已写入的文件。"
+
+    lines = [statuses[number] for number in range(1, len(edits) + 1)]
+    lines.append(f"共 {len(edits)} 处修改，已写入 {len(written)} 个文件。")
+    return "\n".join(lines)
+apply_edits.tool_type = "write"  # 添加工具类型标识
+
 def create_directory(path: str) -> str:
     """创建目录（包括父目录）。"""
     try:
@@ -278,6 +510,31 @@ def get_file_tree(path: str = ".", max_depth: int = 2) -> str:
         return f"获取文件树失败：{str(e)}"
 get_file_tree.tool_type = "read"
 
+def find_files(pattern: str, limit: int = 20) -> str:
+    """
+    按文件名或路径快速查找项目中的文件（遵循 .gitignore），无需逐层 list_directory 或执行 find。
+
+    Args:
+        pattern: 查找模式。包含 * ? [ 时按 glob 匹配（不含 / 时只匹配文件名，例如 "*.md"；
+                 含 / 时匹配完整路径，例如 "src/**/test_*.py"）；否则按模糊子序列匹配，
+                 例如 "ftools" 可以找到 "src/tools/file_tools.py"
+        limit: 最多返回的文件数
+
+    Returns:
+        按相关度（文件名 / 路径片段的匹配程度、最近修改时间）排序的相对路径列表
+    """
+    from src.tools.path_index import get_path_index
+
+    limit = max(1, int(limit or 20))
+    paths, total = get_path_index(os.getcwd()).find(pattern, limit)
+    if not paths:
+        return f"未找到匹配 '{pattern}' 的文件。"
+    lines = list(paths)
+    if total > len(paths):
+        lines.append(f"\n[系统提示] 共找到 {total} 个文件，仅显示最相关的 {len(paths)} 个。请使用更精确的模式。")
+    return "\n".join(lines)
+find_files.tool_type = "read"  # 添加工具类型标识
+
 def move_file(src: str, dst: str) -> str:
     """移动或重命名文件/目录。"""
     try:
@@ -313,14 +570,17 @@ def get_file_tools(tool_type: str = None) -> list:
     """
     all_tools = [
         read_file, 
+        file_outline,
         write_file, 
         insert_code, 
         search_code,
         edit_block,
+        apply_edits,
         create_directory,
         delete_file,
         list_directory,
         get_file_tree,
+        find_files,
         move_file,
         file_exists
     ]
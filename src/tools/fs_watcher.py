@@ -0,0 +1,87 @@
+import logging
+import threading
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# 回调签名：callback(event_type, path, is_directory)，event_type 为 created / modified / deleted
+# 移动 / 重命名拆分为旧路径的 deleted 与新路径的 created 两个事件
+FsCallback = Callable[[str, str, bool], None]
+
+_observer = None  # watchdog observer，整个项目共享一个
+_subscribers: List[FsCallback] = []
+_lock = threading.Lock()
+
+
+def subscribe(callback: FsCallback):
+    """注册文件变更回调（代码索引、搜索索引等共用同一个监听器）。"""
+    with _lock:
+        if callback not in _subscribers:
+            _subscribers.append(callback)
+
+
+def unsubscribe(callback: FsCallback):
+    with _lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+
+def _dispatch(event_type: str, path: str, is_directory: bool):
+    with _lock:
+        subscribers = list(_subscribers)
+    for callback in subscribers:
+        try:
+            callback(event_type, path, is_directory)
+        except Exception as e:
+            logger.error(f"处理文件变更 {path} 时出错: {e}")
+
+
+def start_fs_watcher(project_root: str) -> bool:
+    """
+    启动共享的文件系统监听器，已在运行时直接返回。
+    返回是否处于运行状态。
+    """
+    global _observer
+
+    with _lock:
+        if _observer is not None:
+            return True
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+
+            class _Handler(FileSystemEventHandler):
+                def on_created(self, event):
+                    _dispatch("created", event.src_path, event.is_directory)
+
+                def on_modified(self, event):
+                    _dispatch("modified", event.src_path, event.is_directory)
+
+                def on_deleted(self, event):
+                    _dispatch("deleted", event.src_path, event.is_directory)
+
+                def on_moved(self, event):
+                    _dispatch("deleted", event.src_path, event.is_directory)
+                    _dispatch("created", event.dest_path, event.is_directory)
+
+            observer = Observer()
+            observer.schedule(_Handler(), project_root, recursive=True)
+            observer.start()
+        except Exception as e:
+            logger.error(f"启动文件监听器失败: {e}")
+            return False
+        _observer = observer
+    logger.info(f"已启动文件监听器，监控目录: {project_root}")
+    return True
+
+
+def stop_fs_watcher():
+    """停止共享的文件系统监听器。"""
+    global _observer
+
+    with _lock:
+        observer, _observer = _observer, None
+    if observer is not None:
+        observer.stop()
+        observer.join()
+        logger.info("已停止文件监听器。")
@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 无论 .gitignore 如何配置都跳过的目录和文件后缀
+IGNORE_DIRS = {".git", ".idea", ".vscode", "__pycache__", "node_modules", "dist", "build", "venv", ".chaos", ".venv"}
+IGNORE_EXTS = {".exe", ".dll", ".so", ".bin", ".jpg", ".png", ".zip", ".pyc"}
+
+# 一条规则：(正则, 是否为 ! 取反, 是否只匹配目录)
+Rule = Tuple["re.Pattern", bool, bool]
+
+
+def glob_to_regex(pattern: str) -> str:
+    """把 gitignore 风格的通配符模式（*、?、[...]、**）转换为正则，不含首尾锚点。"""
+    i, n, out = 0, len(pattern), []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == n:
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text: str) -> List[Rule]:
+    """解析 .gitignore 的内容，忽略空行和注释。"""
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip("\r")
+        # 行尾未转义的空格会被忽略
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate or line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # 包含 / 的模式相对于 .gitignore 所在目录，否则匹配任意层级
+        anchored = "/" in line
+        prefix = "" if anchored else "(?:.*/)?"
+        regex = re.compile(prefix + glob_to_regex(line.lstrip("/")) + r"\Z", re.DOTALL)
+        rules.append((regex, negate, dir_only))
+    return rules
+
+
+def find_repo_root(path: str) -> str:
+    """包含 .git 的最近的上级目录；不在 git 仓库中时返回 path 本身。"""
+    current = os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path))
+    start = current
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return start
+        current = parent
+
+
+class IgnoreRules:
+    """
+    按 git 的语义判断路径是否被忽略：
+    - 读取根目录及各级子目录的 .gitignore，以及 .git/info/exclude
+    - 子目录的规则相对于其所在目录，后出现的规则优先，! 表示重新包含
+    - 目录被忽略时其中的所有文件都被忽略
+    - hidden 为 False 时与 rg 的默认行为一致，跳过以 . 开头的文件和目录
+    """
+
+    def __init__(self, root: str, hidden: bool = False):
+        self.root = os.path.abspath(root)
+        self.hidden = hidden
+        self._rules: Dict[str, List[Rule]] = {}
+        self._ignored_dirs: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, rel_dir: str) -> List[Rule]:
+        rules = self._rules.get(rel_dir)
+        if rules is not None:
+            return rules
+        directory = os.path.join(self.root, rel_dir)
+        sources = [os.path.join(directory, ".gitignore")]
+        if not rel_dir:
+            sources.insert(0, os.path.join(self.root, ".git", "info", "exclude"))
+        rules = []
+        for source in sources:
+            try:
+                with open(source, "r", encoding="utf-8", errors="ignore") as f:
+                    rules.extend(parse_gitignore(f.read()))
+            except OSError:
+                continue
+        with self._lock:
+            self._rules[rel_dir] = rules
+        return rules
+
+    def _match(self, rel: str, is_dir: bool) -> bool:
+        """只看 rel 自身是否匹配规则（不检查上级目录）。"""
+        name = rel.rsplit("/", 1)[-1]
+        if not self.hidden and name.startswith("."):
+            return True
+        if is_dir and name in IGNORE_DIRS:
+            return True
+        if not is_dir and any(name.endswith(ext) for ext in IGNORE_EXTS):
+            return True
+        ignored = False
+        parts = rel.split("/")
+        # 从根目录到最近的上级目录依次应用各级 .gitignore，后面的规则覆盖前面的
+        for depth in range(len(parts)):
+            base = "/".join(parts[:depth])
+            rules = self._load(base)
+            if not rules:
+                continue
+            sub = "/".join(parts[depth:])
+            for regex, negate, dir_only in rules:
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(sub):
+                    ignored = not negate
+        return ignored
+
+    def is_ignored(self, path: str, is_dir: Optional[bool] = None) -> bool:
+        """path 可以是绝对路径或相对于根目录的路径；根目录之外的路径视为被忽略。"""
+        rel = os.path.relpath(os.path.join(self.root, path), self.root).replace(os.sep, "/")
+        if rel == ".":
+            return False
+        if rel.startswith("../"):
+            return True
+        if is_dir is None:
+            is_dir = os.path.isdir(os.path.join(self.root, rel))
+        parts = rel.split("/")
+        for depth in range(1, len(parts)):
+            ancestor = "/".join(parts[:depth])
+            cached = self._ignored_dirs.get(ancestor)
+            if cached is None:
+                cached = self._ignored_dirs[ancestor] = self._match(ancestor, True)
+            if cached:
+                return True
+        return self._match(rel, is_dir)
+
+    def invalidate(self):
+        """.gitignore 变更后清空缓存。"""
+        with self._lock:
+            self._rules.clear()
+            self._ignored_dirs.clear()
+
+
+def walk_files(path: str, rules: Optional[IgnoreRules] = None) -> Iterator[str]:
+    """
+    遍历 path 下未被忽略的文件（按目录名、文件名排序），返回的路径以 path 开头。
+    rules 为空时使用 path 所在仓库的 .gitignore。
+    """
+    if os.path.isfile(path):
+        yield path
+        return
+    if rules is None:
+        rules = IgnoreRules(find_repo_root(path))
+    for root, dirs, names in os.walk(path, topdown=True):
+        dirs[:] = sorted(d for d in dirs if not rules.is_ignored(os.path.join(os.path.abspath(root), d), True))
+        for name in sorted(names):
+            file_path = os.path.join(root, name)
+            if not rules.is_ignored(os.path.abspath(file_path), False):
+                yield file_path
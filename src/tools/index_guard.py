@@ -0,0 +1,157 @@
+import os
+import json
+import math
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 单个文件允许进入索引的最大字节数
+DEFAULT_MAX_FILE_BYTES = 512 * 1024
+# 嗅探内容时读取的字节数
+SNIFF_BYTES = 8192
+# 与 CodeSplitter 的 max_chars 保持一致，用于估算节省的 chunk 数
+CHUNK_CHARS = 1500
+
+GENERATED_NAME_SUFFIXES = (
+    ".min.js", ".min.css", ".bundle.js", ".chunk.js", ".map",
+    ".pb.go", "_pb2.py", "_pb2_grpc.py", ".generated.ts",
+)
+GENERATED_MARKERS = (
+    "@generated",
+    "do not edit",
+    "code generated by",
+    "auto-generated",
+    "autogenerated",
+    "automatically generated",
+    "this file was generated",
+)
+
+
+def _max_file_bytes() -> int:
+    return int(os.getenv("INDEX_MAX_FILE_BYTES", str(DEFAULT_MAX_FILE_BYTES)))
+
+
+def _is_binary(sample: bytes) -> bool:
+    """NUL 字节或大量不可打印字符即视为二进制文件。"""
+    if not sample:
+        return False
+    if b"\x00" in sample:
+        return True
+    try:
+        sample.decode("utf-8")
+        return False
+    except UnicodeDecodeError as e:
+        # 采样可能恰好截断在多字节字符中间
+        if e.start >= len(sample) - 4:
+            return False
+    text_bytes = bytes(range(32, 127)) + b"\n\r\t\f\b"
+    non_text = sum(1 for b in sample if b not in text_bytes)
+    return non_text / len(sample) > 0.3
+
+
+def _entropy(text: str) -> float:
+    """字符级香农熵，base64/压缩数据通常 > 5，正常代码约 4 左右。"""
+    if not text:
+        return 0.0
+    counts = Counter(text)
+    total = len(text)
+    return -sum(c / total * math.log2(c / total) for c in counts.values())
+
+
+def _looks_minified(text: str) -> bool:
+    """超长行 + 极少空白的代码基本可以判定为压缩产物或内嵌数据块。"""
+    lines = text.splitlines() or [text]
+    longest = max(len(line) for line in lines)
+    avg = sum(len(line) for line in lines) / len(lines)
+    if longest > 1000 and avg > 200:
+        return True
+    for line in lines:
+        if len(line) < 500:
+            continue
+        whitespace = sum(1 for ch in line if ch.isspace())
+        if whitespace / len(line) < 0.02 and _entropy(line) > 4.5:
+            return True
+    return False
+
+
+def _has_generated_marker(path: str, text: str) -> bool:
+    if path.lower().endswith(GENERATED_NAME_SUFFIXES):
+        return True
+    head = "\n".join(text.splitlines()[:10]).lower()
+    return any(marker in head for marker in GENERATED_MARKERS)
+
+
+def check_file(path: str, max_bytes: Optional[int] = None) -> Optional[str]:
+    """
+    判断文件是否应跳过索引。
+
+    Returns:
+        跳过原因；返回 None 表示允许索引
+    """
+    max_bytes = _max_file_bytes() if max_bytes is None else max_bytes
+    try:
+        size = os.path.getsize(path)
+        if size > max_bytes:
+            return f"too_large ({size} bytes > {max_bytes})"
+        with open(path, "rb") as f:
+            sample = f.read(SNIFF_BYTES)
+    except OSError as e:
+        return f"unreadable ({e})"
+
+    if _is_binary(sample):
+        return "binary"
+    text = sample.decode("utf-8", errors="ignore")
+    if _has_generated_marker(path, text):
+        return "generated"
+    if _looks_minified(text):
+        return "minified"
+    return None
+
+
+def filter_files(paths: Iterable[str], max_bytes: Optional[int] = None) -> Tuple[List[str], Dict[str, str]]:
+    """
+    批量过滤候选文件。
+
+    Returns:
+        (允许索引的文件列表, 被跳过的文件 -> 原因)
+    """
+    kept, skipped = [], {}
+    for path in paths:
+        reason = check_file(str(path), max_bytes=max_bytes)
+        if reason:
+            skipped[str(path)] = reason
+        else:
+            kept.append(path)
+    return kept, skipped
+
+
+def build_ingestion_report(skipped: Dict[str, str], indexed_count: int) -> dict:
+    """汇总被跳过的文件，并估算节省的 chunk（即嵌入调用）数量。"""
+    files = []
+    skipped_bytes = 0
+    for path, reason in sorted(skipped.items()):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        skipped_bytes += size
+        files.append({"path": path, "reason": reason, "bytes": size})
+    return {
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "indexed_files": indexed_count,
+        "skipped_files": len(files),
+        "skipped_bytes": skipped_bytes,
+        "estimated_chunks_saved": math.ceil(skipped_bytes / CHUNK_CHARS),
+        "by_reason": dict(Counter(item["reason"].split(" ")[0] for item in files)),
+        "files": files,
+    }
+
+
+def write_ingestion_report(project_root: str, report: dict) -> str:
+    """将报告写入 .chaos/ingestion_report.json，返回报告路径。"""
+    chaos_dir = os.path.join(project_root, ".chaos")
+    os.makedirs(chaos_dir, exist_ok=True)
+    report_path = os.path.join(chaos_dir, "ingestion_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report_path
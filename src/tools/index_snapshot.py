@@ -0,0 +1,225 @@
+import os
+import json
+import mmap
+import struct
+import threading
+from typing import Dict, Optional, Tuple
+
+from llama_index.core.storage.kvstore.types import BaseInMemoryKVStore, DEFAULT_COLLECTION
+
+SNAPSHOT_FILENAME = "index.snap"
+SNAPSHOT_MAGIC = b"CHAOSNP1"
+SNAPSHOT_VERSION = 1
+
+# 文件头：magic, version, 记录数
+_HEADER = struct.Struct("<8sII")
+# 记录头：collection 长度, key 长度, value 长度；随后依次是 collection、key、value(JSON) 字节
+_RECORD = struct.Struct("<HII")
+
+
+class SnapshotKVStore(BaseInMemoryKVStore):
+    """
+    基于二进制快照文件的 KV 存储，用于替代 docstore.json / index_store.json。
+
+    快照由长度前缀的记录组成，加载时只扫描记录头并建立 (collection, key) -> (offset, length)
+    的指针表，value 的 JSON 只有在被访问时才解析，因此冷启动耗时与节点正文的大小无关。
+    docstore 与 index_store 使用不同的 collection 命名空间，可以共享同一个实例和同一个文件。
+    所有读写与 persist 共用一把锁：文件监听器触发的 persist 会替换并关闭旧的 mmap，
+    不能与查询线程的 get 交错执行。
+    """
+
+    def __init__(self, path: Optional[str] = None, use_mmap: bool = True) -> None:
+        self._path = path
+        self._use_mmap = use_mmap
+        self._buffer = b""
+        self._file = None
+        self._pointers: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._cache: Dict[Tuple[str, str], dict] = {}
+        self._overlay: Dict[str, Dict[str, dict]] = {}
+        self._deleted: Dict[str, set] = {}
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    # === 加载 ===
+    def _open(self, path: str):
+        """打开快照并建立指针表，不修改当前状态；返回 (文件, 缓冲区, 指针表)。"""
+        file = open(path, "rb")
+        buffer = b""
+        try:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                raise ValueError(f"快照文件为空: {path}")
+            if self._use_mmap:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = file.read()
+
+            magic, version, count = _HEADER.unpack_from(buffer, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"无法识别的快照格式: {path}")
+
+            pointers: Dict[str, Dict[str, Tuple[int, int]]] = {}
+            offset = _HEADER.size
+            for _ in range(count):
+                col_len, key_len, val_len = _RECORD.unpack_from(buffer, offset)
+                offset += _RECORD.size
+                collection = bytes(buffer[offset:offset + col_len]).decode("utf-8")
+                offset += col_len
+                key = bytes(buffer[offset:offset + key_len]).decode("utf-8")
+                offset += key_len
+                pointers.setdefault(collection, {})[key] = (offset, val_len)
+                offset += val_len
+        except Exception:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+            file.close()
+            raise
+        return file, buffer, pointers
+
+    def _load(self, path: str) -> None:
+        # 先在锁外建立新的缓冲区和指针表，再在锁内一次性替换，最后关闭旧的 mmap
+        file, buffer, pointers = self._open(path)
+        with self._lock:
+            old_file, old_buffer = self._file, self._buffer
+            self._file, self._buffer, self._pointers = file, buffer, pointers
+            self._cache.clear()
+            self._overlay.clear()
+            self._deleted.clear()
+            self._close(old_file, old_buffer)
+
+    @staticmethod
+    def _close(file, buffer) -> None:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+        if file is not None:
+            file.close()
+
+    def _read_raw(self, collection: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            pointer = self._pointers.get(collection, {}).get(key)
+            if pointer is None:
+                return None
+            offset, length = pointer
+            return bytes(self._buffer[offset:offset + length])
+
+    # === BaseKVStore 接口 ===
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        with self._lock:
+            self._overlay.setdefault(collection, {})[key] = val.copy()
+            self._deleted.get(collection, set()).discard(key)
+            self._cache.pop((collection, key), None)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            if key in self._deleted.get(collection, ()):
+                return None
+            overlay = self._overlay.get(collection)
+            if overlay is not None and key in overlay:
+                return overlay[key].copy()
+            cached = self._cache.get((collection, key))
+            if cached is None:
+                raw = self._read_raw(collection, key)
+                if raw is None:
+                    return None
+                # 懒加载：只有访问到的记录才会解析 JSON
+                cached = json.loads(raw)
+                self._cache[(collection, key)] = cached
+            return cached.copy()
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection)
+
+    def _keys(self, collection: str):
+        with self._lock:
+            deleted = self._deleted.get(collection, set())
+            keys = dict.fromkeys(self._pointers.get(collection, {}))
+            keys.update(dict.fromkeys(self._overlay.get(collection, {})))
+            return [key for key in keys if key not in deleted]
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._lock:
+            return {key: self.get(key, collection) for key in self._keys(collection)}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            existed = self.get(key, collection) is not None
+            if not existed:
+                return False
+            self._overlay.get(collection, {}).pop(key, None)
+            self._cache.pop((collection, key), None)
+            if key in self._pointers.get(collection, {}):
+                self._deleted.setdefault(collection, set()).add(key)
+            return True
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    # === 持久化 ===
+    def persist(self, persist_path: Optional[str] = None, fs=None) -> None:
+        """
+        写出快照。未修改的记录直接拷贝原始字节，不重新序列化；
+        先写临时文件再原子替换，写入过程中崩溃不会损坏已有快照。
+        """
+        persist_path = persist_path or self._path
+        dirpath = os.path.dirname(persist_path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+
+        # 写出与重新加载期间持有锁，避免期间的 put / delete 在替换时丢失
+        with self._lock:
+            collections = dict.fromkeys(self._pointers)
+            collections.update(dict.fromkeys(self._overlay))
+            records = []
+            for collection in collections:
+                overlay = self._overlay.get(collection, {})
+                for key in self._keys(collection):
+                    if key in overlay:
+                        value = json.dumps(overlay[key], ensure_ascii=False).encode("utf-8")
+                    else:
+                        value = self._read_raw(collection, key)
+                    records.append((collection.encode("utf-8"), key.encode("utf-8"), value))
+
+            tmp_path = f"{persist_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records)))
+                for collection, key, value in records:
+                    f.write(_RECORD.pack(len(collection), len(key), len(value)))
+                    f.write(collection)
+                    f.write(key)
+                    f.write(value)
+            os.replace(tmp_path, persist_path)
+
+            self._path = persist_path
+            self._load(persist_path)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs=None) -> "SnapshotKVStore":
+        return cls(persist_path)
+
+    @classmethod
+    def from_json_persist_dir(cls, persist_dir: str) -> "SnapshotKVStore":
+        """从 LlamaIndex 默认的 docstore.json / index_store.json 迁移数据（仅首次需要）。"""
+        store = cls(os.path.join(persist_dir, SNAPSHOT_FILENAME))
+        for filename in ("docstore.json", "index_store.json"):
+            json_path = os.path.join(persist_dir, filename)
+            if not os.path.exists(json_path):
+                continue
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for collection, items in data.items():
+                for key, val in items.items():
+                    store.put(key, val, collection)
+        return store
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            collections = dict.fromkeys(self._pointers)
+            collections.update(dict.fromkeys(self._overlay))
+            return {collection: self.get_all(collection) for collection in collections}
@@ -4,6 +4,7 @@ import threading
 import logging
 import time
 from typing import List, Optional
+from src.tools.digest_tools import schedule_file_summaries
 # 移除全局重型导入，改为函数内按需导入
 
 
@@ -14,9 +15,18 @@ logger = logging.getLogger(__name__)
 # 保存索引的全局变量
 _index = None
 _index_lock = threading.Lock()
-_observer = None  # watchdog observer
+_watcher_callback = None  # 在共享文件监听器上注册的回调
 _last_update_time = 0  # 防抖：记录上次更新时间
 _update_debounce_seconds = 2  # 防抖间隔
+_chroma_collection = None  # ChromaDB collection，供维护任务直接访问
+_chroma_client = None  # ChromaDB PersistentClient，打开期间不能对其 SQLite 文件执行 VACUUM
+_pending_compaction = None  # vacuum 推迟的 SQLite 压缩（db_path），在 close_index 释放客户端后执行
+_failed_deletions = set()  # 删除旧文档失败的 ref_doc_id，由 vacuum 兜底清理
+_vacuum_thread = None  # 后台 vacuum 线程
+_vacuum_stop_event = threading.Event()
+_snapshot_store = None  # docstore / index_store 共享的二进制快照存储
+
+INDEXED_EXTENSIONS = ['.py', '.js', '.ts', '.tsx', '.md', '.sh', '.go', '.java', '.html']
 
 def _initialize_settings():
     """初始化 LlamaIndex 设置"""
@@ -33,7 +43,10 @@ def _initialize_settings():
         from llama_index.llms.openai_like import OpenAILike
         from llama_index.embeddings.openai import OpenAIEmbedding
         from llama_index.core import Settings
+        from src.llm_clients import get_http_client, max_retries
         
+        # LLM 与嵌入模型共用同一个连接池客户端
+        http_client = get_http_client(base_url, api_key)
         Settings.llm = OpenAILike(
             model=str(llm_model),
             api_key=api_key,
@@ -41,6 +54,8 @@ def _initialize_settings():
             temperature=0.1,
             is_chat_model=True,
             is_function_calling_model=False,
+            max_retries=max_retries(),
+            http_client=http_client,
             system_prompt="""
             You are an expert Q&A system that is trusted around the world.
             Always answer the query using the provided context information, and not prior knowledge.
@@ -60,7 +75,9 @@ def _initialize_settings():
             model_name=str(embed_model),
             api_key=api_key,
             api_base=base_url,
-            embed_batch_size=10
+            embed_batch_size=10,
+            max_retries=max_retries(),
+            http_client=http_client
         )
         # DashScope 批量嵌入限制为 10
         Settings.embed_batch_size = 10
@@ -84,6 +101,84 @@ def load_ignore_patterns(project_root: str) -> List[str]:
     return list(set(patterns))
 
 
+def _create_reader(project_root: str):
+    """
+    按项目统一的扩展名和忽略规则创建 SimpleDirectoryReader。
+    同时过滤掉超大、二进制、压缩产物和自动生成的文件，并写出 ingestion 报告。
+    """
+    from llama_index.core import SimpleDirectoryReader
+    from src.tools.index_guard import filter_files, build_ingestion_report, write_ingestion_report
+
+    reader = SimpleDirectoryReader(
+        input_dir=project_root,
+        recursive=True,
+        required_exts=INDEXED_EXTENSIONS,
+        exclude=load_ignore_patterns(project_root),
+        filename_as_id=True  # 关键：使用文件路径作为 ID，便于更新
+    )
+
+    kept, skipped = filter_files(reader.input_files)
+    reader.input_files = kept
+    report = build_ingestion_report(skipped, indexed_count=len(kept))
+    write_ingestion_report(project_root, report)
+    if skipped:
+        logger.info(
+            f"ingestion 守卫跳过 {report['skipped_files']} 个文件 ({report['skipped_bytes']} bytes)，"
+            f"预计节省约 {report['estimated_chunks_saved']} 个 chunk 的嵌入。"
+        )
+    return reader
+
+
+def _snapshot_enabled() -> bool:
+    return os.getenv("INDEX_SNAPSHOT", "true").lower() == "true"
+
+
+def _load_storage_context(db_path: str, vector_store):
+    """
+    加载持久化的 StorageContext。
+    默认使用二进制快照（只建立指针表，节点内容按需解析），
+    首次运行时会从旧的 docstore.json / index_store.json 迁移。
+    """
+    global _snapshot_store
+    from llama_index.core import StorageContext
+
+    if _snapshot_enabled():
+        try:
+            from llama_index.core.storage.docstore import SimpleDocumentStore
+            from llama_index.core.storage.index_store import SimpleIndexStore
+            from src.tools.index_snapshot import SnapshotKVStore, SNAPSHOT_FILENAME
+
+            snapshot_path = os.path.join(db_path, SNAPSHOT_FILENAME)
+            if os.path.exists(snapshot_path):
+                kvstore = SnapshotKVStore.from_persist_path(snapshot_path)
+            else:
+                kvstore = SnapshotKVStore.from_json_persist_dir(db_path)
+            _snapshot_store = kvstore
+            return StorageContext.from_defaults(
+                docstore=SimpleDocumentStore(kvstore),
+                index_store=SimpleIndexStore(kvstore),
+                vector_store=vector_store
+            )
+        except Exception as e:
+            logger.warning(f"加载索引快照失败，回退到 JSON 存储: {e}")
+            _snapshot_store = None
+
+    try:
+        return StorageContext.from_defaults(persist_dir=db_path, vector_store=vector_store)
+    except Exception:
+        # 首次运行或加载失败，创建新的
+        return StorageContext.from_defaults(vector_store=vector_store)
+
+
+def _persist_storage(db_path: str):
+    """持久化 docstore / index_store：快照模式下只写一个二进制文件。"""
+    if _snapshot_store is not None:
+        from src.tools.index_snapshot import SNAPSHOT_FILENAME
+        _snapshot_store.persist(os.path.join(db_path, SNAPSHOT_FILENAME))
+    else:
+        _index.storage_context.persist(persist_dir=db_path)
+
+
 def _process_documents_to_nodes(documents: List):
     """
     通用函数：将 Documents 列表转换为 Nodes 列表，使用统一的分割逻辑。
@@ -146,7 +241,7 @@ def build_index(project_root: str):
     构建项目的代码索引，并存储在 ChromaDB 中。
     如果索引已存在，则加载并检查增量更新。
     """
-    global _index
+    global _index, _chroma_collection, _chroma_client
     
     if os.getenv("ENABLE_INDEXING", "false").lower() != "true":
         logger.info("索引功能已禁用 (ENABLE_INDEXING != 'true')。")
@@ -161,25 +256,17 @@ def build_index(project_root: str):
         try:
             import chromadb
             from llama_index.vector_stores.chroma import ChromaVectorStore
-            from llama_index.core import VectorStoreIndex, StorageContext
-            from llama_index.core import SimpleDirectoryReader
+            from llama_index.core import VectorStoreIndex
             
             # 初始化 ChromaDB
             db = chromadb.PersistentClient(path=db_path)
+            _chroma_client = db
             chroma_collection = db.get_or_create_collection("code_index")
+            _chroma_collection = chroma_collection
             vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
             
             # 尝试加载持久化的 StorageContext (包含 docstore)
-            try:
-                storage_context = StorageContext.from_defaults(
-                    persist_dir=db_path, 
-                    vector_store=vector_store
-                )
-            except Exception:
-                # 首次运行或加载失败，创建新的
-                storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-            ignore_patterns = load_ignore_patterns(project_root)
+            storage_context = _load_storage_context(db_path, vector_store)
 
             # 检查是否已经有索引
             if chroma_collection.count() > 0:
@@ -191,20 +278,15 @@ def build_index(project_root: str):
 
                 # === 启动时增量更新 ===
                 try:
-                    reader = SimpleDirectoryReader(
-                        input_dir=project_root,
-                        recursive=True,
-                        required_exts=['.py', '.js', '.ts', '.tsx', '.md', '.sh', '.go', '.java', '.html'],
-                        exclude=ignore_patterns,
-                        filename_as_id=True
-                    )
+                    reader = _create_reader(project_root)
+                    schedule_file_summaries(project_root, reader.input_files)
                     documents = reader.load_data()
                     
                     # refresh_ref_docs 能快速同步变更
                     refreshed_docs = _index.refresh_ref_docs(documents)
                     if any(refreshed_docs):
                         logger.info(f"检测到文件变更，已更新 {sum(refreshed_docs)} 个文档。")
-                        _index.storage_context.persist(persist_dir=db_path)
+                        _persist_storage(db_path)
                     else:
                         logger.info("未检测到文件变更。")
                 except ValueError:
@@ -215,15 +297,9 @@ def build_index(project_root: str):
             else:
                 logger.info("正在构建新索引并存入 ChromaDB...")
                 
-                reader = SimpleDirectoryReader(
-                    input_dir=project_root,
-                    recursive=True,
-                    required_exts=['.py', '.js', '.ts', '.tsx', '.md', '.sh', '.go', '.java', '.html'],
-                    exclude=ignore_patterns,
-                    filename_as_id=True  # 关键：使用文件路径作为 ID，便于更新
-                )
-                
                 try:
+                    reader = _create_reader(project_root)
+                    schedule_file_summaries(project_root, reader.input_files)
                     documents = reader.load_data()
                     nodes = _process_documents_to_nodes(documents)
                 except ValueError:
@@ -233,7 +309,7 @@ def build_index(project_root: str):
                 
                 if nodes:
                     _index = VectorStoreIndex(nodes, storage_context=storage_context)
-                    _index.storage_context.persist(persist_dir=db_path)
+                    _persist_storage(db_path)
                     logger.info(f"索引构建完成并存入 ChromaDB，路径: {db_path}")
                 else:
                     logger.warning("没有可索引的节点，跳过索引创建和持久化。")
@@ -275,6 +351,7 @@ def update_index(project_root: str, changed_file: str = None):
     with _index_lock:
         try:
             from llama_index.core import SimpleDirectoryReader
+            from src.tools.index_guard import check_file
             
             # 持久化路径
             db_path = os.path.join(project_root, ".chaos", "chroma_db")
@@ -289,11 +366,15 @@ def update_index(project_root: str, changed_file: str = None):
                     _index.delete_ref_doc(changed_file, delete_from_docstore=True)
                     logger.info(f"已清理旧索引节点: {changed_file}")
                 except Exception as del_err:
-                    # 如果文档之前不在索引中，可能会报错，忽略
+                    # 如果文档之前不在索引中，可能会报错；记录下来交给 vacuum 兜底清理
                     logger.debug(f"删除旧文档时提示: {del_err}")
+                    _failed_deletions.add(changed_file)
 
-                # 2. 如果文件仍存在（非删除操作），则加载并插入新节点
-                if os.path.exists(changed_file):
+                # 2. 如果文件仍存在（非删除操作）且通过 ingestion 守卫，则加载并插入新节点
+                skip_reason = check_file(changed_file) if os.path.exists(changed_file) else None
+                if skip_reason:
+                    logger.info(f"跳过索引 {changed_file}: {skip_reason}")
+                elif os.path.exists(changed_file):
                     reader = SimpleDirectoryReader(
                         input_files=[changed_file],
                         filename_as_id=True
@@ -304,22 +385,19 @@ def update_index(project_root: str, changed_file: str = None):
                         nodes = _process_documents_to_nodes(documents)
                         _index.insert_nodes(nodes)
                         logger.info(f"已插入新索引节点: {len(nodes)} 个")
+
+                # 同步文件摘要（文件被删除时会清理对应摘要）
+                if not skip_reason:
+                    schedule_file_summaries(project_root, [changed_file])
                 
                 # 3. 持久化
-                _index.storage_context.persist(persist_dir=db_path)
+                _persist_storage(db_path)
                 
             else:
                 # === 全量扫描更新流程 (Startup用) ===
                 logger.info("正在执行全量扫描增量更新...")
-                ignore_patterns = load_ignore_patterns(project_root)
-                
-                reader = SimpleDirectoryReader(
-                    input_dir=project_root,
-                    recursive=True,
-                    required_exts=['.py', '.js', '.ts', '.tsx', '.md', '.sh', '.go', '.java', '.html'],
-                    exclude=ignore_patterns,
-                    filename_as_id=True
-                )
+                reader = _create_reader(project_root)
+                schedule_file_summaries(project_root, reader.input_files)
                 documents = reader.load_data()
                 
                 # refresh_ref_docs 仅在 filename_as_id=True 且 index 对接了 docstore 时有效
@@ -333,7 +411,7 @@ def update_index(project_root: str, changed_file: str = None):
                 refreshed_docs = _index.refresh_ref_docs(documents)
                 if any(refreshed_docs):
                     logger.info(f"检测到文件变更，已更新 {sum(refreshed_docs)} 个文档。")
-                    _index.storage_context.persist(persist_dir=db_path)
+                    _persist_storage(db_path)
                 else:
                     logger.info("未检测到文件变更。")
                     
@@ -346,7 +424,7 @@ class IndexUpdateHandler:
     """
     def __init__(self, project_root: str):
         self.project_root = project_root
-        self.watched_extensions = {'.py', '.js', '.ts', '.tsx', '.md', '.sh', '.go', '.java', '.html'}
+        self.watched_extensions = set(INDEXED_EXTENSIONS)
     
     def _should_process(self, file_path: str) -> bool:
         if os.path.exists(file_path) and os.path.isdir(file_path):
@@ -355,81 +433,235 @@ class IndexUpdateHandler:
         ext = os.path.splitext(file_path)[1].lower()
         return ext in self.watched_extensions
     
-    def handle_event(self, event, event_type: str):
-        if hasattr(event, 'is_directory') and event.is_directory:
+    def handle_event(self, event_type: str, path: str, is_directory: bool):
+        if is_directory:
             return
             
-        src = event.src_path
-        if self._should_process(src):
-            logger.info(f"检测到文件{event_type}: {src}")
-            self._trigger_update(changed_file=src)
+        if self._should_process(path):
+            logger.info(f"检测到文件{event_type}: {path}")
+            self._trigger_update(changed_file=path)
             
     def _trigger_update(self, changed_file: str = None):
         thread = threading.Thread(target=update_index, args=(self.project_root, changed_file), daemon=True)
         thread.start()
 
+_EVENT_LABELS = {"created": "创建", "modified": "修改", "deleted": "删除"}
+
 def start_index_watcher(project_root: str):
     """
-    启动文件系统监听器，实时监控文件变化并触发增量更新。
+    在共享的文件系统监听器上注册回调，实时监控文件变化并触发增量更新。
     """
-    global _observer
+    global _watcher_callback
     
     if os.getenv("ENABLE_INDEXING", "false").lower() != "true":
         return
 
-    if _observer is not None:
+    if _watcher_callback is not None:
         logger.warning("索引监听器已在运行中。")
         return
     
-    try:
-        from watchdog.observers import Observer
-        from watchdog.events import FileSystemEventHandler
-        
-        # 创建一个继承自 FileSystemEventHandler 的具体类
-        class WatchdogHandler(FileSystemEventHandler):
-            def __init__(self, handler_logic):
-                super().__init__()
-                self.logic = handler_logic
-                
-            def on_modified(self, event):
-                self.logic.handle_event(event, "修改")
-                
-            def on_created(self, event):
-                self.logic.handle_event(event, "创建")
-                
-            def on_deleted(self, event):
-                self.logic.handle_event(event, "删除")
-                
-            def on_moved(self, event):
-                # 处理重命名/移动
-                if not event.is_directory:
-                    self.logic.handle_event(event, "移动/重命名")
-        
-        # 实例化逻辑类和适配器类
-        logic = IndexUpdateHandler(project_root)
-        handler = WatchdogHandler(logic)
-        
-        _observer = Observer()
-        _observer.schedule(handler, project_root, recursive=True)
-        _observer.start()
-        
+    from src.tools.fs_watcher import start_fs_watcher, subscribe
+
+    logic = IndexUpdateHandler(project_root)
+
+    def on_change(event_type: str, path: str, is_directory: bool):
+        logic.handle_event(_EVENT_LABELS.get(event_type, event_type), path, is_directory)
+
+    _watcher_callback = on_change
+    subscribe(on_change)
+    if start_fs_watcher(project_root):
         logger.info(f"已启动索引监听器，监控目录: {project_root}")
-    except Exception as e:
-        logger.error(f"启动索引监听器失败: {e}")
 
 def stop_index_watcher():
     """
-    停止文件系统监听器。
+    注销索引的文件变更回调（共享监听器由 fs_watcher.stop_fs_watcher 停止）。
     """
-    global _observer
+    global _watcher_callback
+    from src.tools.fs_watcher import unsubscribe
     
-    if _observer is not None:
-        _observer.stop()
-        _observer.join()
-        _observer = None
+    if _watcher_callback is not None:
+        unsubscribe(_watcher_callback)
+        _watcher_callback = None
         logger.info("已停止索引监听器。")
 
 
+def _iter_vector_entries(collection, page_size: int = 1000):
+    """分页读取 ChromaDB 中的全部条目，避免一次性加载超大 collection。"""
+    offset = 0
+    while True:
+        batch = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        ids = batch.get("ids") or []
+        if not ids:
+            break
+        for entry_id, text, metadata in zip(ids, batch.get("documents") or [], batch.get("metadatas") or []):
+            metadata = metadata or {}
+            yield {
+                "id": entry_id,
+                "ref_doc_id": metadata.get("ref_doc_id") or metadata.get("document_id"),
+                "text": text or "",
+            }
+        offset += len(ids)
+
+
+def vacuum_index(project_root: str) -> dict:
+    """
+    交叉校验 docstore、向量库与文件系统，清理索引中的垃圾数据。
+    1. 删除源文件已不存在的孤儿节点、内容已过期的节点以及重复节点
+    2. 只对缺失的节点重新嵌入，不重建整个索引
+    3. 清理失效的文档哈希，并补齐当前文档哈希，避免启动时 refresh 重复插入
+    4. 对 ChromaDB 执行 VACUUM 压缩磁盘占用，返回清理前后的对比报告；
+       客户端仍打开时 VACUUM 会与其连接冲突，推迟到 close_index() 时执行
+    """
+    global _pending_compaction
+    from src.tools.index_vacuum import plan_vacuum, dir_size, compact_sqlite, sync_docstore
+
+    if _index is None or _chroma_collection is None:
+        return {"error": "索引尚未初始化"}
+
+    db_path = os.path.join(project_root, ".chaos", "chroma_db")
+    started = time.time()
+
+    with _index_lock:
+        try:
+            from llama_index.core.schema import MetadataMode
+
+            bytes_before = dir_size(db_path)
+            vectors_before = _chroma_collection.count()
+
+            # 1. 先重试此前删除失败的旧文档
+            for ref_doc_id in list(_failed_deletions):
+                try:
+                    _index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+                except Exception as del_err:
+                    logger.debug(f"vacuum 重试删除 {ref_doc_id} 时提示: {del_err}")
+                _failed_deletions.discard(ref_doc_id)
+
+            # 2. 按当前文件系统重新切分（只切分不嵌入），得到期望的节点集合
+            try:
+                documents = _create_reader(project_root).load_data()
+            except ValueError:
+                documents = []
+            nodes = _process_documents_to_nodes(documents)
+            expected, nodes_by_ref = {}, {}
+            for node in nodes:
+                ref_doc_id = node.ref_doc_id
+                expected.setdefault(ref_doc_id, []).append(node.get_content(metadata_mode=MetadataMode.NONE))
+                nodes_by_ref.setdefault(ref_doc_id, []).append(node)
+
+            # 3. 对比向量库生成清理计划并执行
+            plan = plan_vacuum(_iter_vector_entries(_chroma_collection), expected)
+            # 源文件已不存在的文档整体删除，docstore 中的记录一并删除
+            for ref_doc_id in plan["orphan_ref_docs"]:
+                _index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            deleted_by_ref = {node_id for node_ids in plan["orphan_ref_docs"].values() for node_id in node_ids}
+            to_delete = [node_id for node_id in plan["orphan_ids"] if node_id not in deleted_by_ref]
+            to_delete += plan["stale_ids"] + plan["duplicate_ids"]
+            for start in range(0, len(to_delete), 500):
+                _chroma_collection.delete(ids=to_delete[start:start + 500])
+
+            missing_nodes = [nodes_by_ref[ref_id][position] for ref_id, position in plan["missing"]]
+            if missing_nodes:
+                _index.insert_nodes(missing_nodes)
+
+            # 4. 同步 docstore：ref_doc_info 与文档哈希一起更新
+            stale_hashes = sync_docstore(
+                _index.docstore,
+                plan["orphan_ids"] + plan["stale_ids"] + plan["duplicate_ids"],
+                {doc.id_: doc.hash for doc in documents},
+            )
+            _persist_storage(db_path)
+
+            # 5. 压缩磁盘：ChromaDB 客户端持有 SQLite 连接时跳过，记录下来在关闭客户端后执行
+            compacted = False
+            if _chroma_client is None:
+                compacted = compact_sqlite(db_path)
+            else:
+                _pending_compaction = db_path
+                logger.info("ChromaDB 客户端仍在使用，跳过 SQLite VACUUM，将在关闭索引时执行。")
+
+            report = {
+                "vectors_before": vectors_before,
+                "vectors_after": _chroma_collection.count(),
+                "bytes_before": bytes_before,
+                "bytes_after": dir_size(db_path),
+                "orphans": len(plan["orphan_ids"]),
+                "stale": len(plan["stale_ids"]),
+                "duplicates": len(plan["duplicate_ids"]),
+                "reembedded": len(missing_nodes),
+                "stale_hashes": len(stale_hashes),
+                "compacted": compacted,
+                "seconds": time.time() - started,
+            }
+            logger.info(f"索引 vacuum 完成: {report}")
+            return report
+        except Exception as e:
+            logger.error(f"索引 vacuum 时出错: {e}")
+            return {"error": str(e)}
+
+
+def close_index():
+    """
+    释放索引与 ChromaDB 客户端。
+    客户端关闭后再执行 vacuum 推迟的 SQLite 压缩，避免与客户端的连接同时操作数据库文件。
+    """
+    global _index, _chroma_collection, _chroma_client, _pending_compaction
+    from src.tools.index_vacuum import compact_sqlite
+
+    with _index_lock:
+        if _chroma_client is not None:
+            try:
+                # 停止客户端的 System，关闭其持有的 SQLite 连接
+                _chroma_client.clear_system_cache()
+            except Exception as e:
+                logger.warning(f"关闭 ChromaDB 客户端时出错: {e}")
+        _index = None
+        _chroma_collection = None
+        _chroma_client = None
+
+        if _pending_compaction is not None:
+            db_path, _pending_compaction = _pending_compaction, None
+            try:
+                compact_sqlite(db_path)
+                logger.info(f"已压缩 {db_path} 中的 SQLite 文件。")
+            except Exception as e:
+                logger.warning(f"压缩 ChromaDB SQLite 文件时出错: {e}")
+
+
+def start_index_vacuum_job(project_root: str, interval_seconds: Optional[int] = None):
+    """
+    启动后台定期 vacuum 任务。
+    间隔由 INDEX_VACUUM_INTERVAL（秒）控制，默认 6 小时，设为 0 表示禁用。
+    """
+    global _vacuum_thread
+
+    if os.getenv("ENABLE_INDEXING", "false").lower() != "true":
+        return
+
+    if interval_seconds is None:
+        interval_seconds = int(os.getenv("INDEX_VACUUM_INTERVAL", str(6 * 3600)))
+    if interval_seconds <= 0 or _vacuum_thread is not None:
+        return
+
+    def _loop():
+        while not _vacuum_stop_event.wait(interval_seconds):
+            if _index is not None:
+                vacuum_index(project_root)
+
+    _vacuum_stop_event.clear()
+    _vacuum_thread = threading.Thread(target=_loop, daemon=True)
+    _vacuum_thread.start()
+    logger.info(f"已启动索引后台 vacuum 任务，间隔 {interval_seconds} 秒。")
+
+
+def stop_index_vacuum_job():
+    """停止后台 vacuum 任务。"""
+    global _vacuum_thread
+
+    if _vacuum_thread is not None:
+        _vacuum_stop_event.set()
+        _vacuum_thread = None
+
+
 def semantic_code_search(query: str) -> str:
     """
     语义化代码库搜索工具。基于向量索引和 LLM 总结，通过自然语言查询代码/询问实现细节。
@@ -0,0 +1,145 @@
+import os
+import re
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, List
+
+# SimpleDirectoryReader 在 filename_as_id=True 时，多文档文件的 ID 形如 "<path>_part_<n>"
+_PART_SUFFIX = re.compile(r"_part_\d+$")
+
+
+def ref_doc_to_path(ref_doc_id: str) -> str:
+    """将 ref_doc_id 还原为源文件路径。"""
+    return _PART_SUFFIX.sub("", ref_doc_id or "")
+
+
+def plan_vacuum(entries: Iterable[Dict], expected: Dict[str, List[str]]) -> Dict[str, List]:
+    """
+    对比向量库中的实际条目与文件系统重新切分得到的期望节点，生成清理计划。
+
+    Args:
+        entries: 向量库条目，每项包含 id、ref_doc_id、text
+        expected: ref_doc_id -> 当前文件切分出的节点文本列表
+
+    Returns:
+        {
+            "orphan_ids": 源文件已不存在（或已不再被索引）的向量 ID,
+            "orphan_ref_docs": 孤儿向量所属的 ref_doc_id -> 向量 ID 列表（没有 ref_doc_id 的条目不在其中）,
+            "stale_ids": 源文件仍在，但内容已过期的向量 ID,
+            "duplicate_ids": 与已保留条目完全重复的向量 ID,
+            "missing": 需要重新嵌入的 (ref_doc_id, 节点序号) 列表,
+        }
+    """
+    remaining = {ref_id: Counter(texts) for ref_id, texts in expected.items()}
+    known = {ref_id: set(texts) for ref_id, texts in expected.items()}
+    plan = {"orphan_ids": [], "orphan_ref_docs": {}, "stale_ids": [], "duplicate_ids": [], "missing": []}
+
+    for entry in entries:
+        ref_id = entry.get("ref_doc_id")
+        text = entry.get("text") or ""
+        if ref_id not in remaining:
+            plan["orphan_ids"].append(entry["id"])
+            if ref_id is not None:
+                plan["orphan_ref_docs"].setdefault(ref_id, []).append(entry["id"])
+        elif remaining[ref_id][text] > 0:
+            remaining[ref_id][text] -= 1
+        elif text in known[ref_id]:
+            plan["duplicate_ids"].append(entry["id"])
+        else:
+            plan["stale_ids"].append(entry["id"])
+
+    # 剩余计数大于 0 的节点在向量库中缺失，只需嵌入这些节点
+    for ref_id, texts in expected.items():
+        counter = remaining[ref_id]
+        for position, text in enumerate(texts):
+            if counter[text] > 0:
+                counter[text] -= 1
+                plan["missing"].append((ref_id, position))
+
+    return plan
+
+
+def sync_docstore(docstore, removed_node_ids: Iterable[str], current_hashes: Dict[str, str]) -> List[str]:
+    """
+    让 docstore 与清理后的向量库保持一致，ref_doc_info 与文档哈希一起更新：
+    1. 从 ref_doc_info 中移除已删除的节点，节点全部删除的文档由 docstore 连同哈希一起删除
+    2. 删除已不在当前文件系统中的文档的 ref_doc_info 与哈希
+    3. 补齐当前文档的哈希，避免启动时 refresh 重复插入
+
+    Args:
+        docstore: LlamaIndex 的 KVDocumentStore
+        removed_node_ids: 已从向量库删除的节点 ID
+        current_hashes: 当前文件系统中的 doc_id -> 文档哈希
+
+    Returns:
+        被清理的失效文档 ID
+    """
+    # get_all_document_hashes 以哈希为键，内容相同的文档只会出现一个，需要再合并 ref_doc_info 中的文档；
+    # 节点本身也带有哈希，按是否存在于节点集合排除
+    known = dict.fromkeys(docstore.get_all_document_hashes().values())
+    known.update(dict.fromkeys(docstore.get_all_ref_doc_info() or {}))
+    known = [doc_id for doc_id in known if not docstore.document_exists(doc_id)]
+
+    for node_id in removed_node_ids:
+        docstore.delete_document(node_id, raise_error=False)
+
+    stale = [doc_id for doc_id in known if doc_id not in current_hashes]
+    for doc_id in stale:
+        # delete_ref_doc 在没有 ref_doc_info 时直接返回，文档哈希需要单独删除
+        docstore.delete_ref_doc(doc_id, raise_error=False)
+        docstore.delete_document(doc_id, raise_error=False)
+    if current_hashes:
+        docstore.set_document_hashes(current_hashes)
+    return stale
+
+
+def dir_size(path: str) -> int:
+    """递归统计目录占用的字节数。"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def compact_sqlite(db_path: str) -> bool:
+    """对 ChromaDB 的 SQLite 文件执行 VACUUM，回收删除条目占用的磁盘空间。"""
+    sqlite_path = os.path.join(db_path, "chroma.sqlite3")
+    if not os.path.exists(sqlite_path):
+        return False
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return True
+
+
+def format_bytes(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KB", "MB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+def format_vacuum_report(report: Dict) -> str:
+    """将 vacuum 结果格式化为便于在终端展示的文本。"""
+    if report.get("error"):
+        return f"索引清理失败：{report['error']}"
+    lines = [
+        "索引清理完成：",
+        f"- 向量条目：{report['vectors_before']} -> {report['vectors_after']}",
+        f"- 磁盘占用：{format_bytes(report['bytes_before'])} -> {format_bytes(report['bytes_after'])}",
+        f"- 删除孤儿节点 {report['orphans']} 个，过期节点 {report['stale']} 个，重复节点 {report['duplicates']} 个",
+        f"- 重新嵌入缺失节点 {report['reembedded']} 个",
+        f"- 清理失效文档哈希 {report['stale_hashes']} 个",
+    ]
+    if not report.get("compacted", True):
+        lines.append("- ChromaDB 客户端仍在使用，SQLite 压缩推迟到退出时执行")
+    lines.append(f"- 耗时 {report['seconds']:.1f} 秒")
+    return "\n".join(lines)
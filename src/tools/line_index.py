@@ -0,0 +1,105 @@
+import os
+import mmap
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+# 超过该大小的文件通过 mmap 建立索引，避免整个读入内存
+MMAP_THRESHOLD = 1024 * 1024
+# 最多缓存的文件索引数
+MAX_CACHED_INDEXES = 256
+
+
+class LineIndex:
+    """
+    文件的行偏移索引：offsets[i] 为第 i + 1 行起始的字节偏移，最后一项为文件大小。
+    读取任意行区间只需一次 seek + read，与文件大小无关。
+    """
+
+    def __init__(self, path: str, mtime_ns: int, size: int, offsets: np.ndarray):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, path: str) -> "LineIndex":
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            if stat.st_size == 0:
+                newlines = np.zeros(0, dtype=np.int64)
+            elif stat.st_size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = np.frombuffer(mm, dtype=np.uint8)
+                    newlines = np.flatnonzero(data == 10)
+                    # 释放对 mmap 缓冲区的引用后才能关闭
+                    del data
+            else:
+                newlines = np.flatnonzero(np.frombuffer(f.read(), dtype=np.uint8) == 10)
+        starts = newlines.astype(np.int64) + 1
+        # 最后一行没有换行符时，文件末尾也是一行的结束
+        if stat.st_size and (len(starts) == 0 or starts[-1] != stat.st_size):
+            starts = np.append(starts, stat.st_size)
+        offsets = np.concatenate(([0], starts)).astype(np.int64)
+        return cls(path, stat.st_mtime_ns, stat.st_size, offsets)
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets) - 1
+
+    def is_valid(self, stat: os.stat_result) -> bool:
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+    def byte_range(self, start_line: int, end_line: int) -> Tuple[int, int]:
+        """第 start_line 到 end_line 行（从 1 开始，包含两端）对应的字节区间。"""
+        return int(self.offsets[start_line - 1]), int(self.offsets[end_line])
+
+    def end_line_within(self, start_line: int, end_line: int, max_bytes: int) -> int:
+        """从 start_line 开始、不超过 max_bytes 字节时能读到的最后一行（至少一行）。"""
+        limit = self.offsets[start_line - 1] + max_bytes
+        last = int(np.searchsorted(self.offsets, limit, side="right")) - 1
+        return max(start_line, min(end_line, last))
+
+    def read_lines(self, start_line: int, end_line: int) -> str:
+        begin, end = self.byte_range(start_line, end_line)
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            return f.read(end - begin).decode("utf-8", errors="replace")
+
+
+_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_line_index(path: str) -> LineIndex:
+    """返回文件的行偏移索引，按 mtime / size 校验，文件变化后重建。"""
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    with _lock:
+        index = _indexes.get(abs_path)
+        if index is not None and index.is_valid(stat):
+            _indexes.move_to_end(abs_path)
+            return index
+    index = LineIndex.build(abs_path)
+    with _lock:
+        _indexes[abs_path] = index
+        _indexes.move_to_end(abs_path)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def make_cursor(next_line: int, index: LineIndex) -> str:
+    """分页游标：下一次读取的起始行 + 生成游标时文件的版本。"""
+    return f"{next_line}@{index.mtime_ns}:{index.size}"
+
+
+def parse_cursor(cursor: str) -> Tuple[int, Optional[Tuple[int, int]]]:
+    """解析分页游标，返回 (起始行, (mtime_ns, size))；格式错误时抛出 ValueError。"""
+    line, _, version = str(cursor).partition("@")
+    if not version:
+        return int(line), None
+    mtime_ns, _, size = version.partition(":")
+    return int(line), (int(mtime_ns), int(size))
@@ -0,0 +1,186 @@
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 扩展名 -> tree-sitter 语言名
+OUTLINE_LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "tsx",
+    ".go": "go",
+    ".java": "java",
+}
+
+# 各语言的导入语句、定义节点以及需要展开的包装节点（装饰器、export）
+_IMPORT_TYPES = {
+    "import_statement", "import_from_statement", "future_import_statement", "import_declaration",
+}
+_DEFINITION_TYPES = {
+    "class_definition", "function_definition",  # python
+    "class_declaration", "function_declaration", "method_definition", "generator_function_declaration",
+    "interface_declaration", "type_alias_declaration", "enum_declaration", "abstract_class_declaration",  # js / ts / java
+    "method_declaration", "constructor_declaration", "type_declaration",  # go / java
+}
+# 内部还有定义（方法）需要列出的节点
+_CONTAINER_TYPES = {
+    "class_definition", "class_declaration", "abstract_class_declaration", "interface_declaration", "enum_declaration",
+}
+_WRAPPER_TYPES = {"decorated_definition", "export_statement"}
+
+MAX_SIGNATURE_CHARS = 200
+MAX_IMPORTS = 30
+MAX_DEPTH = 2
+
+_parsers: Dict[str, object] = {}
+_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_max_cache_entries = 512
+_lock = threading.Lock()
+
+
+# tree-sitter 语言名 -> (语言包模块, 返回语言对象的函数名)，均为独立的 tree-sitter-<lang> 语言包
+_GRAMMARS = {
+    "python": ("tree_sitter_python", "language"),
+    "javascript": ("tree_sitter_javascript", "language"),
+    "typescript": ("tree_sitter_typescript", "language_typescript"),
+    "tsx": ("tree_sitter_typescript", "language_tsx"),
+    "go": ("tree_sitter_go", "language"),
+    "java": ("tree_sitter_java", "language"),
+}
+
+
+def _get_parser(language: str):
+    """使用对应的 tree-sitter-<lang> 语言包创建解析器；语言包未安装时返回 None。"""
+    if language in _parsers:
+        return _parsers[language]
+    parser = None
+    try:
+        import importlib
+        from tree_sitter import Language, Parser
+
+        module, function = _GRAMMARS[language]
+        parser = Parser(Language(getattr(importlib.import_module(module), function)()))
+    except Exception as e:
+        logger.warning(f"加载 {language} 的 tree-sitter 解析器失败: {e}")
+    _parsers[language] = parser
+    return parser
+
+
+def _one_line(text: str) -> str:
+    text = re.sub(r"\s+", " ", text).strip()
+    if len(text) > MAX_SIGNATURE_CHARS:
+        text = text[:MAX_SIGNATURE_CHARS] + "..."
+    return text
+
+
+def _node_text(source: bytes, node) -> str:
+    return source[node.start_byte:node.end_byte].decode("utf-8", errors="replace")
+
+
+def _signature(source: bytes, node) -> str:
+    """定义的签名：从节点开头到函数体 / 类体之前的部分。"""
+    body = node.child_by_field_name("body")
+    end = node.end_byte
+    if body is not None:
+        # 截止到函数体之前最后一个非注释的子节点，避免带上行尾注释
+        end = node.start_byte
+        for child in node.children:
+            if child.start_byte >= body.start_byte:
+                break
+            if child.type != "comment":
+                end = child.end_byte
+    return _one_line(source[node.start_byte:end].decode("utf-8", errors="replace")).rstrip(" {:")
+
+
+def _docstring(source: bytes, node, outer=None) -> Optional[str]:
+    """
+    文档的第一行：Python 取函数体首个字符串，其余语言取紧邻定义之前的注释。
+    outer 为包装节点（export 等）时，注释位于包装节点之前。
+    """
+    body = node.child_by_field_name("body")
+    if body is not None and body.type == "block":
+        first = body.named_children[0] if body.named_children else None
+        if first is not None and first.type == "expression_statement" and first.named_children \
+                and first.named_children[0].type == "string":
+            string = first.named_children[0]
+            parts = [c for c in string.named_children if c.type == "string_content"]
+            text = _node_text(source, parts[0]) if parts else ""
+            lines = [line.strip() for line in text.splitlines() if line.strip()]
+            return _one_line(lines[0]) if lines else None
+        return None
+    outer = outer or node
+    previous = outer.prev_named_sibling
+    if previous is not None and previous.type == "comment" and previous.end_point[0] >= outer.start_point[0] - 1:
+        text = _node_text(source, previous)
+        lines = [line.strip(" /*#\t") for line in text.splitlines()]
+        lines = [line for line in lines if line]
+        return _one_line(lines[0]) if lines else None
+    return None
+
+
+def _collect(source: bytes, node, depth: int, imports: List, entries: List):
+    for child in node.named_children:
+        target = child
+        if child.type in _WRAPPER_TYPES:
+            inner = [c for c in child.named_children if c.type in _DEFINITION_TYPES]
+            if not inner:
+                continue
+            target = inner[0]
+        if target.type in _IMPORT_TYPES and depth == 0:
+            imports.append((child.start_point[0] + 1, _one_line(_node_text(source, child))))
+        elif target.type in _DEFINITION_TYPES:
+            # 包装节点（装饰器）也计入行范围
+            signature = _signature(source, target)
+            if child.type == "decorated_definition":
+                decorators = [_one_line(_node_text(source, c)) for c in child.named_children if c.type == "decorator"]
+                signature = " ".join(decorators + [signature])
+            entries.append((depth, child.start_point[0] + 1, child.end_point[0] + 1,
+                            signature, _docstring(source, target, child)))
+            body = target.child_by_field_name("body")
+            if target.type in _CONTAINER_TYPES and body is not None and depth + 1 < MAX_DEPTH:
+                _collect(source, body, depth + 1, imports, entries)
+
+
+def build_outline(source: bytes, language: str) -> Optional[str]:
+    """
+    生成文件大纲：导入语句、类 / 函数签名及其行范围、文档的第一行。
+    没有对应的解析器时返回 None。
+    """
+    key = (hashlib.sha1(source).hexdigest(), language)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    parser = _get_parser(language)
+    if parser is None:
+        return None
+    tree = parser.parse(source)
+    imports, entries = [], []
+    _collect(source, tree.root_node, 0, imports, entries)
+
+    lines = []
+    if imports:
+        lines.append(f"导入（第 {imports[0][0]}-{imports[-1][0]} 行）：")
+        lines.extend(f"  {text}" for _, text in imports[:MAX_IMPORTS])
+        if len(imports) > MAX_IMPORTS:
+            lines.append(f"  ...（另有 {len(imports) - MAX_IMPORTS} 条导入）")
+    for depth, start, end, signature, doc in entries:
+        line = f"{'  ' * depth}L{start}-{end} {signature}"
+        if doc:
+            line += f"  # {doc}"
+        lines.append(line)
+    outline = "\n".join(lines) if lines else "（未找到导入或类 / 函数定义）"
+
+    with _lock:
+        _cache[key] = outline
+        while len(_cache) > _max_cache_entries:
+            _cache.popitem(last=False)
+    return outline
@@ -0,0 +1,339 @@
+import os
+import re
+from typing import List, Optional, Tuple
+
+from src.tools.file_tools import _atomic_write
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# 上下文匹配失败时，最多允许忽略的首尾上下文行数（与 GNU patch 的 fuzz 相同）
+MAX_FUZZ = 2
+
+
+class Hunk:
+    def __init__(self, header: str, old_start: int, old_count: Optional[int] = None, new_count: Optional[int] = None):
+        self.header = header
+        self.old_start = old_start
+        self.lines: List[Tuple[str, str]] = []  # (' ' / '-' / '+', 文本)
+        # 新文件末尾是否有换行符；None 表示补丁未涉及
+        self.eof_newline: Optional[bool] = None
+        # 头部给出的行数，用于区分以 "--- " 开头的删除行与文件头
+        self.remaining = (old_count, new_count) if old_count is not None and new_count is not None else None
+
+    def consume(self, kind: str):
+        if self.remaining is not None:
+            old, new = self.remaining
+            self.remaining = (old - (kind != "+"), new - (kind != "-"))
+
+    @property
+    def expects_more(self) -> bool:
+        return self.remaining is not None and (self.remaining[0] > 0 or self.remaining[1] > 0)
+
+    @property
+    def old_lines(self) -> List[str]:
+        return [text for kind, text in self.lines if kind != "+"]
+
+    @property
+    def new_lines(self) -> List[str]:
+        return [text for kind, text in self.lines if kind != "-"]
+
+    def trimmed(self, fuzz: int) -> Tuple[List[str], List[str], int]:
+        """去掉首尾各至多 fuzz 行上下文，返回 (旧行, 新行, 开头去掉的行数)。"""
+        lines = list(self.lines)
+        head = 0
+        while head < fuzz and lines and lines[0][0] == " ":
+            lines.pop(0)
+            head += 1
+        tail = 0
+        while tail < fuzz and lines and lines[-1][0] == " ":
+            lines.pop()
+            tail += 1
+        return [t for k, t in lines if k != "+"], [t for k, t in lines if k != "-"], head
+
+
+class FilePatch:
+    def __init__(self, old_path: Optional[str], new_path: Optional[str]):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks: List[Hunk] = []
+
+
+def _clean_path(raw: str) -> Optional[str]:
+    path = raw.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if (path.startswith("a/") or path.startswith("b/")) and not os.path.exists(path):
+        path = path[2:]
+    return path
+
+
+def parse_patch(patch: str) -> List[FilePatch]:
+    """解析统一 diff（可包含多个文件、多个 hunk），对大模型常见的不规范写法保持宽容。"""
+    files: List[FilePatch] = []
+    current: Optional[FilePatch] = None
+    hunk: Optional[Hunk] = None
+    lines = patch.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if hunk is not None and hunk.expects_more and line[:1] in (" ", "-", "+"):
+            hunk.lines.append((line[0], line[1:]))
+            hunk.consume(line[0])
+        elif line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(_clean_path(line[4:]), _clean_path(lines[i + 1][4:]))
+            files.append(current)
+            hunk = None
+            i += 2
+            continue
+        elif line.startswith("@@"):
+            if current is None:
+                raise ValueError(f"第 {i + 1} 行：hunk 之前缺少 ---/+++ 文件头")
+            match = _HUNK_HEADER.match(line)
+            if match:
+                hunk = Hunk(line.strip(), int(match.group(1)), int(match.group(2) or 1), int(match.group(4) or 1))
+            else:
+                # 没有行号的 hunk（"@@ ... @@"）只按上下文定位
+                hunk = Hunk(line.strip(), 0)
+            current.hunks.append(hunk)
+        elif hunk is not None:
+            if line.startswith("\\"):
+                # "\ No newline at end of file" 紧跟在旧文件或新文件的最后一行之后
+                previous = hunk.lines[-1][0] if hunk.lines else " "
+                hunk.eof_newline = previous == "-"
+            elif line[:1] in (" ", "-", "+"):
+                hunk.lines.append((line[0], line[1:]))
+                hunk.consume(line[0])
+            elif line == "":
+                # 大模型常把空的上下文行输出为空行
+                hunk.lines.append((" ", ""))
+                hunk.consume(" ")
+            elif line.startswith("diff ") or line.startswith("index "):
+                hunk = None
+        i += 1
+    # 去掉 hunk 末尾多余的空上下文行
+    for file_patch in files:
+        for h in file_patch.hunks:
+            while h.lines and h.lines[-1] == (" ", ""):
+                h.lines.pop()
+    return files
+
+
+def _matches(lines: List[str], pos: int, expected: List[str], loose: bool) -> bool:
+    if pos < 0 or pos + len(expected) > len(lines):
+        return False
+    if loose:
+        return all(lines[pos + k].strip() == expected[k].strip() for k in range(len(expected)))
+    return lines[pos:pos + len(expected)] == expected
+
+
+def _find(lines: List[str], expected: List[str], guess: int, loose: bool) -> Optional[int]:
+    """从预期位置向两侧搜索，返回最近的匹配位置。"""
+    if not expected:
+        return max(0, min(guess, len(lines)))
+    for distance in range(0, len(lines) + 1):
+        for pos in (guess - distance, guess + distance) if distance else (guess,):
+            if _matches(lines, pos, expected, loose):
+                return pos
+        if guess - distance < 0 and guess + distance > len(lines):
+            break
+    return None
+
+
+def _closest(lines: List[str], expected: List[str]) -> str:
+    """找不到匹配时，描述最接近的位置与第一处不同，便于修正补丁。"""
+    best, best_score = None, 0
+    stripped = [line.strip() for line in lines]
+    wanted = [line.strip() for line in expected]
+    for pos in range(0, max(1, len(lines) - len(expected) + 1)):
+        score = sum(1 for k in range(min(len(wanted), len(lines) - pos)) if stripped[pos + k] == wanted[k])
+        if score > best_score:
+            best, best_score = pos, score
+    if best is None:
+        return "文件中没有任何相似的位置"
+    for k, text in enumerate(expected):
+        actual = lines[best + k] if best + k < len(lines) else "<文件结束>"
+        if actual.strip() != text.strip():
+            return f"最接近的位置在第 {best + 1} 行（匹配 {best_score}/{len(expected)} 行），第 {best + k + 1} 行期望 {text!r}，实际为 {actual!r}"
+    return f"最接近的位置在第 {best + 1} 行"
+
+
+def _apply_hunks(lines: List[str], file_patch: FilePatch) -> Tuple[List[str], List[str], List[str]]:
+    """依次应用 hunk，返回 (新内容, 说明, 被拒绝的 hunk)。"""
+    notes, rejects = [], []
+    delta = 0  # 之前的 hunk 造成的行数变化
+    drift = 0  # 之前的 hunk 实际位置与行号的偏差，后续 hunk 大概率有相同的偏差
+    for number, hunk in enumerate(file_patch.hunks, 1):
+        guess = max(0, hunk.old_start - 1) + delta + drift
+        applied = False
+        for fuzz in range(0, MAX_FUZZ + 1):
+            old, new, head = hunk.trimmed(fuzz)
+            if fuzz and not old:
+                break
+            for loose in (False, True):
+                pos = _find(lines, old, guess + head, loose)
+                if pos is None:
+                    continue
+                if loose:
+                    # 忽略空白差异匹配时，保留文件中原有的上下文行
+                    new = _keep_original_context(hunk, fuzz, lines[pos:pos + len(old)], new)
+                lines[pos:pos + len(old)] = new
+                shift = pos - head - max(0, hunk.old_start - 1) - delta
+                details = []
+                if shift:
+                    details.append(f"偏移 {shift:+d} 行")
+                if fuzz:
+                    details.append(f"忽略 {fuzz} 行上下文")
+                if loose:
+                    details.append("忽略空白差异")
+                if details:
+                    notes.append(f"hunk #{number} {'，'.join(details)}")
+                delta += len(new) - len(old)
+                drift = shift
+                applied = True
+                break
+            if applied:
+                break
+        if not applied:
+            rejects.append(f"hunk #{number}（{hunk.header}）：找不到匹配的上下文；{_closest(lines, hunk.old_lines)}")
+    return lines, notes, rejects
+
+
+def _keep_original_context(hunk: Hunk, fuzz: int, original: List[str], new: List[str]) -> List[str]:
+    lines = list(hunk.lines)
+    for _ in range(fuzz):
+        if lines and lines[0][0] == " ":
+            lines.pop(0)
+    for _ in range(fuzz):
+        if lines and lines[-1][0] == " ":
+            lines.pop()
+    result, k = [], 0
+    for kind, text in lines:
+        if kind == " ":
+            result.append(original[k])
+            k += 1
+        elif kind == "-":
+            k += 1
+        else:
+            result.append(text)
+    return result if len(result) == len(new) else new
+
+
+def _read_lines(path: str) -> Tuple[List[str], str, bool]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        content = f.read()
+    newline = "\r\n" if "\r\n" in content else "\n"
+    return content.splitlines(), newline, content.endswith(("\n", "\r"))
+
+
+def _read_original(path: str) -> Optional[str]:
+    """读取文件修改前的内容用于回滚；文件不存在时返回 None。"""
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def apply_patch(patch: str) -> str:
+    """
+    应用统一 diff 格式（git diff / diff -u）的补丁，可包含多个文件、多个 hunk。
+    较大的修改请优先使用本工具，只需输出改动部分，而不是用 write_file 重写整个文件。
+
+    - 行号不准确时会在附近搜索上下文（允许偏移），必要时忽略空白差异或首尾最多 2 行上下文
+    - 支持新建（--- /dev/null）、删除（+++ /dev/null）与重命名文件
+    - 任何一个 hunk 无法匹配时，所有文件都不会被修改，并指出被拒绝的 hunk 及最接近的位置
+
+    Args:
+        patch: 统一 diff 文本，每个文件以 "--- 旧路径" 与 "+++ 新路径" 开头，hunk 以 "@@ -l,s +l,s @@" 开头
+
+    Returns:
+        每个文件的应用结果
+    """
+    try:
+        file_patches = parse_patch(patch)
+    except ValueError as e:
+        return f"错误：补丁格式不正确：{str(e)}"
+    if not file_patches:
+        return "错误：未找到任何文件补丁（需要以 --- 和 +++ 开头的文件头）。"
+
+    # 按真实路径记录待写入与待删除的文件，a.py 与 ./a.py 等别名视为同一个文件
+    writes, removals, report, rejects = {}, {}, [], []
+    for file_patch in file_patches:
+        old_path, new_path = file_patch.old_path, file_patch.new_path
+        display = new_path or old_path
+        old_key = os.path.realpath(old_path) if old_path else None
+        new_key = os.path.realpath(new_path) if new_path else None
+        source = writes.get(old_key)
+        if old_path is None:
+            lines, newline, trailing = [], "\n", True
+            if new_path and os.path.exists(new_path):
+                rejects.append(f"{new_path}：文件已存在，无法按新文件创建")
+                continue
+        elif source is not None:
+            _, lines, newline, trailing = source
+        elif not os.path.isfile(old_path):
+            rejects.append(f"{old_path}：文件不存在")
+            continue
+        else:
+            try:
+                lines, newline, trailing = _read_lines(old_path)
+            except Exception as e:
+                rejects.append(f"{old_path}：读取失败：{str(e)}")
+                continue
+
+        lines, notes, file_rejects = _apply_hunks(list(lines), file_patch)
+        rejects.extend(f"{display} {reject}" for reject in file_rejects)
+        if file_rejects:
+            continue
+        for h in file_patch.hunks:
+            if h.eof_newline is not None:
+                trailing = h.eof_newline
+
+        if new_path is None:
+            writes.pop(old_key, None)
+            removals[old_key] = old_path
+            report.append(f"{old_path}：已删除")
+            continue
+        writes[new_key] = (new_path, lines, newline, trailing)
+        removals.pop(new_key, None)
+        if old_key and old_key != new_key:
+            writes.pop(old_key, None)
+            removals[old_key] = old_path
+        summary = f"应用 {len(file_patch.hunks)} 个 hunk"
+        if old_path is None:
+            summary = "已创建"
+        elif old_path != new_path:
+            summary = f"由 {old_path} 重命名，{summary}"
+        report.append(f"{new_path}：{summary}" + (f"（{'；'.join(notes)}）" if notes else ""))
+
+    if rejects:
+        return "错误：补丁未应用，所有文件保持不变。\n" + "\n".join(rejects)
+
+    # 先写入全部新内容，再删除文件；任何一步失败都回滚已写入和已删除的文件
+    originals = {}
+    try:
+        for path, (_, lines, newline, trailing) in writes.items():
+            originals[path] = _read_original(path)
+            content = newline.join(lines) + (newline if trailing and lines else "")
+            _atomic_write(path, content)
+        for path in removals:
+            if os.path.exists(path):
+                originals[path] = _read_original(path)
+                os.remove(path)
+    except Exception as e:
+        for path, original in originals.items():
+            try:
+                if original is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    _atomic_write(path, original)
+            except Exception:
+                pass
+        return f"错误：写入失败：{str(e)}，已回滚所有修改。"
+
+    return "\n".join(report)
+apply_patch.tool_type = "write"  # 添加工具类型标识
+
+
+def get_patch_tools() -> list:
+    """返回补丁相关工具"""
+    return [apply_patch]
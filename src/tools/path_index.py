@@ -0,0 +1,322 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.tools.ignore import IgnoreRules, find_repo_root, glob_to_regex, walk_files
+
+logger = logging.getLogger(__name__)
+
+# 没有文件监听器时，距上次扫描超过该秒数就在查询前重新扫描
+REFRESH_SECONDS = 5.0
+# 监听器新增的路径超过该数目时重建拼接串，否则逐个匹配
+MAX_PENDING_PATHS = 1000
+# 最近修改的文件的加分：修改后 RECENCY_HALF_LIFE 秒内约为 RECENCY_BONUS 的一半
+RECENCY_BONUS = 60.0
+RECENCY_HALF_LIFE = 3600.0
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+# 路径片段的边界：目录分隔符、常见分隔符以及驼峰的大写字母
+_BOUNDARY = set("/_-. ")
+
+
+def is_glob(pattern: str) -> bool:
+    return bool(_GLOB_CHARS.search(pattern))
+
+
+def _boundaries(path: str) -> List[bool]:
+    """每个字符是否位于路径片段的开头。"""
+    flags = []
+    previous = "/"
+    for c in path:
+        flags.append(previous in _BOUNDARY or (c.isupper() and previous.islower()))
+        previous = c
+    return flags
+
+
+def _subsequence_score(query: str, text: str, boundaries: List[bool], prefer_boundary: bool = True) -> Optional[float]:
+    """
+    贪心匹配 query 的每个字符（text 已转小写）：片段开头与连续命中加分，跳过的字符扣分。
+    不是子序列时返回 None。
+    """
+    score, position, previous = 0.0, 0, -2
+    for c in query:
+        found = text.find(c, position)
+        if found == -1:
+            # 对齐到片段开头可能跳过了后续字符需要的位置，退回普通的贪心匹配
+            if prefer_boundary:
+                return _subsequence_score(query, text, boundaries, prefer_boundary=False)
+            return None
+        # 如果后面有位于片段开头的同一字符，优先对齐到片段开头
+        if prefer_boundary and not boundaries[found] and found != previous + 1:
+            boundary = next((i for i in range(found + 1, len(text)) if text[i] == c and boundaries[i]), None)
+            if boundary is not None:
+                found = boundary
+        if found == previous + 1:
+            score += 5
+        elif boundaries[found]:
+            score += 8
+        else:
+            score -= min(found - position, 10) * 0.5
+        previous, position = found, found + 1
+    return score
+
+
+class PathIndex:
+    """
+    项目文件路径的内存索引（遵循 .gitignore），由文件监听器保持最新。
+    支持 glob 匹配与模糊（子序列）匹配，按路径片段相关度和最近修改时间排序。
+    """
+
+    def __init__(self, project_root: str):
+        self.root = os.path.abspath(project_root)
+        self._ignore = IgnoreRules(find_repo_root(self.root))
+        self._mtimes: Dict[str, float] = {}  # 相对路径（/ 分隔）-> mtime
+        self._lower: Dict[str, str] = {}
+        # 所有路径（及文件名）的小写拼接，每行一个，用于正则筛选；行首偏移 -> 路径
+        self._blob: Optional[str] = None
+        self._name_blob: Optional[str] = None
+        self._blob_starts: Dict[int, str] = {}
+        self._name_starts: Dict[int, str] = {}
+        self._line_offsets: List[int] = []
+        self._blob_set: set = set()
+        self._pending: List[str] = []        # 拼接串建立后新增的路径
+        self._lock = threading.RLock()
+        self.watched = False
+        self.scanned_at = 0.0
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def build(self):
+        started = time.time()
+        mtimes = {}
+        for file_path in walk_files(self.root, self._ignore):
+            try:
+                mtimes[self._rel(file_path)] = os.stat(file_path).st_mtime
+            except OSError:
+                continue
+        with self._lock:
+            self._mtimes = mtimes
+            self._lower = {rel: rel.lower() for rel in mtimes}
+            self._blob = None
+            self._ensure_blob()
+            self.scanned_at = time.time()
+        logger.info(f"路径索引构建完成：{len(mtimes)} 个文件，耗时 {time.time() - started:.2f}s")
+
+    def _add(self, path: str):
+        rel = self._rel(path)
+        # IgnoreRules 以仓库根目录为基准，项目可能只是仓库的子目录，因此传入绝对路径
+        if rel.startswith("..") or self._ignore.is_ignored(os.path.abspath(path), False):
+            return
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        if rel not in self._mtimes:
+            self._lower[rel] = rel.lower()
+            if self._blob is not None and rel not in self._blob_set:
+                self._pending.append(rel)
+                if len(self._pending) > MAX_PENDING_PATHS:
+                    self._blob = None
+        self._mtimes[rel] = mtime
+
+    def _remove_prefix(self, rel: str):
+        prefix = rel + "/"
+        removed = [known for known in self._mtimes if known == rel or known.startswith(prefix)]
+        # 已删除的路径在查询时按 _mtimes 过滤，不需要重建拼接串
+        for known in removed:
+            del self._mtimes[known]
+            del self._lower[known]
+
+    def on_change(self, event_type: str, path: str, is_directory: bool):
+        """文件监听器回调。"""
+        if os.path.basename(path) == ".gitignore":
+            self._ignore.invalidate()
+            self.build()
+            return
+        with self._lock:
+            if event_type == "deleted":
+                self._remove_prefix(self._rel(path))
+            elif is_directory:
+                # 移入的目录不会为其中的文件产生单独的事件
+                if event_type == "created" and not self._ignore.is_ignored(os.path.abspath(path), True):
+                    for file_path in walk_files(path, self._ignore):
+                        self._add(file_path)
+            else:
+                self._add(path)
+
+    def _ensure_fresh(self):
+        if not self.watched and time.time() - self.scanned_at > REFRESH_SECONDS:
+            self.build()
+
+    # ---------- 查询 ----------
+
+    def _recency(self, rel: str, now: float) -> float:
+        age = max(0.0, now - self._mtimes.get(rel, 0.0))
+        return RECENCY_BONUS * RECENCY_HALF_LIFE / (RECENCY_HALF_LIFE + age)
+
+    def _ensure_blob(self):
+        if self._blob is not None:
+            return
+        paths = sorted(self._mtimes)
+        self._blob_starts, self._name_starts = {}, {}
+        lines, names = [], []
+        offset = name_offset = 0
+        for rel in paths:
+            lower = self._lower[rel]
+            name = lower[lower.rfind("/") + 1:]
+            self._blob_starts[offset] = rel
+            self._name_starts[name_offset] = rel
+            lines.append(lower)
+            names.append(name)
+            offset += len(lower) + 1
+            name_offset += len(name) + 1
+        self._blob = "\n".join(lines) + "\n"
+        self._name_blob = "\n".join(names) + "\n"
+        self._line_offsets = sorted(self._blob_starts)
+        self._blob_set = set(paths)
+        self._pending = []
+
+    def _search_blob(self, regex, names: bool = False, anchored: bool = True) -> List[str]:
+        """
+        在所有路径（names=True 时为文件名）的小写拼接上执行不跨行的正则，比逐个路径调用 Python 函数快得多。
+        anchored 为 True 时正则从行首开始；否则每次命中后跳到下一行继续搜索（以字面字符开头的正则更快）。
+        """
+        self._ensure_blob()
+        blob, starts = (self._name_blob, self._name_starts) if names else (self._blob, self._blob_starts)
+        if anchored:
+            matched = [starts[match.start()] for match in regex.finditer(blob)]
+        else:
+            matched, position, offsets = [], 0, self._line_offsets
+            while True:
+                match = regex.search(blob, position)
+                if match is None:
+                    break
+                line = bisect.bisect_right(offsets, match.start()) - 1
+                matched.append(starts[offsets[line]])
+                position = offsets[line + 1] if line + 1 < len(offsets) else len(blob)
+        for rel in self._pending:
+            lower = self._lower.get(rel)
+            text = lower[lower.rfind("/") + 1:] if names and lower is not None else lower
+            if text is not None and (regex.match(text) if anchored else regex.search(text)):
+                matched.append(rel)
+        return [rel for rel in matched if rel in self._mtimes]
+
+    def _glob(self, pattern: str) -> List[Tuple[float, str]]:
+        now = time.time()
+        pattern = pattern.lower()
+        if pattern.startswith("./"):
+            pattern = pattern[2:]
+        body = glob_to_regex(pattern.lstrip("/")).replace("[^/]", "[^/\n]")
+        # 不含 / 时与 find -name 一样只匹配文件名（不区分大小写）
+        names = "/" not in pattern
+        matched = self._search_blob(re.compile("^" + body + "$", re.MULTILINE), names=names)
+        # 层级浅、最近修改的文件优先
+        mtimes, bonus, half_life = self._mtimes, RECENCY_BONUS * RECENCY_HALF_LIFE, RECENCY_HALF_LIFE
+        return [
+            (bonus / (half_life + max(0.0, now - mtimes[rel])) - rel.count("/") * 2 - len(rel) * 0.05, rel)
+            for rel in matched
+        ]
+
+    def _fuzzy(self, query: str) -> List[Tuple[float, str]]:
+        now = time.time()
+        query = query.lower().replace("\\", "/").strip("/")
+        if not query:
+            # 只包含分隔符（如 "/"）时表示整个项目：所有文件按层级与最近修改时间排序
+            return [(self._recency(rel, now) - rel.count("/") * 2 - len(rel) * 0.05, rel) for rel in self._mtimes]
+        results = []
+        # 以第一个字符开头，之后逐字符匹配最左子序列；字符类排除了下一个字符，匹配是线性的
+        pattern = re.escape(query[0]) + "".join(f"[^\\n{re.escape(c)}]*{re.escape(c)}" for c in query[1:])
+        for rel in self._search_blob(re.compile(pattern), anchored=False):
+            lower = self._lower[rel]
+            name_start = lower.rfind("/") + 1
+            name = lower[name_start:]
+            if name == query:
+                score = 1000.0
+            elif name.startswith(query) or os.path.splitext(name)[0] == query:
+                score = 800.0
+            elif query in name:
+                score = 600.0
+            elif query in lower:
+                # 从片段开头开始的子串优先
+                at = lower.find(query)
+                score = 450.0 if at == 0 or lower[at - 1] in _BOUNDARY else 400.0
+            else:
+                boundaries = _boundaries(rel)
+                name_score = _subsequence_score(query, name, boundaries[name_start:])
+                if name_score is not None:
+                    score = 300.0 + name_score
+                else:
+                    path_score = _subsequence_score(query, lower, boundaries)
+                    if path_score is None:
+                        continue
+                    score = 100.0 + path_score
+            score += self._recency(rel, now) - rel.count("/") * 2 - len(rel) * 0.05
+            results.append((score, rel))
+        return results
+
+    def find(self, pattern: str, limit: int = 20) -> Tuple[List[str], int]:
+        """返回 (按相关度排序的前 limit 个相对路径, 匹配总数)。"""
+        with self._lock:
+            self._ensure_fresh()
+            pattern = pattern.strip()
+            if not pattern:
+                return [], 0
+            scored = self._glob(pattern) if is_glob(pattern) else self._fuzzy(pattern)
+        top = heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1]))
+        return [rel for _, rel in top], len(scored)
+
+
+_indexes: Dict[str, PathIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_path_index(project_root: str) -> PathIndex:
+    """按项目根目录共享的路径索引，首次使用时同步构建。"""
+    root = os.path.abspath(project_root)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = PathIndex(root)
+    if not index.scanned_at:
+        with index._lock:
+            if not index.scanned_at:
+                index.build()
+    return index
+
+
+def start_path_index(project_root: str):
+    """在后台构建路径索引，并注册到共享的文件监听器上保持最新。"""
+    from src.tools.fs_watcher import start_fs_watcher, subscribe
+
+    root = os.path.abspath(project_root)
+    with _indexes_lock:
+        index = _indexes.setdefault(root, PathIndex(root))
+    subscribe(index.on_change)
+    index.watched = start_fs_watcher(root)
+
+    def build():
+        try:
+            with index._lock:
+                if not index.scanned_at:
+                    index.build()
+        except Exception as e:
+            logger.error(f"构建路径索引失败: {e}")
+
+    threading.Thread(target=build, daemon=True).start()
+
+
+def stop_path_index():
+    """注销所有路径索引的文件监听回调。"""
+    from src.tools.fs_watcher import unsubscribe
+
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        unsubscribe(index.on_change)
+        index.watched = False
@@ -0,0 +1,166 @@
+import os
+import difflib
+import hashlib
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+# 当前执行工具的读取会话：(会话键, 当前轮次)，由 track_read_session 设置
+_read_session = ContextVar("read_session", default=None)
+
+# 返回给 Agent 的简短结果的前缀；SupersessionPruner 据此判断它们不能取代之前的完整读取
+UNCHANGED_MARKER = "[文件未修改]"
+DIFF_MARKER = "[文件已修改，仅显示差异]"
+
+# 共享内容缓存的总字符数上限、单个文件上限以及最多保留的会话数
+MAX_CACHED_CHARS = 32 * 1024 * 1024
+MAX_FILE_CHARS = 2 * 1024 * 1024
+MAX_SESSIONS = 32
+# 差异超过新内容的该比例时，直接返回全文
+MAX_DIFF_RATIO = 0.5
+
+
+def is_partial_read(content: str) -> bool:
+    """read_file 的输出是否只是“未修改”说明或差异，而不是完整内容。"""
+    return isinstance(content, str) and (content.startswith(UNCHANGED_MARKER) or content.startswith(DIFF_MARKER))
+
+
+def conversation_id(messages) -> str:
+    """
+    对话标识：第一条非 system 消息内容的 sha1。
+    执行工具的 agent、上下文压缩器与超长恢复拿到的消息列表不同（后者带 system 消息），据此对应到同一对话。
+    """
+    first = next((message.get("content") for message in messages or [] if message.get("role") != "system"), None)
+    return hashlib.sha1(str(first).encode("utf-8", errors="ignore")).hexdigest()
+
+
+def track_read_session(agent):
+    """
+    包装执行工具的 agent 的 generate_reply，记录当前对话与轮次（消息序号）。
+    同一 agent 在同一对话中再次读取未修改的文件时，read_file 只返回简短说明或差异。
+    """
+    original_generate_reply = agent.generate_reply
+
+    def generate_reply(*args, **kwargs):
+        messages = kwargs.get("messages", args[0] if args else None)
+        sender = kwargs.get("sender", args[1] if len(args) > 1 else None)
+        if messages is None and sender is not None:
+            messages = agent.chat_messages.get(sender)
+        messages = messages or []
+        token = _read_session.set(((agent.name, getattr(sender, "name", None), conversation_id(messages)), len(messages)))
+        try:
+            return original_generate_reply(*args, **kwargs)
+        finally:
+            _read_session.reset(token)
+
+    agent.generate_reply = generate_reply
+    return agent
+
+
+class SessionReadCache:
+    """
+    会话级的文件读取缓存：
+    - 文件内容按 (路径, mtime_ns, size, inode) 全局共享，多个 Agent 读取同一版本时只读一次磁盘
+    - 每个会话记录自己读到的版本与轮次，用于返回“未修改”说明或差异
+    """
+
+    def __init__(self):
+        self._contents: "OrderedDict[tuple, str]" = OrderedDict()
+        self._cached_chars = 0
+        self._seen: "OrderedDict[tuple, Dict[str, Tuple[tuple, int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(path: str) -> tuple:
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _load(self, version: tuple) -> str:
+        with self._lock:
+            content = self._contents.get(version)
+            if content is not None:
+                self._contents.move_to_end(version)
+                return content
+        with open(version[0], "r", encoding="utf-8") as f:
+            content = f.read()
+        if len(content) <= MAX_FILE_CHARS:
+            with self._lock:
+                if version not in self._contents:
+                    self._contents[version] = content
+                    self._cached_chars += len(content)
+                while self._cached_chars > MAX_CACHED_CHARS and self._contents:
+                    _, evicted = self._contents.popitem(last=False)
+                    self._cached_chars -= len(evicted)
+        return content
+
+    def _session(self, key: tuple) -> Dict[str, Tuple[tuple, int]]:
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is None:
+                seen = self._seen[key] = {}
+                while len(self._seen) > MAX_SESSIONS:
+                    self._seen.popitem(last=False)
+            self._seen.move_to_end(key)
+            return seen
+
+    def invalidate(self, conversation: str, before_turn: Optional[int] = None) -> None:
+        """
+        上下文压缩或超长恢复移除了对话中的消息后调用：忘记该对话所有会话在 before_turn 之前（None 表示全部）
+        的读取记录，之后的读取返回完整内容，“未修改”说明不会指向已经不在上下文中的输出。
+        """
+        with self._lock:
+            sessions = [seen for key, seen in self._seen.items() if key[2] == conversation]
+        for seen in sessions:
+            for path, (_, turn) in list(seen.items()):
+                if before_turn is None or turn < before_turn:
+                    seen.pop(path, None)
+
+    def read(self, path: str, force: bool = False) -> str:
+        session = _read_session.get()
+        if session is None:
+            # 不在 Agent 会话中（例如直接调用），保持原始行为
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+
+        session_key, turn = session
+        abs_path = os.path.abspath(path)
+        version = self._version(abs_path)
+        content = self._load(version)
+        seen = self._session(session_key)
+        previous = seen.get(abs_path)
+        if previous is None or force:
+            seen[abs_path] = (version, turn)
+            return content
+
+        # 返回“未修改”说明时保留原来的轮次，始终指向 Agent 上下文中完整内容所在的位置
+        previous_version, previous_turn = previous
+        if previous_version == version:
+            return self._unchanged(path, previous_turn)
+        with self._lock:
+            old_content = self._contents.get(previous_version)
+        if old_content == content:
+            seen[abs_path] = (version, previous_turn)
+            return self._unchanged(path, previous_turn)
+        seen[abs_path] = (version, turn)
+        if old_content is None:
+            return content
+        diff = "".join(difflib.unified_diff(
+            old_content.splitlines(keepends=True),
+            content.splitlines(keepends=True),
+            fromfile=f"{path}（第 {previous_turn} 轮）",
+            tofile=f"{path}（当前）",
+        ))
+        if len(diff) > len(content) * MAX_DIFF_RATIO:
+            return content
+        return f"{DIFF_MARKER} '{path}' 自你在第 {previous_turn} 轮读取后已被修改，差异如下：\n{diff}"
+
+    @staticmethod
+    def _unchanged(path: str, turn: int) -> str:
+        return (
+            f"{UNCHANGED_MARKER} '{path}' 自你在第 {turn} 轮读取后没有变化，内容与当时相同。"
+            f"如果上下文中已经看不到当时的内容，请使用 force=True 重新读取。"
+        )
+
+
+read_cache = SessionReadCache()
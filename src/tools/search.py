@@ -0,0 +1,482 @@
+import os
+import re
+import json
+import mmap
+import shutil
+import fnmatch
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from src.tools.ignore import IgnoreRules, find_repo_root, walk_files
+
+# 超过该长度的行只显示开头部分
+MAX_LINE_CHARS = 500
+# 达到 max_matches 后继续统计被省略的匹配数，最多统计到该数目就终止搜索
+MAX_OMITTED_COUNT = 1000
+
+# 索引给出的候选文件超过该数目时不再使用索引（筛选效果差，且命令行参数过长）
+MAX_INDEX_CANDIDATES = 2000
+
+# Python 回退实现的并行进程数；文件数少于 PARALLEL_MIN_FILES 时在当前进程内扫描
+SEARCH_WORKERS = int(os.getenv("SEARCH_FALLBACK_WORKERS", str(min(8, os.cpu_count() or 1))))
+PARALLEL_MIN_FILES = 200
+# 每个任务扫描的文件数
+CHUNK_FILES = 64
+# 判断二进制文件时检查的前缀字节数（与 ripgrep 一样按 NUL 字节判断）
+BINARY_SNIFF_BYTES = 8192
+# Python 回退实现支持的 file_type（ripgrep 的 --type 名称的子集）
+FILE_TYPES = {
+    "py": [".py", ".pyi"],
+    "js": [".js", ".jsx", ".mjs", ".cjs"],
+    "ts": [".ts", ".tsx", ".mts", ".cts"],
+    "go": [".go"],
+    "java": [".java"],
+    "rust": [".rs"],
+    "c": [".c", ".h"],
+    "cpp": [".cpp", ".cc", ".cxx", ".hpp", ".hh", ".h"],
+    "md": [".md", ".markdown"],
+    "json": [".json"],
+    "yaml": [".yaml", ".yml"],
+    "toml": [".toml"],
+    "html": [".html", ".htm"],
+    "css": [".css", ".scss"],
+    "sh": [".sh", ".bash"],
+}
+
+# 每个文件的结果：[(行号, 行内容, 是否为匹配行)]
+Groups = "OrderedDict[str, List[Tuple[int, str, bool]]]"
+
+
+class SearchError(Exception):
+    """搜索参数无效（例如正则表达式错误）或搜索进程失败。"""
+
+
+def _clip(text: str) -> str:
+    text = text.rstrip("\r\n")
+    if len(text) > MAX_LINE_CHARS:
+        text = text[:MAX_LINE_CHARS] + "..."
+    return text
+
+
+def _as_list(value: Union[str, Sequence[str], None]) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def search_with_ripgrep(
+    query: str,
+    path: str,
+    max_matches: int,
+    is_regex: bool = False,
+    glob: Union[str, Sequence[str], None] = None,
+    file_type: Optional[str] = None,
+    context_lines: int = 0,
+    files: Optional[Sequence[str]] = None,
+) -> Optional[Tuple[Groups, int, int, bool]]:
+    """
+    流式读取 `rg --json` 的输出，达到全局上限后只继续统计被省略的匹配数，统计满后终止进程。
+    找不到 rg 时返回 None；返回 (结果, 显示的匹配数, 省略的匹配数, 省略数是否精确)。
+    files 不为空时只在这些文件中搜索（用于索引缩小候选范围后的验证）。
+    """
+    rg = shutil.which("rg")
+    if rg is None:
+        return None
+
+    cmd = [rg, "--json", "--no-config"]
+    if not is_regex:
+        cmd.append("--fixed-strings")
+    if context_lines > 0:
+        cmd += ["--context", str(context_lines)]
+    for pattern in _as_list(glob):
+        cmd += ["--glob", pattern]
+    if file_type:
+        cmd += ["--type", file_type]
+    cmd += ["--", query]
+    cmd += list(files) if files else [path]
+
+    groups: Groups = OrderedDict()
+    shown = omitted = 0
+    last_match: Tuple[Optional[str], int] = (None, 0)
+    killed = False
+    # stderr 写入临时文件：如果用管道且在读完 stdout 之后才读取，rg 输出大量警告（例如大量
+    # “Permission denied”）时会因管道写满而阻塞，读取 stdout 的循环随之挂起
+    stderr_file = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+    try:
+        for raw in proc.stdout:
+            event = json.loads(raw)
+            kind = event.get("type")
+            if kind not in ("match", "context"):
+                continue
+            data = event["data"]
+            file_path = data["path"].get("text")
+            text = data["lines"].get("text")
+            line_number = data.get("line_number")
+            if file_path is None or text is None or line_number is None:
+                continue
+            if kind == "match":
+                if shown >= max_matches:
+                    omitted += 1
+                    if omitted >= MAX_OMITTED_COUNT:
+                        killed = True
+                        break
+                    continue
+                shown += 1
+                last_match = (file_path, line_number)
+            elif shown >= max_matches:
+                # 达到上限后只保留最后一条匹配之后的上下文
+                if file_path != last_match[0] or line_number > last_match[1] + context_lines:
+                    continue
+            groups.setdefault(file_path, []).append((line_number, _clip(text), kind == "match"))
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.communicate()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+        stderr_file.close()
+    # 退出码 1 表示没有匹配，2 表示出错（部分文件不可读时也会返回 2，此时仍使用已有结果）
+    if not killed and proc.returncode == 2 and not groups:
+        message = stderr.decode("utf-8", errors="replace").strip()
+        raise SearchError(message or "ripgrep 执行失败")
+    return groups, shown, omitted, not killed
+
+
+def _glob_allows(name: str, relative: str, glob: List[str]) -> bool:
+    """与 rg --glob 一致：以 ! 开头的模式表示排除；存在包含模式时文件必须至少匹配其中一个。"""
+    matches = lambda g: fnmatch.fnmatch(name, g) or fnmatch.fnmatch(relative, g)
+    includes = [g for g in glob if not g.startswith("!")]
+    if any(matches(g[1:]) for g in glob if g.startswith("!")):
+        return False
+    return not includes or any(matches(g) for g in includes)
+
+
+def _iter_files(path: str, glob: List[str], extensions: Optional[List[str]]):
+    """遍历 path 下未被 .gitignore 忽略的文件，并按 glob / 扩展名过滤。"""
+    rules = IgnoreRules(find_repo_root(path))
+    for file_path in walk_files(path, rules):
+        name = os.path.basename(file_path)
+        if extensions is not None and not any(name.endswith(ext) for ext in extensions):
+            continue
+        if glob and not _glob_allows(name, os.path.relpath(file_path, path), glob):
+            continue
+        yield file_path
+
+
+# 工作进程中的共享状态：全局终止信号与已找到的匹配数，由 _init_worker 设置
+_stop_event = None
+_found = None
+
+# 主进程中复用的进程池及其共享状态，首次并行搜索时创建；同一时间只有一次搜索使用进程池
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_state = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(stop_event, found):
+    global _stop_event, _found
+    _stop_event, _found = stop_event, found
+
+
+def _mp_context():
+    """
+    进程池的启动方式。主进程中运行着文件监听、后台压缩与 HTTP 客户端等线程，
+    fork 出的子进程可能继承被其他线程持有的锁，因此使用 forkserver（不可用时用 spawn）。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_pool() -> Tuple[ProcessPoolExecutor, tuple]:
+    """返回复用的进程池及其 (终止信号, 匹配计数)；调用方需持有 _pool_lock。"""
+    global _pool, _pool_state
+    if _pool is None:
+        context = _mp_context()
+        _pool_state = (context.Event(), context.Value("q", 0))
+        _pool = ProcessPoolExecutor(SEARCH_WORKERS, mp_context=context, initializer=_init_worker,
+                                    initargs=_pool_state)
+    return _pool, _pool_state
+
+
+def _discard_pool():
+    """丢弃进程池（不加锁），返回被丢弃的进程池。"""
+    global _pool, _pool_state
+    pool, _pool, _pool_state = _pool, None, None
+    return pool
+
+
+def shutdown_search_workers():
+    """关闭回退搜索复用的进程池（程序退出时调用）。"""
+    with _pool_lock:
+        pool = _discard_pool()
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _line_at(mm, pos: int, size: int) -> Tuple[int, int]:
+    """pos 所在行的起止偏移（不含换行符）。"""
+    start = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos)
+    return start, size if end == -1 else end
+
+
+def _decode(data: bytes) -> str:
+    return _clip(data.decode("utf-8", errors="replace"))
+
+
+def _scan_file(file_path: str, needle: Optional[bytes], regex, context_lines: int, limit: int, stop_at: int):
+    """
+    用内存映射在原始字节中查找匹配，只解码匹配行及其上下文。
+    返回 (结果条目, 匹配行数)；结果中最多包含 limit 个匹配行，其余只计数，计数到 stop_at 为止。
+    """
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return [], 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(b"\0", 0, min(size, BINARY_SNIFF_BYTES)) != -1:
+                return [], 0
+            lines: Dict[int, Tuple[str, bool]] = {}
+            count = 0
+            line_no, counted_to = 1, 0
+            pos = 0
+            matches = regex.finditer(mm) if regex is not None else None
+            while True:
+                if matches is not None:
+                    match = next(matches, None)
+                    if match is None:
+                        break
+                    hit = match.start()
+                    if hit < pos:
+                        continue  # 同一行内的后续匹配
+                    if hit == size and mm[size - 1:size] == b"\n":
+                        break  # 末尾换行之后没有内容
+                else:
+                    hit = mm.find(needle, pos)
+                    if hit == -1:
+                        break
+                start, end = _line_at(mm, hit, size)
+                pos = end + 1
+                count += 1
+                if count <= limit:
+                    # 只在需要输出时才统计行号，超出 limit 的匹配只计数
+                    line_no += mm[counted_to:start].count(b"\n")
+                    counted_to = start
+                    lines[line_no] = (_decode(mm[start:end]), True)
+                    if context_lines:
+                        before, number = start, line_no
+                        for _ in range(context_lines):
+                            if before == 0:
+                                break
+                            before_start = mm.rfind(b"\n", 0, before - 1) + 1
+                            number -= 1
+                            lines.setdefault(number, (_decode(mm[before_start:before - 1]), False))
+                            before = before_start
+                        after, number = end, line_no
+                        for _ in range(context_lines):
+                            if after >= size - 1:
+                                break
+                            after_end = mm.find(b"\n", after + 1)
+                            after_end = size if after_end == -1 else after_end
+                            number += 1
+                            lines.setdefault(number, (_decode(mm[after + 1:after_end]), False))
+                            after = after_end
+                elif count >= stop_at or (count % 256 == 0 and _stop_event.is_set()):
+                    break
+                if pos >= size:
+                    break
+            # 后面匹配行的上下文可能先被记为上下文行，匹配行优先
+            return [(number, text, is_match) for number, (text, is_match) in sorted(lines.items())], count
+
+
+def _scan_chunk(files: List[str], needle: Optional[bytes], pattern: Optional[bytes], context_lines: int,
+                limit: int, stop_at: int) -> List[Tuple[str, list, int]]:
+    """扫描一组文件；全局匹配数达到 stop_at 后所有任务尽快结束。"""
+    regex = re.compile(pattern, re.MULTILINE) if pattern is not None else None
+    results = []
+    for file_path in files:
+        if _stop_event.is_set():
+            break
+        try:
+            entries, count = _scan_file(file_path, needle, regex, context_lines, limit, stop_at)
+        except (OSError, ValueError):
+            continue
+        if not count:
+            continue
+        results.append((file_path, entries, count))
+        limit = max(0, limit - count)
+        with _found.get_lock():
+            _found.value += count
+            if _found.value >= stop_at:
+                _stop_event.set()
+    return results
+
+
+def _take(entries: list, keep: int, context_lines: int) -> list:
+    """只保留前 keep 个匹配行及其上下文。"""
+    if keep <= 0:
+        return []
+    kept, matches, last = [], 0, None
+    for line_no, text, is_match in entries:
+        if matches >= keep and (is_match or line_no > last + context_lines):
+            break
+        if is_match:
+            matches += 1
+            last = line_no
+        kept.append((line_no, text, is_match))
+    return kept
+
+
+def search_with_python(
+    query: str,
+    path: str,
+    max_matches: int,
+    is_regex: bool = False,
+    glob: Union[str, Sequence[str], None] = None,
+    file_type: Optional[str] = None,
+    context_lines: int = 0,
+    files: Optional[Sequence[str]] = None,
+) -> Tuple[Groups, int, int, bool]:
+    """
+    不依赖 ripgrep 的回退实现，参数与返回值同 search_with_ripgrep。
+    文件较多时分块交给进程池并行扫描，全局匹配数达到上限后通知所有工作进程停止。
+    """
+    needle, pattern = None, None
+    if is_regex or not query:
+        pattern = query.encode("utf-8")
+        try:
+            re.compile(pattern, re.MULTILINE)
+        except re.error as e:
+            raise SearchError(f"无效的正则表达式：{e}")
+    else:
+        needle = query.encode("utf-8")
+    extensions = None
+    if file_type:
+        if file_type not in FILE_TYPES:
+            raise SearchError(f"不支持的文件类型 '{file_type}'，可用类型：{', '.join(sorted(FILE_TYPES))}")
+        extensions = FILE_TYPES[file_type]
+
+    candidates = list(files) if files else list(_iter_files(path, _as_list(glob), extensions))
+    chunks = [candidates[i:i + CHUNK_FILES] for i in range(0, len(candidates), CHUNK_FILES)]
+    stop_at = max_matches + MAX_OMITTED_COUNT
+    args = (needle, pattern, context_lines, max_matches, stop_at)
+
+    results = []
+    if SEARCH_WORKERS > 1 and len(candidates) >= PARALLEL_MIN_FILES:
+        with _pool_lock:
+            executor, (stop_event, found) = _get_pool()
+            stop_event.clear()
+            found.value = 0
+            futures = [executor.submit(_scan_chunk, chunk, *args) for chunk in chunks]
+            try:
+                # 按提交顺序收集结果，保证输出顺序与文件顺序一致
+                for future in futures:
+                    try:
+                        results.extend(future.result())
+                    except CancelledError:
+                        continue
+                    if stop_event.is_set():
+                        break
+            except BrokenProcessPool:
+                # 工作进程异常退出后进程池不可再用，下次搜索时重新创建
+                _discard_pool()
+                raise SearchError("搜索工作进程异常退出，请重试")
+            finally:
+                # 取消尚未开始的任务，并等待正在运行的任务结束，再把进程池交给下一次搜索
+                stop_event.set()
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+            stopped = found.value >= stop_at
+    else:
+        stop_event = multiprocessing.Event()
+        _init_worker(stop_event, multiprocessing.Value("q", 0))
+        for chunk in chunks:
+            results.extend(_scan_chunk(chunk, *args))
+            if stop_event.is_set():
+                break
+        stopped = stop_event.is_set()
+
+    groups: Groups = OrderedDict()
+    shown = omitted = 0
+    for file_path, entries, count in results:
+        kept = _take(entries, max_matches - shown, context_lines)
+        kept_matches = sum(1 for entry in kept if entry[2])
+        if kept:
+            groups[file_path] = kept
+        shown += kept_matches
+        omitted += count - kept_matches
+    return groups, shown, omitted, not stopped
+
+
+def narrow_with_index(
+    query: str,
+    path: str,
+    is_regex: bool = False,
+    glob: Union[str, Sequence[str], None] = None,
+    file_type: Optional[str] = None,
+) -> Optional[List[str]]:
+    """
+    用三元组索引缩小候选文件范围，返回需要验证搜索的文件（路径写法与直接搜索 path 时一致）。
+    索引未就绪、查询为正则、过短或候选文件过多时返回 None，由调用方直接搜索整个 path。
+    """
+    from src.tools.trigram_index import get_search_index
+
+    index = get_search_index()
+    if index is None or is_regex or (file_type and file_type not in FILE_TYPES):
+        return None
+    root = os.path.abspath(path)
+    if os.path.commonpath([root, index.root]) != index.root or not os.path.isdir(root):
+        return None
+    candidates = index.candidates(query, limit=MAX_INDEX_CANDIDATES)
+    if candidates is None:
+        return None
+
+    extensions = FILE_TYPES.get(file_type) if file_type else None
+    patterns = _as_list(glob)
+    files = []
+    for rel in candidates:
+        absolute = os.path.join(index.root, rel)
+        if root != index.root and not absolute.startswith(root + os.sep):
+            continue
+        relative = os.path.relpath(absolute, root)
+        name = os.path.basename(rel)
+        if extensions is not None and not any(name.endswith(ext) for ext in extensions):
+            continue
+        if patterns and not _glob_allows(name, relative, patterns):
+            continue
+        files.append(os.path.join(path, relative))
+        if len(files) > MAX_INDEX_CANDIDATES:
+            return None
+    return files
+
+
+def format_results(groups: Groups, shown: int, omitted: int, exact: bool) -> str:
+    """按文件分组输出：匹配行为“行号: 内容”，上下文行为“行号- 内容”，不相邻的片段用 -- 分隔。"""
+    if not groups:
+        return "未找到匹配项。"
+    lines = []
+    for file_path, entries in groups.items():
+        lines.append(file_path)
+        previous = None
+        for line_number, text, is_match in entries:
+            if previous is not None and line_number > previous + 1:
+                lines.append("  --")
+            lines.append(f"  {line_number}{':' if is_match else '-'} {text}")
+            previous = line_number
+    if omitted:
+        count = f"另有 {omitted}" if exact else f"另有至少 {omitted}"
+        lines.append(
+            f"\n[系统提示] 搜索结果过多，已截断。仅显示前 {shown} 条匹配，{count} 条匹配未显示。"
+            f"请尝试更精确的关键词、使用 glob / file_type 过滤或指定具体目录。"
+        )
+    return "\n".join(lines)
@@ -13,7 +13,7 @@ def analyze_command_with_llm(command: str) -> dict:
     is_interactive_heuristic = any(kw in command.lower() for kw in ["npx", "npm init", "npm create", "yarn create", "pnpm create", "create-", "git clone"])
 
     try:
-        from openai import OpenAI
+        from src.llm_clients import chat_completion, get_openai_client
         
         api_key = os.getenv("DASHSCOPE_API_KEY")
         base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
@@ -21,7 +21,7 @@ def analyze_command_with_llm(command: str) -> dict:
         if not api_key:
             return {"is_blocking": is_blocking_heuristic, "is_interactive": is_interactive_heuristic, "reason": "未配置 API，使用启发式规则"}
         
-        client = OpenAI(api_key=api_key, base_url=base_url)
+        client = get_openai_client(api_key=api_key, base_url=base_url)
         
         prompt = f"""分析以下 shell 命令的特征，返回 JSON 格式：
 
@@ -40,7 +40,9 @@ def analyze_command_with_llm(command: str) -> dict:
         # 从环境变量获取 coder 模型配置
         model_id = os.getenv("CODER_MODEL_ID")
         
-        response = client.chat.completions.create(
+        response = chat_completion(
+            client,
+            "command_analysis",
             model=model_id,
             messages=[{"role": "user", "content": prompt}],
             temperature=0
@@ -0,0 +1,522 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.tools.ignore import IgnoreRules, walk_files
+
+logger = logging.getLogger(__name__)
+
+# 索引目录（相对项目根目录）；每次合并写出一个新的段目录，CURRENT 指向当前段
+INDEX_DIR = os.path.join(".chaos", "trigram_index")
+# 超过该大小的文件不建索引，搜索时始终作为候选文件交给验证搜索
+MAX_FILE_BYTES = int(os.getenv("SEARCH_INDEX_MAX_FILE_BYTES", str(1024 * 1024)))
+# 增量变更的文件数超过该值时，在后台把增量合并进磁盘上的段
+MAX_OVERLAY_FILES = 2000
+# 构建与合并时一次在内存中排序的 (三元组, 文件编号) 对数的上限，决定峰值内存（每对约 8 字节）
+MERGE_CHUNK_PAIRS = 4 * 1024 * 1024
+# 判断二进制文件时检查的前缀字节数
+BINARY_SNIFF_BYTES = 8192
+# 三元组编码的取值范围，以及合并时划分键区间的步长
+KEY_SPACE = 1 << 24
+KEY_STEP = 256
+
+_FORMAT_VERSION = 2
+# 段文件：有序的三元组键、每个键的倒排列表起始偏移（多一个结尾偏移）、倒排列表
+_SEGMENT_FILES = (("keys.u32", "uint32"), ("offsets.i64", "int64"), ("postings.u32", "uint32"))
+
+
+def _np():
+    import numpy as np
+    return np
+
+
+def trigrams_of(data: bytes):
+    """字节串中所有不重复的三元组，编码为升序的 uint32（b0 << 16 | b1 << 8 | b2）。"""
+    np = _np()
+    if len(data) < 3:
+        return np.empty(0, dtype=np.uint32)
+    arr = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+    return np.unique((arr[:-2] << 16) | (arr[1:-1] << 8) | arr[2:])
+
+
+def _is_binary(data: bytes) -> bool:
+    return b"\0" in data[:BINARY_SNIFF_BYTES]
+
+
+class _Run:
+    """一组按三元组排序的倒排列表；remap 把其中的文件编号映射为新段的编号（-1 表示丢弃）。"""
+
+    def __init__(self, keys, offsets, postings, remap=None):
+        self.keys, self.offsets, self.postings, self.remap = keys, offsets, postings, remap
+
+    @classmethod
+    def from_trigrams(cls, items: List[Tuple[int, object]]) -> "_Run":
+        """由 (文件编号, 三元组数组) 列表在内存中建立。"""
+        np = _np()
+        keys = [trigrams for _, trigrams in items]
+        docs = [np.full(len(trigrams), doc_id, dtype=np.uint64) for doc_id, trigrams in items]
+        combined = np.concatenate(keys or [np.empty(0, dtype=np.uint32)]).astype(np.uint64) << np.uint64(32)
+        combined |= np.concatenate(docs or [np.empty(0, dtype=np.uint64)])
+        combined.sort()
+        unique_keys, starts = np.unique((combined >> np.uint64(32)).astype(np.uint32), return_index=True)
+        postings = (combined & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        return cls(unique_keys, np.append(starts, len(postings)).astype(np.int64), postings)
+
+    @classmethod
+    def load(cls, directory: str) -> "_Run":
+        np = _np()
+        arrays = []
+        for name, dtype in _SEGMENT_FILES:
+            path = os.path.join(directory, name)
+            # 空文件无法内存映射
+            if os.path.getsize(path) == 0:
+                arrays.append(np.empty(0, dtype=dtype))
+            else:
+                arrays.append(np.memmap(path, dtype=dtype, mode="r"))
+        if len(arrays[1]) != len(arrays[0]) + 1:
+            raise ValueError(f"索引段已损坏: {directory}")
+        return cls(*arrays)
+
+
+def _write_runs(runs: List[_Run], directory: str):
+    """
+    把多个 run 合并写成一个段。按键区间分批处理，每批的 (三元组, 文件编号) 对不超过
+    MERGE_CHUNK_PAIRS，峰值内存与仓库大小无关。
+    """
+    np = _np()
+    os.makedirs(directory, exist_ok=True)
+    # 按各 run 在每个候选切分点之前的对数，选择使每批大小接近 MERGE_CHUNK_PAIRS 的切分点
+    cuts = np.arange(0, KEY_SPACE + KEY_STEP, KEY_STEP, dtype=np.int64)
+    cumulative = np.zeros(len(cuts), dtype=np.int64)
+    for run in runs:
+        cumulative += np.asarray(run.offsets)[np.searchsorted(run.keys, cuts)]
+    targets = np.arange(MERGE_CHUNK_PAIRS, max(int(cumulative[-1]), 1), MERGE_CHUNK_PAIRS)
+    chosen = np.unique(np.concatenate([[0], np.searchsorted(cumulative, targets), [len(cuts) - 1]]))
+    bounds = cuts[chosen]
+
+    files = [open(os.path.join(directory, name), "wb") for name, _ in _SEGMENT_FILES]
+    try:
+        keys_file, offsets_file, postings_file = files
+        written = 0
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            pair_keys, pair_docs = [], []
+            for run in runs:
+                a, b = (int(i) for i in np.searchsorted(run.keys, [lo, hi]))
+                if a == b:
+                    continue
+                offsets = np.asarray(run.offsets[a:b + 1])
+                keys = np.repeat(np.asarray(run.keys[a:b]), np.diff(offsets))
+                docs = np.asarray(run.postings[offsets[0]:offsets[-1]]).astype(np.int64)
+                if run.remap is not None:
+                    docs = run.remap[docs]
+                    keep = docs >= 0
+                    keys, docs = keys[keep], docs[keep]
+                pair_keys.append(keys)
+                pair_docs.append(docs)
+            if not pair_keys:
+                continue
+            combined = np.concatenate(pair_keys).astype(np.uint64) << np.uint64(32)
+            combined |= np.concatenate(pair_docs).astype(np.uint64)
+            combined.sort()
+            keys, starts = np.unique((combined >> np.uint64(32)).astype(np.uint32), return_index=True)
+            keys_file.write(keys.tobytes())
+            offsets_file.write((starts + written).astype(np.int64).tobytes())
+            postings_file.write((combined & np.uint64(0xFFFFFFFF)).astype(np.uint32).tobytes())
+            written += len(combined)
+        offsets_file.write(np.array([written], dtype=np.int64).tobytes())
+    finally:
+        for f in files:
+            f.close()
+
+
+class TrigramIndex:
+    """
+    持久化的三元组倒排索引，用于在搜索前缩小候选文件范围：
+    - 磁盘段：有序的三元组键、偏移量与倒排列表（uint32 文件编号），以内存映射方式加载
+    - 内存增量：变更 / 新增文件的三元组集合，以及磁盘段中已失效的文件编号
+    增量过大时在后台与磁盘段合并并写出新段。
+    """
+
+    def __init__(self, project_root: str):
+        self.root = os.path.abspath(project_root)
+        self.index_dir = os.path.join(self.root, INDEX_DIR)
+        self.ready = False
+        self._lock = threading.RLock()
+        self._merging = False
+        # 同一时间只进行一次构建或合并；合并期间变更的文件记录在 _dirty 中
+        self._merge_lock = threading.Lock()
+        self._dirty: Optional[Set[str]] = None
+        self._ignore = IgnoreRules(self.root)
+        self._reset()
+
+    def _reset(self):
+        np = _np()
+        self._paths: List[str] = []                    # 文件编号 -> 相对路径
+        self._stats: List[Tuple[int, int]] = []        # 文件编号 -> (mtime_ns, size)
+        self._doc_ids: Dict[str, int] = {}
+        self._keys = np.empty(0, dtype=np.uint32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.empty(0, dtype=np.uint32)
+        self._removed: Set[int] = set()                # 磁盘段中已失效的文件编号
+        self._overlay: Dict[str, object] = {}          # 相对路径 -> 三元组数组
+        self._overlay_stats: Dict[str, Tuple[int, int]] = {}
+        self._unindexed: Set[str] = set()              # 过大而未建索引的文件
+
+    # ---------- 文件扫描 ----------
+
+    def _relpath(self, path: str) -> Optional[str]:
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        if rel.startswith("..") or self._ignore.is_ignored(rel, os.path.isdir(path)):
+            return None
+        return rel
+
+    def _iter_files(self):
+        for file_path in walk_files(self.root, self._ignore):
+            rel = os.path.relpath(file_path, self.root)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            yield rel, (stat.st_mtime_ns, stat.st_size)
+
+    def _read_trigrams(self, rel: str, stat: Tuple[int, int]):
+        """返回文件的三元组；过大返回 None（始终作为候选），二进制或不可读返回空数组。"""
+        np = _np()
+        if stat[1] > MAX_FILE_BYTES:
+            return None
+        try:
+            with open(os.path.join(self.root, rel), "rb") as f:
+                data = f.read()
+        except OSError:
+            return np.empty(0, dtype=np.uint32)
+        if _is_binary(data):
+            return np.empty(0, dtype=np.uint32)
+        return trigrams_of(data)
+
+    # ---------- 构建、加载与保存 ----------
+
+    def build(self):
+        """全量扫描项目并写出索引段；每累积 MERGE_CHUNK_PAIRS 个三元组就排序写出一个临时 run。"""
+        started = time.time()
+        with self._merge_lock:
+            with self._lock:
+                self._reset()
+                self._dirty = set()
+            run_dir = os.path.join(self.index_dir, f"tmp-{time.time_ns()}")
+            runs: List[_Run] = []
+            paths, stats, unindexed = [], [], set()
+            batch, batch_pairs = [], 0
+            try:
+                for rel, stat in self._iter_files():
+                    trigrams = self._read_trigrams(rel, stat)
+                    if trigrams is None:
+                        unindexed.add(rel)
+                    elif len(trigrams):
+                        batch.append((len(paths), trigrams))
+                        batch_pairs += len(trigrams)
+                    paths.append(rel)
+                    stats.append(stat)
+                    if batch_pairs >= MERGE_CHUNK_PAIRS:
+                        directory = os.path.join(run_dir, str(len(runs)))
+                        _write_runs([_Run.from_trigrams(batch)], directory)
+                        runs.append(_Run.load(directory))
+                        batch, batch_pairs = [], 0
+                runs.append(_Run.from_trigrams(batch))
+                self._install(self._write_segment(runs, paths, stats, unindexed), paths, stats)
+            finally:
+                with self._lock:
+                    self._dirty = None
+                shutil.rmtree(run_dir, ignore_errors=True)
+            with self._lock:
+                self._unindexed |= {rel for rel in unindexed if rel in self._doc_ids and self._doc_ids[rel] not in self._removed}
+                self.ready = True
+        logger.info(f"搜索索引构建完成：{len(paths)} 个文件，耗时 {time.time() - started:.2f}s")
+
+    def load(self) -> bool:
+        """加载磁盘上的索引段，并按文件的 mtime / size 补齐离线期间的变更。"""
+        try:
+            with open(os.path.join(self.index_dir, "CURRENT"), "r", encoding="utf-8") as f:
+                segment = os.path.join(self.index_dir, f.read().strip())
+            with open(os.path.join(segment, "files.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != _FORMAT_VERSION:
+                return False
+            run = _Run.load(segment)
+        except (OSError, ValueError) as e:
+            logger.info(f"未能加载搜索索引，将重新构建: {e}")
+            return False
+
+        with self._lock:
+            self._reset()
+            self._paths = meta["paths"]
+            self._stats = [tuple(stat) for stat in meta["stats"]]
+            self._doc_ids = {rel: i for i, rel in enumerate(self._paths)}
+            self._unindexed = set(meta.get("unindexed", []))
+            self._keys, self._offsets, self._postings = run.keys, run.offsets, run.postings
+            self.refresh()
+            self.ready = True
+        return True
+
+    def refresh(self):
+        """扫描文件系统，把新增、修改、删除的文件更新到内存增量中。"""
+        with self._lock:
+            seen = set()
+            for rel, stat in self._iter_files():
+                seen.add(rel)
+                doc_id = self._doc_ids.get(rel)
+                known = self._overlay_stats.get(rel) or (self._stats[doc_id] if doc_id is not None and doc_id not in self._removed else None)
+                if known != stat:
+                    self._update(rel, stat)
+            for rel in list(self._doc_ids) + list(self._overlay):
+                if rel not in seen:
+                    self._remove(rel)
+
+    def _set_overlay(self, rel: str, stat: Tuple[int, int], trigrams):
+        doc_id = self._doc_ids.get(rel)
+        if doc_id is not None:
+            self._removed.add(doc_id)
+        self._overlay_stats[rel] = stat
+        if trigrams is None:
+            self._unindexed.add(rel)
+            trigrams = _np().empty(0, dtype=_np().uint32)
+        else:
+            self._unindexed.discard(rel)
+        self._overlay[rel] = trigrams
+        if self._dirty is not None:
+            self._dirty.add(rel)
+
+    def _update(self, rel: str, stat: Tuple[int, int]):
+        self._set_overlay(rel, stat, self._read_trigrams(rel, stat))
+
+    def _remove(self, rel: str):
+        doc_id = self._doc_ids.get(rel)
+        if doc_id is not None:
+            self._removed.add(doc_id)
+        self._overlay.pop(rel, None)
+        self._overlay_stats.pop(rel, None)
+        self._unindexed.discard(rel)
+        if self._dirty is not None:
+            self._dirty.add(rel)
+
+    def _write_segment(self, runs: List[_Run], paths: List[str], stats: list, unindexed: Set[str]) -> str:
+        """合并 runs 写出新段并切换 CURRENT，返回段目录名。"""
+        segment_name = f"seg-{time.time_ns()}"
+        segment = os.path.join(self.index_dir, segment_name)
+        _write_runs(runs, segment)
+        with open(os.path.join(segment, "files.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": _FORMAT_VERSION, "paths": paths, "stats": stats,
+                       "unindexed": sorted(unindexed)}, f)
+        current_tmp = os.path.join(self.index_dir, "CURRENT.tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(segment_name)
+        os.replace(current_tmp, os.path.join(self.index_dir, "CURRENT"))
+        return segment_name
+
+    def _install(self, segment_name: str, paths: List[str], stats: list):
+        """
+        切换到新写出的段。合并期间（_dirty 记录的）变更的文件仍保留在内存增量中，
+        并把它们在新段中的旧版本标记为失效。
+        """
+        run = _Run.load(os.path.join(self.index_dir, segment_name))
+        with self._lock:
+            dirty = self._dirty or set()
+            self._dirty = set()
+            self._paths, self._stats = paths, [tuple(stat) for stat in stats]
+            self._doc_ids = {rel: i for i, rel in enumerate(paths)}
+            self._keys, self._offsets, self._postings = run.keys, run.offsets, run.postings
+            self._overlay = {rel: self._overlay[rel] for rel in dirty if rel in self._overlay}
+            self._overlay_stats = {rel: self._overlay_stats[rel] for rel in self._overlay}
+            self._removed = {self._doc_ids[rel] for rel in dirty if rel in self._doc_ids}
+        # 旧段的内存映射在删除文件后仍然有效
+        for name in os.listdir(self.index_dir):
+            if name.startswith("seg-") and name != segment_name:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    def save(self):
+        """
+        有未合并的增量时写出新段。只在锁内复制当前状态，合并与写盘在锁外进行，
+        期间查询与文件监听回调不会被阻塞。
+        """
+        np = _np()
+        with self._merge_lock:
+            with self._lock:
+                if not (self._overlay or self._removed):
+                    return
+                base = _Run(self._keys, self._offsets, self._postings)
+                count = len(self._paths)
+                live = [i for i in range(count) if i not in self._removed]
+                paths = [self._paths[i] for i in live]
+                stats = [self._stats[i] for i in live]
+                overlay = list(self._overlay.items())
+                overlay_stats = dict(self._overlay_stats)
+                unindexed = set(self._unindexed)
+                self._dirty = set()
+            try:
+                base.remap = np.full(count, -1, dtype=np.int64)
+                base.remap[live] = np.arange(len(live))
+                items = []
+                for rel, trigrams in overlay:
+                    items.append((len(paths), trigrams))
+                    paths.append(rel)
+                    stats.append(overlay_stats[rel])
+                runs = [base, _Run.from_trigrams(items)]
+                self._install(self._write_segment(runs, paths, stats, unindexed), paths, stats)
+            finally:
+                with self._lock:
+                    self._dirty = None
+
+    def _maybe_merge(self):
+        if len(self._overlay) <= MAX_OVERLAY_FILES or self._merging:
+            return
+        self._merging = True
+
+        def merge():
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"合并搜索索引失败: {e}")
+            finally:
+                self._merging = False
+
+        threading.Thread(target=merge, daemon=True).start()
+
+    # ---------- 增量更新与查询 ----------
+
+    def on_change(self, event_type: str, path: str, is_directory: bool):
+        """文件监听器回调。"""
+        if os.path.basename(path) == ".gitignore":
+            # 忽略规则变化后重新扫描
+            with self._lock:
+                self._ignore.invalidate()
+                self.refresh()
+                self._maybe_merge()
+            return
+        rel = self._relpath(path)
+        if rel is None or rel == ".":
+            return
+        with self._lock:
+            if is_directory:
+                prefix = rel + os.sep
+                for known in [r for r in list(self._doc_ids) + list(self._overlay) if r.startswith(prefix)]:
+                    self._remove(known)
+                if event_type != "deleted":
+                    # 移入的目录不会为其中的文件产生单独的事件
+                    for file_path in walk_files(os.path.abspath(path), self._ignore):
+                        self._update_path(file_path)
+            elif event_type == "deleted":
+                self._remove(rel)
+            else:
+                self._update_path(path)
+            self._maybe_merge()
+
+    def _update_path(self, path: str):
+        rel = self._relpath(path)
+        if rel is None:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._remove(rel)
+            return
+        self._update(rel, (stat.st_mtime_ns, stat.st_size))
+
+    def candidates(self, query: str, limit: Optional[int] = None) -> Optional[List[str]]:
+        """
+        可能包含 query（按字节精确匹配）的文件的相对路径。
+        query 少于 3 个字节、或候选文件超过 limit（索引筛选效果差）时返回 None。
+        """
+        np = _np()
+        needles = trigrams_of(query.encode("utf-8"))
+        if len(needles) == 0:
+            return None
+        with self._lock:
+            # 磁盘段：按倒排列表从短到长依次求交集
+            result = None
+            positions = np.searchsorted(self._keys, needles)
+            found = (positions < len(self._keys))
+            if found.all() and (np.asarray(self._keys)[positions] == needles).all():
+                lists = sorted(
+                    (np.asarray(self._postings[self._offsets[p]:self._offsets[p + 1]]) for p in positions),
+                    key=len,
+                )
+                result = lists[0]
+                for posting in lists[1:]:
+                    if len(result) == 0:
+                        break
+                    result = np.intersect1d(result, posting, assume_unique=True)
+                if limit is not None and len(result) - len(self._removed) > limit:
+                    return None
+            matches = [] if result is None else [
+                self._paths[i] for i in result.tolist() if i not in self._removed
+            ]
+            for rel, trigrams in self._overlay.items():
+                if rel not in self._unindexed and np.isin(needles, trigrams, assume_unique=True).all():
+                    matches.append(rel)
+            matches.extend(self._unindexed)
+        matches = sorted(set(matches))
+        if limit is not None and len(matches) > limit:
+            return None
+        return matches
+
+
+_index: Optional[TrigramIndex] = None
+_index_lock = threading.Lock()
+
+
+def search_index_enabled() -> bool:
+    return os.getenv("ENABLE_SEARCH_INDEX", "false").lower() == "true"
+
+
+def get_search_index() -> Optional[TrigramIndex]:
+    """已就绪的搜索索引；未启用或仍在构建时返回 None。"""
+    index = _index
+    return index if index is not None and index.ready else None
+
+
+def start_search_index(project_root: str):
+    """在后台加载（或构建）搜索索引，并注册到共享的文件监听器上保持增量更新。"""
+    global _index
+
+    if not search_index_enabled():
+        return
+    with _index_lock:
+        if _index is not None:
+            return
+        _index = TrigramIndex(project_root)
+
+    index = _index
+
+    def load_or_build():
+        try:
+            if not index.load():
+                index.build()
+            else:
+                index.save()
+        except Exception as e:
+            logger.error(f"构建搜索索引失败: {e}")
+
+    from src.tools.fs_watcher import start_fs_watcher, subscribe
+    subscribe(index.on_change)
+    start_fs_watcher(project_root)
+    threading.Thread(target=load_or_build, daemon=True).start()
+
+
+def stop_search_index():
+    """注销文件监听回调，并把未合并的增量写入磁盘。"""
+    global _index
+    from src.tools.fs_watcher import unsubscribe
+
+    with _index_lock:
+        index, _index = _index, None
+    if index is None:
+        return
+    unsubscribe(index.on_change)
+    if index.ready:
+        try:
+            index.save()
+        except Exception as e:
+            logger.error(f"保存搜索索引失败: {e}")
@@ -0,0 +1,256 @@
+"""
+上下文压缩基准测试。
+
+用确定性的合成 Coder/Tester 对话（或录制的对话 JSON）逐轮回放，经过与 orchestrator 相同的
+TransformMessages 流水线，压缩调用由本地的假压缩器完成，不需要网络。
+
+统计指标：
+- 每轮变换耗时（不含假压缩器的模拟延迟）
+- 压缩调用次数与发送给压缩模型的字符数
+- 峰值上下文 token 数、累计发送给 Agent 模型的 token 数
+- 未命中前缀缓存的 token 数：每次请求中与上一次请求的公共前缀之外的部分
+
+用法：
+    python tests/bench_compress.py --turns 300 --max-tokens 10000,20000 --strategy hierarchical,append
+    python tests/bench_compress.py --transcript recorded.json --recent-rounds 3,5
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import contextlib
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen.agentchat.contrib.capabilities.transform_messages import TransformMessages
+from src.agent.compress import LLMMessagesCompressor
+from src.agent.tokenizer import HeuristicTokenizer, count_message_tokens
+from src.agent.transforms import SupersessionPruner, ToolOutputElider
+
+SYSTEM_PROMPT = "你是 Coder，负责根据计划修改代码。" + "遵循项目规范，修改后运行测试。" * 20
+FILES = [f"src/module_{i}.py" for i in range(12)]
+
+
+class FakeTextCompressor:
+    """确定性的本地压缩器：按目标 token 数截取输入，可选模拟 LLM 延迟。"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.input_chars = 0
+        self.time_spent = 0.0
+
+    def compress(self, text, **kwargs):
+        target_token = kwargs.get("target_token", 500)
+        self.calls += 1
+        self.input_chars += len(text)
+        if self.latency:
+            started = time.perf_counter()
+            time.sleep(self.latency)
+            self.time_spent += time.perf_counter() - started
+        head = text[: target_token * 2].replace("\n", " ")
+        return f"[摘要 #{self.calls}，原文 {len(text)} 字符] {head}"
+
+
+def _file_dump(rng: random.Random, path: str) -> str:
+    lines = []
+    for i in range(rng.randint(80, 260)):
+        indent = "    " * rng.randint(0, 2)
+        lines.append(f"{indent}value_{i} = compute_{rng.randint(0, 99)}(arg_{i % 7})  # 第 {i} 行")
+    return f"# {path}\n" + "\n".join(lines)
+
+
+def _shell_log(rng: random.Random, failed: bool) -> str:
+    lines = [f"\x1b[32mcollecting\x1b[0m ... {rng.randint(10, 90)} items"]
+    lines += [f" {p}%|{'#' * (p // 10)}{' ' * (10 - p // 10)}| {p}/100" for p in range(0, 101, 10)]
+    lines += [f"tests/test_{i}.py::test_case_{i} PASSED" for i in range(rng.randint(10, 40))]
+    if failed:
+        lines.append("Traceback (most recent call last):")
+        for depth in range(rng.randint(8, 20)):
+            lines.append(f'  File "src/module_{depth}.py", line {depth * 7}, in fn_{depth}')
+            lines.append(f"    return fn_{depth + 1}(value)")
+        lines.append("AssertionError: expected 3, got 4")
+        lines.append("命令执行失败，退出码：1")
+    return "\n".join(lines)
+
+
+def generate_transcript(turns: int = 300, seed: int = 0) -> List[Dict[str, Any]]:
+    """生成确定性的 Coder/Tester 对话，包含 tool_calls 与各种大小的工具输出。"""
+    rng = random.Random(seed)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "name": "Architect", "content": "TODO: 为 module_3 增加缓存并补充测试。" * 5},
+    ]
+    call_id = 0
+    while len(messages) < turns:
+        call_id += 1
+        kind = rng.choices(["read", "edit", "shell", "search", "talk"], weights=[4, 2, 3, 2, 2])[0]
+        path = rng.choice(FILES)
+        if kind == "talk":
+            speaker = rng.choice(["Coder", "Tester"])
+            messages.append({"role": "assistant", "name": speaker, "content": f"{speaker} 的分析：" + "需要继续检查边界条件。" * rng.randint(3, 20)})
+            continue
+        if kind == "read":
+            name, arguments, output = "read_file", {"path": path}, _file_dump(rng, path)
+        elif kind == "edit":
+            name, arguments, output = "edit_block", {"path": path, "pattern": "old", "replacement": "new"}, f"文件 '{path}' 修改成功"
+        elif kind == "shell":
+            failed = rng.random() < 0.4
+            name, arguments, output = "execute_shell", {"command": "pytest -q"}, _shell_log(rng, failed)
+        else:
+            name, arguments = "search_code", {"query": f"compute_{rng.randint(0, 99)}"}
+            output = "\n".join(f"{rng.choice(FILES)}:{rng.randint(1, 300)}: value = compute()" for _ in range(rng.randint(5, 50)))
+        tool_call_id = f"call_{call_id}"
+        messages.append({
+            "role": "assistant",
+            "name": rng.choice(["Coder", "Tester"]),
+            "content": None,
+            "tool_calls": [{"id": tool_call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}}],
+        })
+        messages.append({
+            "role": "tool",
+            "content": output,
+            "tool_responses": [{"tool_call_id": tool_call_id, "role": "tool", "content": output}],
+        })
+    return messages[:turns]
+
+
+def load_transcript(path: str) -> List[Dict[str, Any]]:
+    """读取录制的对话：JSON 消息列表，或 {"messages": [...]}。"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["messages"] if isinstance(data, dict) else data
+
+
+def _percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def run_benchmark(
+    transcript: List[Dict[str, Any]],
+    max_tokens: int = 10000,
+    recent_rounds: int = 5,
+    target_token: int = 2000,
+    summary_strategy: str = "hierarchical",
+    speculative: bool = False,
+    use_transforms: bool = True,
+    fake_latency: float = 0.0,
+    keep_first_n: int = 1,
+) -> Dict[str, Any]:
+    """
+    逐轮回放对话：每条 assistant 消息之前，Agent 都会带着此前的全部历史请求一次模型。
+
+    Returns:
+        指标字典
+    """
+    tokenizer = HeuristicTokenizer()
+    fake = FakeTextCompressor(latency=fake_latency)
+    compressor = LLMMessagesCompressor(
+        llm_config={"config_list": []},
+        max_tokens=max_tokens,
+        recent_rounds=recent_rounds,
+        target_token=target_token,
+        keep_first_n=keep_first_n,
+        tokenizer=tokenizer,
+        summary_strategy=summary_strategy,
+        speculative=speculative,
+    )
+    compressor.llm_compressor = fake
+    transforms = [SupersessionPruner(), ToolOutputElider()] if use_transforms else []
+    handler = TransformMessages(transforms=transforms + [compressor], verbose=False)
+
+    overheads, context_sizes = [], []
+    uncached, previous = 0, []
+    for end in range(2, len(transcript) + 1):
+        if transcript[end - 1].get("role") == "assistant" or end == len(transcript):
+            history = transcript[:end]
+        else:
+            continue
+        fake_before = fake.time_spent
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            view = handler._transform_messages(history)
+        overheads.append(time.perf_counter() - started - (fake.time_spent - fake_before))
+        sizes = [count_message_tokens(msg, tokenizer) for msg in view]
+        context_sizes.append(sum(sizes))
+        # 服务端前缀缓存按字节匹配：与上一次请求相同的前缀消息可以复用
+        common = 0
+        while common < min(len(view), len(previous)) and view[common] == previous[common]:
+            common += 1
+        uncached += sum(sizes[common:])
+        previous = view
+
+    if compressor._executor is not None:
+        compressor._executor.shutdown(wait=True)
+
+    return {
+        "turns": len(overheads),
+        "compression_calls": fake.calls,
+        "compression_input_chars": fake.input_chars,
+        "peak_context_tokens": max(context_sizes) if context_sizes else 0,
+        "total_tokens_sent": sum(context_sizes),
+        "uncached_tokens": uncached,
+        "overhead_ms_mean": sum(overheads) / len(overheads) * 1000 if overheads else 0.0,
+        "overhead_ms_p95": _percentile(overheads, 0.95) * 1000,
+        "overhead_ms_max": max(overheads) * 1000 if overheads else 0.0,
+    }
+
+
+def _parse_list(value: str, cast=int) -> List[Any]:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="上下文压缩基准测试")
+    parser.add_argument("--transcript", help="录制的对话 JSON，不指定则使用合成对话")
+    parser.add_argument("--turns", type=int, default=300, help="合成对话的消息数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-tokens", default="10000", help="逗号分隔，可比较多个取值")
+    parser.add_argument("--recent-rounds", default="5")
+    parser.add_argument("--target-token", default="2000")
+    parser.add_argument("--strategy", default="hierarchical", help="hierarchical / rolling / append，逗号分隔")
+    parser.add_argument("--speculative", action="store_true", help="开启后台预压缩")
+    parser.add_argument("--no-transforms", action="store_true", help="不使用确定性的预处理变换")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="假压缩器每次调用的模拟延迟（秒）")
+    args = parser.parse_args(argv)
+
+    transcript = load_transcript(args.transcript) if args.transcript else generate_transcript(args.turns, args.seed)
+    grid = itertools.product(
+        _parse_list(args.max_tokens),
+        _parse_list(args.recent_rounds),
+        _parse_list(args.target_token),
+        _parse_list(args.strategy, str),
+    )
+    header = f"{'max_tokens':>10} {'recent':>6} {'target':>6} {'strategy':>12} | {'calls':>5} {'peak':>7} {'total_sent':>11} {'uncached':>9} {'mean_ms':>8} {'p95_ms':>8}"
+    print(f"对话消息数: {len(transcript)}")
+    print(header)
+    print("-" * len(header))
+    for max_tokens, recent_rounds, target_token, strategy in grid:
+        result = run_benchmark(
+            transcript,
+            max_tokens=max_tokens,
+            recent_rounds=recent_rounds,
+            target_token=target_token,
+            summary_strategy=strategy,
+            speculative=args.speculative,
+            use_transforms=not args.no_transforms,
+            fake_latency=args.fake_latency,
+        )
+        print(
+            f"{max_tokens:>10} {recent_rounds:>6} {target_token:>6} {strategy:>12} | "
+            f"{result['compression_calls']:>5} {result['peak_context_tokens']:>7} {result['total_tokens_sent']:>11} "
+            f"{result['uncached_tokens']:>9} "
+            f"{result['overhead_ms_mean']:>8.2f} {result['overhead_ms_p95']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
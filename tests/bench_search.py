@@ -0,0 +1,135 @@
+"""
+代码搜索基准测试。
+
+在临时目录中生成确定性的合成仓库，比较直接用 ripgrep 扫描整个仓库与先用三元组索引
+缩小候选文件、再用 ripgrep 验证两种方式的耗时。
+
+统计指标：
+- 索引构建耗时、冷启动加载耗时与磁盘占用
+- 每类查询（罕见标识符 / 常见标识符 / 不存在的字符串）的平均耗时与匹配数
+
+用法：
+    python tests/bench_search.py --files 5000 --lines 200
+    python tests/bench_search.py --files 20000 --repeat 5
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.tools.search import MAX_INDEX_CANDIDATES, search_with_ripgrep, search_with_python
+from src.tools.trigram_index import TrigramIndex
+
+WORDS = ["value", "result", "config", "handler", "request", "buffer", "session", "token", "index", "cache"]
+
+
+def generate_repo(root: str, files: int, lines: int, seed: int = 0) -> Dict[str, str]:
+    """生成合成仓库，返回各类查询使用的关键词。"""
+    rng = random.Random(seed)
+    for i in range(files):
+        directory = os.path.join(root, f"pkg_{i % 50}", f"mod_{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        body = []
+        for j in range(lines):
+            a, b = rng.choice(WORDS), rng.choice(WORDS)
+            body.append(f"    {a}_{rng.randint(0, 999)} = compute_{b}({j}, {a}_{i})\n")
+        with open(os.path.join(directory, f"file_{i}.py"), "w", encoding="utf-8") as f:
+            f.write(f"def function_{i}():\n" + "".join(body))
+    return {
+        "rare": f"def function_{files // 2}():",
+        "common": "compute_value(",
+        "missing": "identifier_that_does_not_exist",
+    }
+
+
+def _search(query: str, root: str, files: Optional[List[str]] = None) -> int:
+    result = search_with_ripgrep(query, root, 50, files=files)
+    if result is None:
+        result = search_with_python(query, root, 50, files=files)
+    return result[1]
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, names in os.walk(path) for f in names)
+
+
+def run_benchmark(files: int = 2000, lines: int = 100, repeat: int = 3, seed: int = 0) -> Dict[str, Any]:
+    root = tempfile.mkdtemp(prefix="bench_search_")
+    try:
+        queries = generate_repo(root, files, lines, seed)
+
+        started = time.perf_counter()
+        TrigramIndex(root).build()
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = TrigramIndex(root)
+        index.load()
+        load_seconds = time.perf_counter() - started
+
+        result: Dict[str, Any] = {
+            "files": files,
+            "build_s": build_seconds,
+            "load_s": load_seconds,
+            "index_bytes": _dir_size(index.index_dir),
+            "queries": {},
+        }
+        for name, query in queries.items():
+            plain, indexed = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                plain_matches = _search(query, root)
+                plain.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                candidates = index.candidates(query, limit=MAX_INDEX_CANDIDATES)
+                if candidates is None:
+                    # 与 search_code 一致：候选过多时直接搜索整个仓库
+                    indexed_matches = _search(query, root)
+                else:
+                    paths = [os.path.join(root, rel) for rel in candidates]
+                    indexed_matches = _search(query, root, paths) if paths else 0
+                indexed.append(time.perf_counter() - started)
+            result["queries"][name] = {
+                "candidates": "-" if candidates is None else len(candidates),
+                "plain_ms": sum(plain) / repeat * 1000,
+                "indexed_ms": sum(indexed) / repeat * 1000,
+                "plain_matches": plain_matches,
+                "indexed_matches": indexed_matches,
+            }
+        return result
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="代码搜索基准测试")
+    parser.add_argument("--files", type=int, default=5000, help="合成仓库的文件数")
+    parser.add_argument("--lines", type=int, default=200, help="每个文件的行数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个查询重复次数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.files, args.lines, args.repeat, args.seed)
+    print(
+        f"文件数: {result['files']}  索引构建: {result['build_s']:.2f}s  "
+        f"冷启动加载: {result['load_s'] * 1000:.1f}ms  索引大小: {result['index_bytes'] / 1024:.0f} KiB"
+    )
+    header = f"{'query':>8} | {'candidates':>10} {'rg_ms':>9} {'index_ms':>9} {'matches':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in result["queries"].items():
+        print(
+            f"{name:>8} | {stats['candidates']:>10} {stats['plain_ms']:>9.2f} "
+            f"{stats['indexed_ms']:>9.2f} {stats['indexed_matches']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
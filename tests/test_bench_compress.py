@@ -0,0 +1,34 @@
+import unittest
+from tests.bench_compress import generate_transcript, run_benchmark
+
+
+class TestCompressBenchmark(unittest.TestCase):
+    def test_transcript_is_deterministic(self):
+        self.assertEqual(generate_transcript(60, seed=1), generate_transcript(60, seed=1))
+        transcript = generate_transcript(60, seed=1)
+        self.assertEqual(len(transcript), 60)
+        self.assertTrue(any(msg.get("tool_calls") for msg in transcript))
+
+    def test_benchmark_reports_metrics(self):
+        transcript = generate_transcript(120, seed=0)
+        result = run_benchmark(transcript, max_tokens=4000, recent_rounds=3, target_token=500)
+        self.assertGreater(result["compression_calls"], 0)
+        self.assertGreater(result["total_tokens_sent"], result["peak_context_tokens"])
+        self.assertGreaterEqual(result["overhead_ms_max"], result["overhead_ms_mean"])
+
+        # 确定性的预处理变换可以减少需要 LLM 压缩的次数
+        raw = run_benchmark(transcript, max_tokens=4000, recent_rounds=3, target_token=500, use_transforms=False)
+        self.assertLessEqual(result["compression_calls"], raw["compression_calls"])
+
+    def test_append_strategy_reuses_prefix(self):
+        transcript = generate_transcript(300, seed=0)
+        hierarchical = run_benchmark(transcript, max_tokens=10000)
+        append = run_benchmark(transcript, max_tokens=10000, summary_strategy="append")
+        # 已发送的消息不再被预处理变换改写，未命中前缀缓存的 token 减少
+        self.assertLess(append["uncached_tokens"], hierarchical["uncached_tokens"])
+        # 改写在压缩边界处被冻结前缀吸收，不会带来额外的摘要调用
+        self.assertLessEqual(append["compression_calls"], hierarchical["compression_calls"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import MagicMock, patch
-from src.agent.compress import LLMTextCompressor, LLMMessagesCompressor
+from src.agent.compress import LLMTextCompressor, LLMMessagesCompressor, shutdown_precompress_workers, track_conversation_partner
 
 class TestCompress(unittest.TestCase):
     def setUp(self):
@@ -93,6 +93,36 @@ class TestCompress(unittest.TestCase):
         # len // 3 = 3
         self.assertEqual(compressor._count_tokens(msg), 3)
 
+    def test_token_estimation_cjk_and_tool_calls(self):
+        compressor = LLMMessagesCompressor(self.llm_config)
+        # 中文按 1 字 1 token 计算
+        self.assertEqual(compressor._count_tokens({"content": "你好世界"}), 4)
+        # tool_calls 的参数也计入，content 为 None 时不报错
+        msg = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "1", "function": {"name": "read_file", "arguments": '{"path": "a.py"}'}}]
+        }
+        self.assertGreater(compressor._count_tokens(msg), 0)
+
+    def test_tool_schemas_counted_in_threshold(self):
+        schemas = [{"type": "function", "function": {"name": "f", "description": "x" * 600}}]
+        compressor = LLMMessagesCompressor(self.llm_config, max_tokens=100, tool_schemas=schemas)
+        self.assertGreater(compressor.schema_tokens, 100)
+
+    def test_incremental_token_accounting(self):
+        compressor = LLMMessagesCompressor(self.llm_config, max_tokens=100000)
+        messages = [{"role": "user", "content": f"message {i} " * 10} for i in range(20)]
+        compressor.apply_transform(messages)
+        self.assertEqual(compressor._ledger.total, compressor._count_total_tokens(messages))
+
+        # 追加消息后只对新增消息计数
+        with patch.object(compressor.tokenizer, "count", wraps=compressor.tokenizer.count) as counter:
+            messages.append({"role": "assistant", "content": "new reply"})
+            compressor.apply_transform([dict(m) for m in messages])
+            self.assertEqual(counter.call_count, 1)
+        self.assertEqual(compressor._ledger.total, compressor._count_total_tokens(messages))
+
     @patch("openai.OpenAI")
     def test_tool_message_handling(self, mock_openai):
         # Test that tool messages are not orphaned from their assistant calls
@@ -129,5 +159,186 @@ class TestCompress(unittest.TestCase):
         self.assertEqual(transformed[3]["role"], "tool")
         self.assertEqual(transformed[3]["tool_call_id"], "1")
 
+    def _make_speculative_compressor(self):
+        compressor = LLMMessagesCompressor(
+            self.llm_config,
+            max_tokens=150,
+            recent_rounds=1,
+            keep_first_n=1,
+            speculative=True,
+            precompress_ratio=0.5
+        )
+        compressor.llm_compressor = MagicMock()
+        compressor.llm_compressor.compress.return_value = "Precomputed summary"
+        return compressor
+
+    def test_speculative_precompression_swaps_in_summary(self):
+        compressor = self._make_speculative_compressor()
+        # 每条 20 token：5 条超过低水位 75，但未超过阈值 150
+        messages = [{"role": "system", "content": "s" * 60}]
+        messages += [{"role": "user", "content": f"{i}" * 60} for i in range(4)]
+        transformed = compressor.apply_transform(messages)
+        self.assertEqual(transformed, messages)
+        compressor._precompute["future"].result(timeout=5)
+        compressor.llm_compressor.compress.assert_called_once()
+
+        # 超过阈值时直接换入预压缩摘要，不再同步调用 LLM
+        messages += [{"role": "assistant", "content": f"{i}" * 60} for i in range(4, 7)]
+        transformed = compressor.apply_transform(messages)
+        compressor.llm_compressor.compress.assert_called_once()
+        self.assertEqual(transformed[0], messages[0])
+        self.assertIn("Precomputed summary", transformed[1]["content"])
+        self.assertEqual(transformed[2:], messages[4:])
+
+    def test_speculative_precompression_discarded_when_history_changes(self):
+        compressor = self._make_speculative_compressor()
+        messages = [{"role": "system", "content": "s" * 60}]
+        messages += [{"role": "user", "content": f"{i}" * 60} for i in range(4)]
+        compressor.apply_transform(messages)
+        compressor._precompute["future"].result(timeout=5)
+
+        # 被预压缩的历史被改写，摘要失效，改为同步压缩
+        changed = [dict(m) for m in messages]
+        changed[1]["content"] = "x" * 60
+        changed += [{"role": "assistant", "content": f"{i}" * 60} for i in range(4, 7)]
+        compressor.llm_compressor.compress.return_value = "Fresh summary"
+        transformed = compressor.apply_transform(changed)
+        self.assertEqual(compressor.llm_compressor.compress.call_count, 2)
+        self.assertIn("Fresh summary", transformed[1]["content"])
+
+    def test_shutdown_precompress_workers(self):
+        compressor = self._make_speculative_compressor()
+        messages = [{"role": "system", "content": "s" * 60}]
+        messages += [{"role": "user", "content": f"{i}" * 60} for i in range(4)]
+        compressor.apply_transform(messages)
+        executor = compressor._executor
+        self.assertIsNotNone(executor)
+
+        shutdown_precompress_workers()
+        self.assertIsNone(compressor._executor)
+        # 工作线程退出后，执行器不再接受任务
+        executor.shutdown(wait=True)
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+
+    def test_hierarchical_summaries_only_compress_new_span(self):
+        compressor = LLMMessagesCompressor(
+            self.llm_config,
+            max_tokens=40,
+            recent_rounds=1,
+            keep_first_n=1,
+            target_token=400,
+            segment_fanout=2
+        )
+        compressor.llm_compressor = MagicMock()
+        compressor.llm_compressor.compress.side_effect = lambda text, **kwargs: f"S{compressor.llm_compressor.compress.call_count}"
+
+        messages = [{"role": "system", "content": "s" * 30}]
+        for i in range(3):
+            messages.append({"role": "user", "content": f"{i}" * 60})
+            messages.append({"role": "assistant", "content": f"reply {i}" * 10})
+            transformed = compressor.apply_transform(messages)
+
+        calls = compressor.llm_compressor.compress.call_args_list
+        # 第二次压缩只包含新移出的消息，不再带上旧摘要
+        self.assertNotIn("S1", calls[1].kwargs["text"])
+        # 第 0 层满 2 个片段后合并到第 1 层
+        self.assertEqual(calls[2].kwargs["text"], "S1\n\nS2")
+        self.assertEqual(len(compressor._segment_levels[1]), 1)
+        self.assertEqual(calls[0].kwargs["target_token"], 200)
+        self.assertIn("### [历史对话模拟摘要]", transformed[1]["content"])
+        self.assertEqual(transformed[-1], messages[-1])
+
+    def test_append_strategy_keeps_prefix_stable(self):
+        compressor = LLMMessagesCompressor(
+            self.llm_config,
+            max_tokens=200,
+            recent_rounds=1,
+            keep_first_n=1,
+            target_token=1000,
+            summary_strategy="append",
+            cache_retain_ratio=0.4
+        )
+        compressor.llm_compressor = MagicMock()
+        compressor.llm_compressor.compress.side_effect = lambda text, **kwargs: f"S{compressor.llm_compressor.compress.call_count}"
+
+        messages = [{"role": "system", "content": "pinned " * 5}]
+        views = []
+        for i in range(15):
+            messages.append({"role": "user", "content": f"{i % 10}" * 60})
+            views.append(compressor.apply_transform(messages))
+
+        # 每次压缩后只保留约 80 token 的尾部，压缩次数远少于消息数
+        self.assertEqual(compressor.llm_compressor.compress.call_count, 2)
+        # 新的摘要块追加在旧块之后，旧块与固定消息字节不变
+        first_block = views[-1][1]
+        self.assertIn("S1", first_block["content"])
+        self.assertIn("S2", views[-1][2]["content"])
+        for view in views:
+            if len(view) > 1 and view[1].get("name") == "compressed_history":
+                self.assertEqual(view[:2], views[-1][:2])
+
+    def test_append_strategy_freezes_sent_messages(self):
+        compressor = LLMMessagesCompressor(self.llm_config, max_tokens=300, recent_rounds=1, keep_first_n=1, summary_strategy="append")
+        compressor.llm_compressor = MagicMock()
+        compressor.llm_compressor.compress.return_value = "S"
+
+        def tool_round(i, content):
+            return [
+                {"role": "assistant", "content": None, "tool_calls": [{"id": f"c{i}", "type": "function", "function": {"name": "read_file", "arguments": "{}"}}]},
+                {"role": "tool", "content": content, "tool_responses": [{"tool_call_id": f"c{i}", "role": "tool", "content": content}]},
+            ]
+
+        messages = [{"role": "user", "content": "task"}] + tool_round(0, "full output " * 20)
+        sent = compressor.apply_transform(messages)
+        # 预处理变换之后改写了已发送的工具输出：改写不生效，已发送的消息原样重发
+        messages = messages[:2] + tool_round(0, "[已省略过期的输出]")[1:] + [{"role": "assistant", "content": "next"}]
+        view = compressor.apply_transform(messages)
+        self.assertEqual(view[:3], sent)
+        self.assertEqual(view[3], messages[3])
+
+        # 触发压缩后，保留的尾部换用变换后的最新结果
+        for i in range(1, 8):
+            messages = messages + tool_round(i, f"output {i} " * 20)
+            view = compressor.apply_transform(messages)
+        self.assertEqual(compressor.llm_compressor.compress.call_count, 1)
+        self.assertNotIn("full output", compressor.llm_compressor.compress.call_args.kwargs["text"])
+        self.assertEqual(view[-1], messages[-1])
+
+    def test_compression_state_per_conversation(self):
+        compressor = LLMMessagesCompressor(self.llm_config, max_tokens=40, recent_rounds=1, keep_first_n=1, max_conversations=2)
+        compressor.llm_compressor = MagicMock()
+        compressor.llm_compressor.compress.return_value = "S"
+
+        class FakeAgent:
+            def __init__(self, name):
+                self.name = name
+
+            def generate_reply(self, messages=None, sender=None):
+                return compressor.apply_transform(messages)
+
+        coder, tester, manager = FakeAgent("Coder"), FakeAgent("Tester"), FakeAgent("Manager")
+        track_conversation_partner(coder)
+        track_conversation_partner(tester)
+
+        coder_history = [{"role": "user", "content": "task"}]
+        tester_history = [{"role": "user", "content": "task"}]
+        for i in range(3):
+            coder_history.append({"role": "assistant", "content": f"coder step {i} " * 10})
+            tester_history.append({"role": "assistant", "content": f"tester step {i} " * 5})
+            coder.generate_reply(messages=coder_history, sender=manager)
+            tester.generate_reply(messages=tester_history, sender=manager)
+
+        # 两份历史各自维护压缩位置，交替调用不会互相失效
+        self.assertEqual([key[:2] for key in compressor._states], [("Coder", "Manager"), ("Tester", "Manager")])
+        coder_state, tester_state = compressor._states.values()
+        self.assertEqual(coder_state.ledger.size, 4)
+        self.assertEqual(tester_state.ledger.size, 4)
+        self.assertEqual(coder_state.compression_cache["compressed_up_to_index"], 3)
+
+        # 超出 max_conversations 后淘汰最久未使用的状态
+        compressor.apply_transform([{"role": "user", "content": "another task"}])
+        self.assertEqual([key[:2] for key in compressor._states], [("Tester", "Manager"), (None, None)])
+
 if __name__ == "__main__":
     unittest.main()
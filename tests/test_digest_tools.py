@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.tools import digest_tools
+from src.tools.digest_tools import summarize_files, project_digest, load_summary_cache
+
+
+class TestDigestTools(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="test_digest_tools_")
+        self.old_cwd = os.getcwd()
+        os.makedirs(os.path.join(self.test_dir, "src"))
+        self.files = []
+        for name in ("a.py", "b.py"):
+            path = os.path.join(self.test_dir, "src", name)
+            with open(path, "w") as f:
+                f.write(f"# {name}\ndef {name[0]}(): pass\n")
+            self.files.append(path)
+        self.env = patch.dict(os.environ, {
+            "DASHSCOPE_API_KEY": "fake-key",
+            "GENERAL_MODEL_ID": "fake-model",
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.test_dir)
+
+    def _mock_client(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        def create(**kwargs):
+            body = kwargs["messages"][1]["content"]
+            paths = [line.strip("= ") for line in body.splitlines() if line.startswith("=====")]
+            content = json.dumps({p: f"summary of {p}" for p in paths})
+            return MagicMock(choices=[MagicMock(message=MagicMock(content=f"```json\n{content}\n```"))])
+
+        mock_client.chat.completions.create.side_effect = create
+        return mock_client
+
+    @patch("openai.OpenAI")
+    def test_unchanged_files_are_not_resummarized(self, mock_openai):
+        client = self._mock_client(mock_openai)
+
+        self.assertEqual(summarize_files(self.test_dir, self.files), 2)
+        self.assertEqual(client.chat.completions.create.call_count, 1)  # 两个文件合并为一个批次
+
+        self.assertEqual(summarize_files(self.test_dir, self.files), 0)
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+
+        with open(self.files[0], "a") as f:
+            f.write("x = 1\n")
+        self.assertEqual(summarize_files(self.test_dir, self.files), 1)
+
+        os.remove(self.files[1])
+        summarize_files(self.test_dir, self.files)
+        cache = load_summary_cache(self.test_dir)
+        self.assertEqual(list(cache["files"]), [os.path.join("src", "a.py")])
+        self.assertEqual(len(cache["by_hash"]), 1)
+
+    def test_batches_respect_limits(self):
+        items = [(f"f{i}.py", "x" * 10) for i in range(digest_tools.BATCH_MAX_FILES + 1)]
+        batches = digest_tools._make_batches(items)
+        self.assertEqual([len(b) for b in batches], [digest_tools.BATCH_MAX_FILES, 1])
+
+    def test_schedule_after_worker_drains(self):
+        done = []
+
+        def fake_summarize(project_root, batch):
+            done.extend(batch)
+            return len(batch)
+
+        def wait_idle():
+            for _ in range(500):
+                if digest_tools._worker is None:
+                    return
+                threading.Event().wait(0.01)
+
+        with patch.dict(os.environ, {"ENABLE_FILE_SUMMARIES": "true"}), \
+                patch.object(digest_tools, "summarize_files", fake_summarize):
+            digest_tools.schedule_file_summaries(self.test_dir, [self.files[0]])
+            wait_idle()
+            # 后台线程处理完队列后在锁内清空 _worker，之后的入队会启动新线程
+            self.assertIsNone(digest_tools._worker)
+            digest_tools.schedule_file_summaries(self.test_dir, [self.files[1]])
+            wait_idle()
+        self.assertEqual(done, self.files)
+        self.assertIsNone(digest_tools._worker)
+
+    @patch("openai.OpenAI")
+    def test_project_digest_prefix_and_budget(self, mock_openai):
+        self._mock_client(mock_openai)
+        summarize_files(self.test_dir, self.files)
+        os.chdir(self.test_dir)
+
+        digest = project_digest("src")
+        self.assertIn("src/a.py: summary of src/a.py", digest)
+        self.assertIn("src/b.py", digest)
+
+        self.assertIn("暂无可用的文件摘要", project_digest("docs"))
+
+        limited = project_digest("", max_tokens=15)
+        self.assertIn("另有 1 个文件未显示", limited)
+
+
+if __name__ == "__main__":
+    unittest.main()
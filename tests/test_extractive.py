@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from src.agent.compress import LLMMessagesCompressor, LLMTextCompressor
+from src.agent.extractive import ExtractiveCompressor, HybridTextCompressor, score_units
+from src.agent.tokenizer import HeuristicTokenizer
+
+
+def _noisy_log(lines=400):
+    body = [f"tests/test_{i}.py::test_case_{i} PASSED" for i in range(lines)]
+    body.insert(120, "AssertionError: expected 3, got 4 in test_cache_invalidation")
+    return "\n".join(body)
+
+
+class TestExtractiveCompressor(unittest.TestCase):
+    def test_keeps_error_lines_within_budget(self):
+        text = _noisy_log()
+        compressor = ExtractiveCompressor()
+        result = compressor.compress(text, target_token=200)
+        self.assertIn("AssertionError: expected 3, got 4", result)
+        self.assertLessEqual(HeuristicTokenizer().count(result), 200)
+        self.assertTrue(result.startswith("[本地抽取式摘要：保留 "))
+        self.assertIn("个片段）", result)
+
+    def test_short_text_unchanged(self):
+        self.assertEqual(ExtractiveCompressor().compress("hello", target_token=100), "hello")
+
+    def test_recent_and_unique_units_preferred(self):
+        units = ["same line here"] * 3 + ["old unique context"] * 1 + ["new unique context"]
+        scores = score_units(units)
+        # 重复片段只保留最后一次
+        self.assertEqual(scores[0], 0)
+        self.assertEqual(scores[1], 0)
+        self.assertGreater(scores[4], scores[3])
+
+    @patch("openai.OpenAI")
+    def test_llm_failure_falls_back_to_extractive(self, mock_openai):
+        mock_openai.return_value.chat.completions.create.side_effect = RuntimeError("timeout")
+        compressor = LLMTextCompressor(llm_config={"config_list": [{"model": "m", "api_key": "k"}]})
+        result = compressor.compress(_noisy_log(), target_token=200)
+        self.assertTrue(result.startswith("[警告：压缩时出错 - timeout]"))
+        self.assertIn("AssertionError: expected 3, got 4", result)
+
+    def test_hybrid_prefilters_before_llm(self):
+        llm = MagicMock()
+        llm.compress.return_value = "summary"
+        hybrid = HybridTextCompressor(llm, prefilter_ratio=2)
+        text = _noisy_log()
+        self.assertEqual(hybrid.compress(text, target_token=100), "summary")
+        sent = llm.compress.call_args[0][0]
+        self.assertLess(len(sent), len(text))
+        self.assertLessEqual(HeuristicTokenizer().count(sent), 200)
+
+    def test_messages_compressor_modes(self):
+        extractive = LLMMessagesCompressor(llm_config={"config_list": []}, compressor_mode="extractive")
+        self.assertIsInstance(extractive.llm_compressor, ExtractiveCompressor)
+        hybrid = LLMMessagesCompressor(llm_config={"config_list": []}, compressor_mode="hybrid")
+        self.assertIsInstance(hybrid.llm_compressor, HybridTextCompressor)
+        self.assertIsInstance(LLMMessagesCompressor(llm_config={}).llm_compressor, LLMTextCompressor)
+
+
+if __name__ == "__main__":
+    unittest.main()
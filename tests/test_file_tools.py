@@ -3,7 +3,7 @@ import os
 import shutil
 import tempfile
 from src.tools.file_tools import (
-    read_file, write_file, insert_code, search_code, edit_block,
+    read_file, file_outline, write_file, insert_code, search_code, edit_block, apply_edits,
     create_directory, delete_file, list_directory, get_file_tree,
     move_file, file_exists, get_file_tools
 )
@@ -32,6 +32,76 @@ class TestFileTools(unittest.TestCase):
         read_content = read_file(file_path)
         self.assertEqual(read_content, content)
 
+    def test_read_file_ranges_and_paging(self):
+        file_path = os.path.join(self.test_dir, "big.py")
+        write_file(file_path, "".join(f"line {i}\n" for i in range(1, 20001)))
+
+        result = read_file(file_path, start_line=14000, end_line=14002)
+        self.assertEqual(result.splitlines(), [
+            f"[文件 '{file_path}' 第 14000-14002 行，共 20000 行]", "line 14000", "line 14001", "line 14002"
+        ])
+
+        page = read_file(file_path, start_line=19990, max_bytes=44)  # 每行 11 字节
+        self.assertIn("line 19993", page)
+        self.assertNotIn("line 19994", page)
+        cursor = page.split('cursor="')[1].split('"')[0]
+        rest = read_file(file_path, cursor=cursor)
+        self.assertEqual(rest.splitlines()[1], "line 19994")
+        self.assertIn("line 20000", rest)
+        self.assertNotIn("cursor=", rest)
+
+        # 文件修改后索引重建，旧游标给出提示
+        write_file(file_path, "a\nb")
+        self.assertEqual(read_file(file_path, start_line=2).splitlines()[1:], ["b"])
+        self.assertIn("已被修改", read_file(file_path, cursor=cursor))
+        self.assertIn("没有内容", read_file(file_path, start_line=5))
+
+    def test_file_outline(self):
+        file_path = os.path.join(self.test_dir, "module.py")
+        body = "\n".join(f"    x_{i} = {i}" for i in range(200))
+        write_file(file_path, (
+            "import os\nfrom typing import List\n\n"
+            "class Cache(dict):\n    \"\"\"Return cached values.\n\n    More details.\"\"\"\n\n"
+            "    @property\n    def size(self) -> int:  # comment\n        return len(self)\n\n"
+            f"def build(items: List[str]) -> Cache:\n{body}\n"
+        ))
+        outline = file_outline(file_path)
+        self.assertIn("共 213 行", outline)
+        self.assertIn("导入（第 1-2 行）", outline)
+        self.assertIn("L4-11 class Cache(dict)  # Return cached values.", outline)
+        self.assertIn("  L9-11 @property def size(self) -> int\n", outline)
+        self.assertIn("L13-213 def build(items: List[str]) -> Cache", outline)
+        self.assertNotIn("x_5", outline)
+        self.assertLess(len(outline), len(read_file(file_path)) / 5)
+        text_path = os.path.join(self.test_dir, "notes.txt")
+        write_file(text_path, "notes")
+        self.assertIn("不支持", file_outline(text_path))
+
+    def test_file_outline_other_languages(self):
+        ts_path = os.path.join(self.test_dir, "config.ts")
+        write_file(ts_path, (
+            'import { readFile } from "fs";\n\n'
+            "// Keeps parsed configs.\nexport class ConfigCache {\n"
+            "    get(key: string): string | undefined {\n        return undefined;\n    }\n}\n\n"
+            "export function loadConfig(path: string): ConfigCache {\n    return new ConfigCache();\n}\n"
+        ))
+        outline = file_outline(ts_path)
+        self.assertIn('导入（第 1-1 行）：\n  import { readFile } from "fs";', outline)
+        self.assertIn("L4-8 class ConfigCache  # Keeps parsed configs.", outline)
+        self.assertIn("  L5-7 get(key: string): string | undefined", outline)
+        self.assertIn("L10-12 function loadConfig(path: string): ConfigCache", outline)
+
+        go_path = os.path.join(self.test_dir, "server.go")
+        write_file(go_path, (
+            'package main\n\nimport "fmt"\n\n'
+            "func (s *Server) Start() error {\n\tfmt.Println(s)\n\treturn nil\n}\n"
+        ))
+        self.assertIn("L5-8 func (s *Server) Start() error", file_outline(go_path))
+
+        java_path = os.path.join(self.test_dir, "App.java")
+        write_file(java_path, "public class App {\n    public static void main(String[] args) {\n    }\n}\n")
+        self.assertIn("  L2-3 public static void main(String[] args)", file_outline(java_path))
+
     def test_file_exists(self):
         file_path = os.path.join(self.test_dir, "exist.txt")
         write_file(file_path, "content")
@@ -69,6 +139,87 @@ class TestFileTools(unittest.TestCase):
         self.assertIn("成功替换", result_regex)
         self.assertEqual(read_file(file_path), "Hello regex_world!")
 
+    def test_show_diff(self):
+        file_path = os.path.join(self.test_dir, "diff.py")
+        result = write_file(file_path, "".join(f"line {i}\n" for i in range(1, 501)), show_diff=True)
+        self.assertIn("+line 100\n", result)
+        self.assertIn("...（差异过长", result)
+
+        result = edit_block(file_path, "line 50\n", "line fifty\n", show_diff=True)
+        self.assertIn("@@ -48,5 +48,5 @@", result)
+        self.assertIn("-line 50\n+line fifty", result)
+        self.assertNotIn("line 45", result)
+
+        result = insert_code(file_path, 10, "# inserted", show_diff=True)
+        self.assertIn("@@ -8,4 +8,5 @@", result)
+        self.assertIn("+# inserted", result)
+        # 默认不附带差异
+        self.assertEqual(edit_block(file_path, "line 1\n", "line one\n"), "成功替换 1 处匹配项")
+
+    def test_apply_edits(self):
+        a_path = os.path.join(self.test_dir, "a.py")
+        b_path = os.path.join(self.test_dir, "b.py")
+        new_path = os.path.join(self.test_dir, "pkg", "new.py")
+        write_file(a_path, "def old_name():\n    return 1\n\nold_name()\n")
+        write_file(b_path, "line1\nline2\nline3\nline4\n")
+
+        result = apply_edits([
+            {"path": a_path, "pattern": "old_name", "replacement": "new_name", "expected_count": 2},
+            {"path": b_path, "start_line": 2, "end_line": 3, "content": "middle"},
+            {"path": b_path, "start_line": 1, "end_line": 0, "content": "# header"},
+            {"path": new_path, "content": "x = 1\n"},
+        ])
+        self.assertIn("[1] " + a_path + ": 替换 2 处匹配项", result)
+        self.assertIn("已写入 3 个文件", result)
+        self.assertEqual(read_file(a_path), "def new_name():\n    return 1\n\nnew_name()\n")
+        self.assertEqual(read_file(b_path), "# header\nline1\nmiddle\nline4\n")
+        self.assertEqual(read_file(new_path), "x = 1\n")
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ["a.py", "b.py", "pkg"])
+
+    def test_apply_edits_is_all_or_nothing(self):
+        a_path = os.path.join(self.test_dir, "a.py")
+        b_path = os.path.join(self.test_dir, "b.py")
+        write_file(a_path, "alpha\n")
+        write_file(b_path, "beta\n")
+
+        result = apply_edits([
+            {"path": a_path, "pattern": "alpha", "replacement": "ALPHA"},
+            {"path": b_path, "pattern": "missing", "replacement": "x"},
+        ])
+        self.assertIn("未找到匹配项", result)
+        self.assertIn("所有文件均未修改", result)
+        self.assertEqual(read_file(a_path), "alpha\n")
+
+        # 写入阶段失败时回滚已写入的文件
+        blocker = os.path.join(self.test_dir, "blocker")
+        write_file(blocker, "")
+        result = apply_edits([
+            {"path": a_path, "pattern": "alpha", "replacement": "ALPHA"},
+            {"path": os.path.join(blocker, "c.py"), "content": "x"},
+        ])
+        self.assertIn("已回滚 1 个", result)
+        self.assertEqual(read_file(a_path), "alpha\n")
+
+    def test_apply_edits_groups_path_aliases(self):
+        a_path = os.path.join(self.test_dir, "a.py")
+        alias = os.path.join(self.test_dir, "pkg", "..", "a.py")
+        write_file(a_path, "alpha\nbeta\ngamma\n")
+
+        result = apply_edits([
+            {"path": a_path, "pattern": "alpha", "replacement": "ALPHA"},
+            {"path": alias, "pattern": "gamma", "replacement": "GAMMA"},
+        ])
+        self.assertIn("已写入 1 个文件", result)
+        self.assertEqual(read_file(a_path), "ALPHA\nbeta\nGAMMA\n")
+
+        # 写入整个文件不能与同一文件的其他修改混用
+        result = apply_edits([
+            {"path": a_path, "pattern": "beta", "replacement": "BETA"},
+            {"path": alias, "content": "x\n"},
+        ])
+        self.assertIn("不能与同一文件的其他修改", result)
+        self.assertEqual(read_file(a_path), "ALPHA\nbeta\nGAMMA\n")
+
     def test_directory_operations(self):
         sub_dir = os.path.join(self.test_dir, "subdir")
         
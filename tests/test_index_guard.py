@@ -0,0 +1,69 @@
+import os
+import random
+import shutil
+import string
+import tempfile
+import unittest
+
+from src.tools.index_guard import check_file, filter_files, build_ingestion_report, write_ingestion_report
+
+
+class TestIndexGuard(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="test_index_guard_")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name, content, mode="w"):
+        path = os.path.join(self.test_dir, name)
+        with open(path, mode) as f:
+            f.write(content)
+        return path
+
+    def test_normal_source_is_kept(self):
+        path = self._write("app.py", "def main():\n    print('hello')\n")
+        self.assertIsNone(check_file(path))
+
+    def test_too_large(self):
+        path = self._write("big.py", "x = 1\n" * 1000)
+        self.assertTrue(check_file(path, max_bytes=100).startswith("too_large"))
+
+    def test_binary(self):
+        path = self._write("blob.js", b"\x00\x01\x02binary" * 100, mode="wb")
+        self.assertEqual(check_file(path), "binary")
+
+    def test_generated_marker_and_name(self):
+        path = self._write("schema.py", "# Code generated by protoc. DO NOT EDIT.\nx = 1\n")
+        self.assertEqual(check_file(path), "generated")
+        path = self._write("vendor.min.js", "var a=1;\n")
+        self.assertEqual(check_file(path), "generated")
+
+    def test_minified(self):
+        body = ";".join(f"var a{i}=function(b){{return b*{i}}}" for i in range(200))
+        path = self._write("bundle.js", body)
+        self.assertEqual(check_file(path), "minified")
+
+        random.seed(0)
+        blob = "".join(random.choice(string.ascii_letters + string.digits + "+/") for _ in range(2000))
+        path = self._write("data.ts", f"export const DATA = \"{blob}\";\n")
+        self.assertEqual(check_file(path), "minified")
+
+    def test_filter_and_report(self):
+        good = self._write("ok.py", "x = 1\n")
+        bad = self._write("big.md", "# title\n" * 200)
+        kept, skipped = filter_files([good, bad], max_bytes=100)
+        self.assertEqual(kept, [good])
+        self.assertIn(bad, skipped)
+
+        report = build_ingestion_report(skipped, indexed_count=len(kept))
+        self.assertEqual(report["skipped_files"], 1)
+        self.assertEqual(report["by_reason"], {"too_large": 1})
+        self.assertGreater(report["estimated_chunks_saved"], 0)
+
+        report_path = write_ingestion_report(self.test_dir, report)
+        self.assertTrue(os.path.exists(report_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from llama_index.core.schema import TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+
+from src.tools.index_snapshot import SnapshotKVStore, SNAPSHOT_FILENAME
+
+
+class TestIndexSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="test_index_snapshot_")
+        self.path = os.path.join(self.test_dir, SNAPSHOT_FILENAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_roundtrip_and_lazy_load(self):
+        store = SnapshotKVStore(self.path)
+        store.put("a", {"text": "hello"}, "docstore/data")
+        store.put("b", {"text": "world"}, "docstore/data")
+        store.put("a", {"doc_hash": "h1"}, "docstore/metadata")
+        store.persist()
+
+        loaded = SnapshotKVStore.from_persist_path(self.path)
+        # 加载后尚未解析任何 value
+        self.assertEqual(loaded._cache, {})
+        self.assertEqual(loaded.get("a", "docstore/data"), {"text": "hello"})
+        self.assertEqual(len(loaded._cache), 1)
+        self.assertEqual(loaded.get_all("docstore/metadata"), {"a": {"doc_hash": "h1"}})
+        self.assertIsNone(loaded.get("missing", "docstore/data"))
+
+    def test_delete_and_overwrite_survive_persist(self):
+        store = SnapshotKVStore(self.path)
+        store.put("a", {"v": 1})
+        store.put("b", {"v": 2})
+        store.persist()
+
+        store = SnapshotKVStore.from_persist_path(self.path)
+        self.assertTrue(store.delete("a"))
+        self.assertFalse(store.delete("a"))
+        store.put("b", {"v": 3})
+        store.put("c", {"v": 4})
+        store.persist()
+
+        reloaded = SnapshotKVStore.from_persist_path(self.path)
+        self.assertEqual(reloaded.get_all(), {"b": {"v": 3}, "c": {"v": 4}})
+
+    def test_get_during_persist(self):
+        store = SnapshotKVStore(self.path)
+        for i in range(200):
+            store.put(f"k{i}", {"text": "x" * (i % 50)})
+        store.persist()
+
+        errors, stop = [], threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    for i in range(0, 200, 7):
+                        store._cache.clear()
+                        assert store.get(f"k{i}") == {"text": "x" * (i % 50)}
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        threads = [threading.Thread(target=reader) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        # 文件监听器触发的 persist 会替换并关闭旧的 mmap
+        for i in range(30):
+            store.put(f"k{i % 200}", {"text": "x" * (i % 200 % 50)})
+            store.persist()
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_backs_docstore_and_index_store(self):
+        store = SnapshotKVStore(self.path)
+        docstore = SimpleDocumentStore(store)
+        index_store = SimpleIndexStore(store)
+        docstore.add_documents([TextNode(id_="n1", text="def foo(): pass")])
+        docstore.set_document_hash("/repo/a.py", "hash-a")
+        store.persist()
+
+        store = SnapshotKVStore.from_persist_path(self.path)
+        docstore = SimpleDocumentStore(store)
+        self.assertEqual(docstore.get_node("n1").get_content(), "def foo(): pass")
+        self.assertEqual(docstore.get_document_hash("/repo/a.py"), "hash-a")
+        self.assertEqual(SimpleIndexStore(store).index_structs(), index_store.index_structs())
+
+    def test_migrate_from_json(self):
+        with open(os.path.join(self.test_dir, "docstore.json"), "w") as f:
+            json.dump({"docstore/metadata": {"/repo/a.py": {"doc_hash": "x"}}}, f)
+        store = SnapshotKVStore.from_json_persist_dir(self.test_dir)
+        store.persist()
+        self.assertEqual(
+            SnapshotKVStore.from_persist_path(self.path).get("/repo/a.py", "docstore/metadata"),
+            {"doc_hash": "x"}
+        )
+
+    def test_warm_start_is_fast(self):
+        store = SnapshotKVStore(self.path)
+        body = "x = 1\n" * 200
+        for i in range(50000):
+            store.put(f"node-{i}", {"text": body, "id": i}, "docstore/data")
+        store.persist()
+
+        started = time.perf_counter()
+        loaded = SnapshotKVStore.from_persist_path(self.path)
+        elapsed = time.perf_counter() - started
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(loaded.get("node-49999", "docstore/data")["id"], 49999)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from src.tools import index_vacuum
+from src.tools.index_vacuum import plan_vacuum, ref_doc_to_path, dir_size, compact_sqlite, sync_docstore
+
+# index_tools 通过 `import config` 导入 src/config.py
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from src.tools import index_tools  # noqa: E402
+
+
+class TestIndexVacuum(unittest.TestCase):
+    def test_ref_doc_to_path(self):
+        self.assertEqual(ref_doc_to_path("/repo/a.py"), "/repo/a.py")
+        self.assertEqual(ref_doc_to_path("/repo/README.md_part_3"), "/repo/README.md")
+
+    def test_plan_detects_orphans_stale_and_duplicates(self):
+        expected = {
+            "/repo/a.py": ["def a(): pass", "def b(): pass"],
+            "/repo/b.py": ["x = 1"],
+        }
+        entries = [
+            {"id": "1", "ref_doc_id": "/repo/a.py", "text": "def a(): pass"},
+            {"id": "2", "ref_doc_id": "/repo/a.py", "text": "def a(): pass"},  # 重复
+            {"id": "3", "ref_doc_id": "/repo/a.py", "text": "def old(): pass"},  # 过期
+            {"id": "4", "ref_doc_id": "/repo/deleted.py", "text": "gone"},  # 孤儿
+            {"id": "5", "ref_doc_id": "/repo/b.py", "text": "x = 1"},
+        ]
+
+        plan = plan_vacuum(entries, expected)
+
+        self.assertEqual(plan["orphan_ids"], ["4"])
+        self.assertEqual(plan["orphan_ref_docs"], {"/repo/deleted.py": ["4"]})
+        self.assertEqual(plan["stale_ids"], ["3"])
+        self.assertEqual(plan["duplicate_ids"], ["2"])
+        # 只有 a.py 的第二个节点缺失，需要重新嵌入
+        self.assertEqual(plan["missing"], [("/repo/a.py", 1)])
+
+    def test_plan_keeps_repeated_chunks(self):
+        # 文件中本来就存在两段相同文本时，两条向量都应保留
+        expected = {"/repo/c.py": ["pass", "pass"]}
+        entries = [
+            {"id": "1", "ref_doc_id": "/repo/c.py", "text": "pass"},
+            {"id": "2", "ref_doc_id": "/repo/c.py", "text": "pass"},
+        ]
+        plan = plan_vacuum(entries, expected)
+        self.assertEqual(plan["duplicate_ids"], [])
+        self.assertEqual(plan["missing"], [])
+
+    def test_sync_docstore_updates_ref_doc_info_and_hashes(self):
+        def node(node_id, ref_doc_id):
+            return TextNode(id_=node_id, text=node_id, relationships={
+                NodeRelationship.SOURCE: RelatedNodeInfo(node_id=ref_doc_id)
+            })
+
+        docstore = SimpleDocumentStore()
+        docstore.add_documents([node("1", "/repo/a.py"), node("3", "/repo/a.py"), node("4", "/repo/deleted.py")])
+        # 内容相同的两个文件哈希相同
+        docstore.set_document_hashes({"/repo/a.py": "h1", "/repo/deleted.py": "h0", "/repo/empty.py": "h0"})
+
+        stale = sync_docstore(docstore, ["3", "4"], {"/repo/a.py": "h2", "/repo/empty.py": "h0"})
+
+        self.assertEqual(stale, ["/repo/deleted.py"])
+        self.assertEqual(docstore.get_ref_doc_info("/repo/a.py").node_ids, ["1"])
+        self.assertIsNone(docstore.get_ref_doc_info("/repo/deleted.py"))
+        self.assertIsNone(docstore.get_document_hash("/repo/deleted.py"))
+        self.assertEqual(docstore.get_document_hash("/repo/a.py"), "h2")
+        self.assertEqual(docstore.get_document_hash("/repo/empty.py"), "h0")
+
+        # 没有 ref_doc_info、只有哈希的失效文档同样被清理
+        docstore.set_document_hash("/repo/gone.py", "h3")
+        self.assertEqual(sync_docstore(docstore, [], {"/repo/a.py": "h2", "/repo/empty.py": "h0"}), ["/repo/gone.py"])
+        self.assertIsNone(docstore.get_document_hash("/repo/gone.py"))
+
+    def test_compact_sqlite_and_size(self):
+        db_dir = tempfile.mkdtemp(prefix="test_vacuum_")
+        try:
+            self.assertFalse(compact_sqlite(db_dir))
+            conn = sqlite3.connect(os.path.join(db_dir, "chroma.sqlite3"))
+            conn.execute("CREATE TABLE t (v TEXT)")
+            conn.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,)] * 500)
+            conn.commit()
+            conn.execute("DELETE FROM t")
+            conn.commit()
+            conn.close()
+
+            before = dir_size(db_dir)
+            self.assertTrue(compact_sqlite(db_dir))
+            self.assertLess(dir_size(db_dir), before)
+        finally:
+            shutil.rmtree(db_dir)
+
+    def test_vacuum_with_open_client_defers_compaction(self):
+        project_root = tempfile.mkdtemp(prefix="test_vacuum_")
+        db_path = os.path.join(project_root, ".chaos", "chroma_db")
+        os.makedirs(db_path)
+        # 模拟仍打开的 ChromaDB 客户端：持有同一个 SQLite 文件的连接
+        client_conn = sqlite3.connect(os.path.join(db_path, "chroma.sqlite3"))
+        client_conn.execute("CREATE TABLE t (v TEXT)")
+        client_conn.commit()
+        client = MagicMock()
+        client.clear_system_cache.side_effect = client_conn.close
+        collection = MagicMock()
+        collection.count.return_value = 0
+        collection.get.return_value = {"ids": []}
+        index = MagicMock(docstore=SimpleDocumentStore())
+        reader = MagicMock()
+        reader.load_data.side_effect = ValueError
+        try:
+            with patch.object(index_tools, "_index", index), \
+                    patch.object(index_tools, "_chroma_collection", collection), \
+                    patch.object(index_tools, "_chroma_client", client), \
+                    patch.object(index_tools, "_create_reader", return_value=reader), \
+                    patch.object(index_tools, "_persist_storage"), \
+                    patch.object(index_vacuum, "compact_sqlite", wraps=compact_sqlite) as compact:
+                report = index_tools.vacuum_index(project_root)
+                self.assertNotIn("error", report)
+                self.assertFalse(report["compacted"])
+                compact.assert_not_called()
+                self.assertEqual(index_tools._pending_compaction, db_path)
+                self.assertIn("推迟到退出时执行", index_vacuum.format_vacuum_report(report))
+
+                # 关闭客户端后才执行推迟的压缩
+                index_tools.close_index()
+                client.clear_system_cache.assert_called_once()
+                compact.assert_called_once_with(db_path)
+                self.assertIsNone(index_tools._index)
+                self.assertIsNone(index_tools._chroma_client)
+                self.assertIsNone(index_tools._pending_compaction)
+        finally:
+            client_conn.close()
+            shutil.rmtree(project_root)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from src import llm_clients
+
+
+class TestLLMClients(unittest.TestCase):
+    def tearDown(self):
+        llm_clients.reset_clients()
+
+    def test_http_client_pooled_per_endpoint(self):
+        a = llm_clients.get_http_client("https://a.example/v1", "k1")
+        self.assertIs(a, llm_clients.get_http_client("https://a.example/v1", "k1"))
+        self.assertIsNot(a, llm_clients.get_http_client("https://a.example/v1", "k2"))
+        self.assertIsNot(a, llm_clients.get_http_client("https://b.example/v1", "k1"))
+
+    @patch("openai.OpenAI")
+    def test_openai_client_reused_with_shared_pool(self, mock_openai):
+        first = llm_clients.get_openai_client(api_key="k", base_url="https://a.example/v1")
+        second = llm_clients.get_openai_client(api_key="k", base_url="https://a.example/v1")
+        self.assertIs(first, second)
+        mock_openai.assert_called_once()
+        kwargs = mock_openai.call_args.kwargs
+        self.assertIs(kwargs["http_client"], llm_clients.get_http_client("https://a.example/v1", "k"))
+        self.assertEqual(kwargs["max_retries"], llm_clients.max_retries())
+
+    def test_chat_completion_passes_through_and_raises(self):
+        client = MagicMock()
+        client.chat.completions.create.return_value = "response"
+        self.assertEqual(llm_clients.chat_completion(client, "test", model="m", messages=[]), "response")
+        client.chat.completions.create.assert_called_once_with(model="m", messages=[])
+
+        client.chat.completions.create.side_effect = RuntimeError("boom")
+        with self.assertRaises(RuntimeError):
+            llm_clients.chat_completion(client, "test", model="m", messages=[])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+from src.agent import overflow
+from src.agent.overflow import emergency_compress, enable_overflow_recovery, is_context_overflow
+from src.agent.tokenizer import HeuristicTokenizer, count_message_tokens
+
+
+class ContextLengthError(Exception):
+    code = "context_length_exceeded"
+
+
+def _conversation(rounds=20, output_lines=300):
+    messages = [{"role": "system", "content": "你是 Coder"}, {"role": "user", "content": "实现缓存功能"}]
+    for i in range(rounds):
+        call_id = f"c{i}"
+        output = "\n".join(f"line {j} of f{i}.py" for j in range(output_lines))
+        messages.append({"role": "assistant", "content": None, "tool_calls": [
+            {"id": call_id, "type": "function", "function": {"name": "read_file", "arguments": f'{{"path": "f{i}.py"}}'}}
+        ]})
+        messages.append({"role": "tool", "content": output, "tool_responses": [
+            {"tool_call_id": call_id, "role": "tool", "content": output}
+        ]})
+    return messages
+
+
+def _tokens(messages):
+    tokenizer = HeuristicTokenizer()
+    total = 0
+    for message in messages:
+        for response in message.get("tool_responses") or []:
+            total += tokenizer.count(response["content"])
+        if not message.get("tool_responses"):
+            total += count_message_tokens(message, tokenizer)
+    return total
+
+
+class FakeAgent:
+    name = "Coder"
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.calls = []
+
+    def _generate_oai_reply_from_client(self, llm_client, messages, cache, **kwargs):
+        self.calls.append(messages)
+        if _tokens(messages) > self.limit:
+            raise RuntimeError("This model's maximum context length is 8192 tokens")
+        return "reply"
+
+
+class TestOverflowRecovery(unittest.TestCase):
+    def test_detects_overflow_errors(self):
+        self.assertTrue(is_context_overflow(ContextLengthError("bad request")))
+        self.assertTrue(is_context_overflow(RuntimeError("Range of input length should be [1, 30720]")))
+        self.assertFalse(is_context_overflow(RuntimeError("rate limit exceeded")))
+
+    def test_emergency_compress_keeps_head_tail_and_pairing(self):
+        messages = _conversation()
+        light = emergency_compress(messages, attempt=1)
+        self.assertEqual(len(light), len(messages))
+        self.assertLess(_tokens(light), _tokens(messages))
+
+        heavy = emergency_compress(messages, attempt=2)
+        self.assertLess(_tokens(heavy), _tokens(light))
+        self.assertEqual(heavy[:2], messages[:2])
+        self.assertIn("紧急压缩", heavy[2]["content"])
+        self.assertEqual(heavy[3]["role"], "assistant")
+        self.assertEqual(heavy[-1]["tool_responses"][0]["tool_call_id"], "c19")
+
+    def test_retries_until_request_fits(self):
+        messages = _conversation()
+        agent = enable_overflow_recovery(FakeAgent(limit=3000), max_attempts=3)
+        before = dict(overflow.overflow_stats)
+        self.assertEqual(agent._generate_oai_reply_from_client(None, messages, None), "reply")
+        self.assertGreater(len(agent.calls), 1)
+        self.assertEqual(overflow.overflow_stats["recovered"], before["recovered"] + 1)
+
+    def test_gives_up_after_max_attempts(self):
+        agent = enable_overflow_recovery(FakeAgent(limit=0), max_attempts=2)
+        before = dict(overflow.overflow_stats)
+        with self.assertRaises(RuntimeError):
+            agent._generate_oai_reply_from_client(None, _conversation(rounds=3), None)
+        self.assertEqual(len(agent.calls), 3)
+        self.assertEqual(overflow.overflow_stats["failed"], before["failed"] + 1)
+
+    def test_other_errors_are_not_retried(self):
+        agent = FakeAgent(limit=0)
+
+        def fail(llm_client, messages, cache, **kwargs):
+            agent.calls.append(messages)
+            raise ValueError("boom")
+
+        agent._generate_oai_reply_from_client = fail
+        enable_overflow_recovery(agent)
+        with self.assertRaises(ValueError):
+            agent._generate_oai_reply_from_client(None, [], None)
+        self.assertEqual(len(agent.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch as mock_patch
+from src.tools.patch_tools import apply_patch
+
+
+class TestPatchTools(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="test_patch_tools_")
+        self.cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        with open("a.py", "w", encoding="utf-8") as f:
+            f.write("".join(f"line {i}\n" for i in range(1, 101)))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.test_dir)
+
+    def _read(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def test_multi_file_patch_with_offsets(self):
+        patch = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n+++ b/a.py\n"
+            # 行号不准确：实际位置在第 10 行
+            "@@ -7,3 +7,3 @@\n line 9\n-line 10\n+line ten\n line 11\n"
+            "@@ -80,3 +80,4 @@\n line 80\n+line 80.5\n line 81\n line 82\n"
+            "--- /dev/null\n+++ b/pkg/new.py\n@@ -0,0 +1,2 @@\n+x = 1\n+y = 2\n"
+        )
+        result = apply_patch(patch)
+        self.assertIn("a.py：应用 2 个 hunk（hunk #1 偏移 +2 行）", result)
+        self.assertIn("pkg/new.py：已创建", result)
+        content = self._read("a.py").splitlines()
+        self.assertEqual(content[8:11], ["line 9", "line ten", "line 11"])
+        self.assertEqual(content[79:82], ["line 80", "line 80.5", "line 81"])
+        self.assertEqual(self._read("pkg/new.py"), "x = 1\ny = 2\n")
+
+    def test_whitespace_and_fuzz_tolerance(self):
+        patch = (
+            "--- a.py\n+++ a.py\n"
+            "@@ -20,5 +20,5 @@\n line 20  \n wrong context\n-line 22\n+line twenty-two\n line 23\n"
+        )
+        result = apply_patch(patch)
+        self.assertIn("忽略", result)
+        self.assertIn("line twenty-two\n", self._read("a.py"))
+
+    def test_rejected_hunk_leaves_files_unchanged(self):
+        original = self._read("a.py")
+        patch = (
+            "--- a/a.py\n+++ b/a.py\n"
+            "@@ -1,2 +1,2 @@\n-line 1\n+line one\n line 2\n"
+            "@@ -50,3 +50,3 @@\n line 50\n-line 51 modified elsewhere\n+line 51 new\n line 52\n"
+        )
+        result = apply_patch(patch)
+        self.assertIn("补丁未应用", result)
+        self.assertIn("hunk #2（@@ -50,3 +50,3 @@）", result)
+        self.assertIn("最接近的位置在第 50 行", result)
+        self.assertEqual(self._read("a.py"), original)
+
+    def test_delete_and_no_newline_at_end(self):
+        patch = "--- a/a.py\n+++ b/a.py\n@@ -99,2 +99,2 @@\n line 99\n-line 100\n+end\n\\ No newline at end of file\n"
+        apply_patch(patch)
+        self.assertTrue(self._read("a.py").endswith("line 99\nend"))
+
+        patch = "--- a/a.py\n+++ /dev/null\n@@ -1,100 +0,0 @@\n-line 1\n"
+        self.assertIn("已删除", apply_patch(patch))
+        self.assertFalse(os.path.exists("a.py"))
+
+    def test_path_aliases_and_failed_removal_rollback(self):
+        # 同一文件的两种写法按顺序叠加，而不是后者覆盖前者
+        patch = (
+            "--- a.py\n+++ a.py\n@@ -1,2 +1,2 @@\n-line 1\n+line one\n line 2\n"
+            "--- ./a.py\n+++ ./a.py\n@@ -3,2 +3,2 @@\n-line 3\n+line three\n line 4\n"
+        )
+        apply_patch(patch)
+        self.assertEqual(self._read("a.py").splitlines()[:3], ["line one", "line 2", "line three"])
+
+        # 删除失败时回滚已写入的文件
+        with open("b.py", "w", encoding="utf-8") as f:
+            f.write("b\n")
+        original = self._read("a.py")
+        patch = (
+            "--- a.py\n+++ a.py\n@@ -2,1 +2,1 @@\n-line 2\n+line two\n"
+            "--- b.py\n+++ /dev/null\n@@ -1,1 +0,0 @@\n-b\n"
+        )
+        with mock_patch("src.tools.patch_tools.os.remove", side_effect=OSError("busy")):
+            result = apply_patch(patch)
+        self.assertIn("已回滚所有修改", result)
+        self.assertEqual(self._read("a.py"), original)
+        self.assertEqual(self._read("b.py"), "b\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from src.tools.file_tools import find_files
+from src.tools.path_index import PathIndex
+
+
+class TestPathIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="test_path_index_")
+        for rel in ["src/tools/file_tools.py", "src/tools/fs_watcher.py", "src/agent/orchestrator.py",
+                    "tests/test_file_tools.py", "docs/FileToolsGuide.md", "README.md", "build_out/file_tools.py",
+                    "node_modules/pkg/index.js"]:
+            self._write(rel)
+        with open(os.path.join(self.root, ".gitignore"), "w", encoding="utf-8") as f:
+            f.write("build_out/\n")
+        self.index = PathIndex(self.root)
+        self.index.build()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, rel):
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("x\n")
+        return path
+
+    def test_fuzzy_ranking(self):
+        paths, total = self.index.find("file_tools.py")
+        self.assertEqual(paths[0], "src/tools/file_tools.py")
+        self.assertEqual(total, 2)
+        # 子序列匹配：片段开头（包括驼峰）优先
+        paths, total = self.index.find("ftools")
+        self.assertEqual(set(paths[:3]), {"src/tools/file_tools.py", "tests/test_file_tools.py", "docs/FileToolsGuide.md"})
+        self.assertEqual(total, 3)
+        self.assertEqual(self.index.find("FTG")[0], ["docs/FileToolsGuide.md"])
+        self.assertEqual(self.index.find("agent/orch")[0], ["src/agent/orchestrator.py"])
+        self.assertEqual(self.index.find("zzz"), ([], 0))
+        # 只有分隔符的查询返回全部文件，不会出错
+        paths, total = self.index.find("/")
+        self.assertEqual(total, len(self.index._mtimes))
+        self.assertEqual(paths[0], "README.md")
+        self.assertEqual(self.index.find("//\\", limit=1)[1], total)
+
+    def test_glob_and_gitignore(self):
+        self.assertEqual(self.index.find("*.md")[0], ["README.md", "docs/FileToolsGuide.md"])
+        self.assertEqual(self.index.find("src/**/*.py", limit=10)[1], 3)
+        self.assertEqual(self.index.find("*.js"), ([], 0))
+
+    def test_recency_and_watcher_updates(self):
+        old = time.time() - 30 * 86400
+        for rel in ["src/tools/file_tools.py", "tests/test_file_tools.py"]:
+            os.utime(os.path.join(self.root, rel), (old, old))
+        self.index.build()
+        self.index.watched = True
+        # 修改时间相同时层级浅的优先，最近修改的文件排在前面
+        self.assertEqual(self.index.find("*file_tools.py")[0], ["tests/test_file_tools.py", "src/tools/file_tools.py"])
+        self.index.on_change("modified", self._write("src/tools/file_tools.py"), False)
+        self.assertEqual(self.index.find("*file_tools.py")[0], ["src/tools/file_tools.py", "tests/test_file_tools.py"])
+
+        self.index.on_change("created", self._write("src/new_module.py"), False)
+        self.assertEqual(self.index.find("new_module")[0], ["src/new_module.py"])
+        shutil.rmtree(os.path.join(self.root, "src", "tools"))
+        self.index.on_change("deleted", os.path.join(self.root, "src", "tools"), True)
+        self.assertEqual(self.index.find("*.py", limit=10)[0], ["src/new_module.py", "src/agent/orchestrator.py", "tests/test_file_tools.py"])
+
+    def test_project_in_repo_subdirectory(self):
+        # 项目只是仓库的子目录时，监听器新增的路径也按仓库根目录的 .gitignore 判断
+        os.makedirs(os.path.join(self.root, ".git"))
+        with open(os.path.join(self.root, ".gitignore"), "w", encoding="utf-8") as f:
+            f.write("/src/generated/\n")
+        index = PathIndex(os.path.join(self.root, "src"))
+        index.build()
+        index.watched = True
+        index.on_change("created", self._write("src/generated/models.py"), False)
+        index.on_change("created", self._write("src/agent/models.py"), False)
+        self.assertEqual(index.find("models")[0], ["agent/models.py"])
+
+    def test_find_files_tool(self):
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            self.assertEqual(find_files("orchestrator"), "src/agent/orchestrator.py")
+            self.assertIn("共找到 4 个文件，仅显示最相关的 2 个", find_files("*.py", limit=2))
+            self.assertIn("未找到", find_files("nothing_here"))
+            self.assertIn("README.md", find_files("/"))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    unittest.main()
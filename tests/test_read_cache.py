@@ -0,0 +1,114 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from src.agent.compress import LLMMessagesCompressor
+from src.agent.overflow import enable_overflow_recovery
+from src.tools.file_tools import read_file
+from src.tools.read_cache import DIFF_MARKER, UNCHANGED_MARKER, track_read_session
+
+
+class FakeExecutor:
+    """模拟执行工具的 agent：generate_reply 中调用 read_file。"""
+
+    def __init__(self, name):
+        self.name = name
+        self.chat_messages = {}
+
+    def generate_reply(self, messages=None, sender=None, path=None, force=False):
+        return read_file(path, force=force)
+
+
+class TestReadCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="test_read_cache_")
+        self.path = os.path.join(self.test_dir, "module.py")
+        self.content = "".join(f"line {i}\n" for i in range(200))
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_reread_returns_unchanged_marker(self):
+        coder = track_read_session(FakeExecutor("Coder"))
+        history = [{"role": "user", "content": "task"}]
+        self.assertEqual(coder.generate_reply(messages=history, path=self.path), self.content)
+
+        history += [{"role": "assistant", "content": "..."}] * 4
+        reply = coder.generate_reply(messages=history, path=self.path)
+        self.assertTrue(reply.startswith(UNCHANGED_MARKER))
+        self.assertIn("第 1 轮", reply)
+        self.assertEqual(coder.generate_reply(messages=history, path=self.path, force=True), self.content)
+
+        # 其他 agent、其他对话以及会话外的直接调用都返回完整内容
+        tester = track_read_session(FakeExecutor("Tester"))
+        self.assertEqual(tester.generate_reply(messages=history, path=self.path), self.content)
+        self.assertEqual(coder.generate_reply(messages=[{"role": "user", "content": "new task"}], path=self.path), self.content)
+        self.assertEqual(read_file(self.path), self.content)
+
+    def test_modified_file_returns_diff(self):
+        coder = track_read_session(FakeExecutor("Coder"))
+        history = [{"role": "user", "content": "task"}]
+        coder.generate_reply(messages=history, path=self.path)
+
+        time.sleep(0.01)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(self.content.replace("line 100\n", "line one hundred\n"))
+        reply = coder.generate_reply(messages=history + [{"role": "assistant", "content": "edit"}], path=self.path)
+        self.assertTrue(reply.startswith(DIFF_MARKER))
+        self.assertIn("-line 100\n+line one hundred", reply)
+        self.assertNotIn("line 5\n", reply)
+
+        # 差异太大时返回全文
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("completely different\n")
+        self.assertEqual(coder.generate_reply(messages=history, path=self.path), "completely different\n")
+
+    def test_compression_invalidates_summarized_reads(self):
+        coder = track_read_session(FakeExecutor("Coder"))
+        other = os.path.join(self.test_dir, "other.py")
+        with open(other, "w", encoding="utf-8") as f:
+            f.write("other\n")
+        history = [{"role": "user", "content": "task"}]
+        coder.generate_reply(messages=history, path=self.path)
+        history += [{"role": "assistant", "content": f"step {i} " * 20} for i in range(6)]
+        coder.generate_reply(messages=history, path=other)
+
+        # 摘要替换了第 1-4 条消息：第 1 轮的读取已不在上下文中，第 7 轮的读取仍然可见
+        compressor = LLMMessagesCompressor({"config_list": []}, max_tokens=40, recent_rounds=1, keep_first_n=1)
+        compressor.llm_compressor = MagicMock()
+        compressor.llm_compressor.compress.return_value = "S"
+        compressor.apply_transform(history)
+        up_to = next(iter(compressor._states.values())).compression_cache["compressed_up_to_index"]
+        self.assertGreater(up_to, 1)
+        self.assertLessEqual(up_to, 7)
+
+        self.assertEqual(coder.generate_reply(messages=history, path=self.path), self.content)
+        self.assertTrue(coder.generate_reply(messages=history, path=other).startswith(UNCHANGED_MARKER))
+
+    def test_overflow_recovery_invalidates_reads(self):
+        coder = track_read_session(FakeExecutor("Coder"))
+        history = [{"role": "user", "content": "task"}]
+        coder.generate_reply(messages=history, path=self.path)
+
+        class OverflowingAgent:
+            name = "Coder"
+            calls = 0
+
+            def _generate_oai_reply_from_client(self, llm_client, messages, cache, **kwargs):
+                self.calls += 1
+                if self.calls == 1:
+                    raise RuntimeError("maximum context length exceeded")
+                return "reply"
+
+        # 发送给模型的消息带有 system 消息，仍然对应到同一对话
+        agent = enable_overflow_recovery(OverflowingAgent())
+        agent._generate_oai_reply_from_client(None, [{"role": "system", "content": "你是 Coder"}] + history, None)
+        self.assertEqual(coder.generate_reply(messages=history, path=self.path), self.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
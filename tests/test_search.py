@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from src.tools.file_tools import search_code
+from src.tools import search
+from src.tools.ignore import IgnoreRules, parse_gitignore
+
+
+class TestSearchCode(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="test_search_")
+        os.makedirs(os.path.join(self.test_dir, "pkg"))
+        with open(os.path.join(self.test_dir, "pkg", "a.py"), "w", encoding="utf-8") as f:
+            f.write("".join(f"value_{i} = {i}\n" for i in range(1, 21)))
+        with open(os.path.join(self.test_dir, "notes.md"), "w", encoding="utf-8") as f:
+            f.write("value_3 is documented here\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _check(self):
+        a_path = os.path.join(self.test_dir, "pkg", "a.py")
+        result = search_code("value_3 ", self.test_dir, context_lines=1, glob="*.py")
+        self.assertEqual(result, f"{a_path}\n  2- value_2 = 2\n  3: value_3 = 3\n  4- value_4 = 4")
+
+        result = search_code(r"value_1\d", self.test_dir, is_regex=True, file_type="py", max_matches=3)
+        self.assertIn("  10: value_10 = 10\n  11: value_11 = 11\n  12: value_12 = 12", result)
+        self.assertIn("仅显示前 3 条匹配，另有 7 条匹配未显示", result)
+
+        result = search_code("value_3", self.test_dir, glob="!*.py")
+        self.assertIn("notes.md", result)
+        self.assertNotIn("a.py", result)
+        self.assertTrue(search_code("(", self.test_dir, is_regex=True).startswith("错误："))
+        self.assertEqual(search_code("missing", self.test_dir), "未找到匹配项。")
+
+    def test_ripgrep(self):
+        if shutil.which("rg") is None:
+            self.skipTest("未安装 ripgrep")
+        self._check()
+
+    def test_python_fallback(self):
+        with patch("src.tools.search.shutil.which", return_value=None):
+            self._check()
+
+    def test_stops_after_omitted_limit(self):
+        with patch.object(search, "MAX_OMITTED_COUNT", 5):
+            result = search_code("value", self.test_dir, max_matches=2)
+            self.assertIn("另有至少 5 条匹配未显示", result)
+            # 回退实现按文件汇总计数，省略数是不小于上限的下界
+            with patch("src.tools.search.shutil.which", return_value=None):
+                self.assertRegex(search_code("value", self.test_dir, max_matches=2), r"另有至少 \d+ 条匹配未显示")
+
+    def test_large_ripgrep_stderr_does_not_block(self):
+        # 模拟 rg 先输出大量警告（超过管道缓冲区）再输出匹配结果
+        match = {"type": "match", "data": {"path": {"text": "a.py"}, "lines": {"text": "value_3\n"}, "line_number": 3}}
+        script = os.path.join(self.test_dir, "fake_rg.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(
+                "import sys\n"
+                "sys.stderr.write('Permission denied\\n' * 20000)\n"
+                "sys.stderr.flush()\n"
+                f"print({json.dumps(json.dumps(match))})\n"
+            )
+        fake_rg = os.path.join(self.test_dir, "rg")
+        with open(fake_rg, "w", encoding="utf-8") as f:
+            f.write(f"#!/bin/sh\nexec {sys.executable} {script}\n")
+        os.chmod(fake_rg, 0o755)
+
+        result = {}
+        with patch("src.tools.search.shutil.which", return_value=fake_rg):
+            thread = threading.Thread(target=lambda: result.update(value=search_code("value_3", self.test_dir)))
+            thread.start()
+            thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(result["value"], "a.py\n  3: value_3")
+
+    def test_python_fallback_gitignore_binary_and_parallel(self):
+        with open(os.path.join(self.test_dir, ".gitignore"), "w", encoding="utf-8") as f:
+            f.write("*.log\n!keep.log\nout/\n")
+        os.makedirs(os.path.join(self.test_dir, "out"))
+        os.makedirs(os.path.join(self.test_dir, "pkg", "sub"))
+        for rel, content in [("debug.log", "value_3\n"), ("keep.log", "value_3\n"), ("out/gen.py", "value_3\n"),
+                             ("pkg/data.dat", "value_3\0"), ("pkg/sub/.gitignore", "local.py\n"),
+                             ("pkg/sub/local.py", "value_3\n"), ("pkg/sub/other.py", "value_3\n")]:
+            with open(os.path.join(self.test_dir, rel), "w", encoding="utf-8") as f:
+                f.write(content)
+
+        expected = sorted(["keep.log", "notes.md", "pkg/a.py", "pkg/sub/other.py"])
+        with patch("src.tools.search.shutil.which", return_value=None):
+            result = search_code("value_3", self.test_dir)
+            self.assertEqual(sorted(line[len(self.test_dir) + 1:] for line in result.splitlines() if not line.startswith(" ")), expected)
+            # 多进程并行扫描的结果与顺序和单进程一致，进程池在多次搜索之间复用
+            with patch.object(search, "SEARCH_WORKERS", 2), patch.object(search, "PARALLEL_MIN_FILES", 1), \
+                    patch.object(search, "CHUNK_FILES", 1):
+                try:
+                    self.assertEqual(search_code("value_3", self.test_dir), result)
+                    pool = search._pool
+                    self.assertIn("仅显示前 3 条匹配", search_code("value", self.test_dir, max_matches=3))
+                    self.assertEqual(search_code("value_3", self.test_dir), result)
+                    self.assertIs(search._pool, pool)
+                    self.assertNotEqual(pool._mp_context.get_start_method(), "fork")
+                finally:
+                    search.shutdown_search_workers()
+
+    def test_python_fallback_skips_hidden_files(self):
+        os.makedirs(os.path.join(self.test_dir, ".github"))
+        for rel in [".env", ".github/wf.yml"]:
+            with open(os.path.join(self.test_dir, rel), "w", encoding="utf-8") as f:
+                f.write("value_3\n")
+        with patch("src.tools.search.shutil.which", return_value=None):
+            fallback = search_code("value_3", self.test_dir)
+        self.assertNotIn(".env", fallback)
+        self.assertNotIn("wf.yml", fallback)
+        if shutil.which("rg") is not None:
+            self.assertEqual(
+                sorted(line for line in search_code("value_3", self.test_dir).splitlines() if not line.startswith(" ")),
+                sorted(line for line in fallback.splitlines() if not line.startswith(" ")),
+            )
+
+
+class TestIgnoreRules(unittest.TestCase):
+    def test_gitignore_semantics(self):
+        rules = IgnoreRules("/repo")
+        rules._rules = {
+            "": parse_gitignore("# comment\n*.py[cod]\n/build_*\ndocs/**/*.tmp\nlogs/\n!logs/keep\n"),
+            "src": parse_gitignore("generated.py\n"),
+        }
+        self.assertTrue(rules.is_ignored("a/b/x.pyc", False))
+        self.assertTrue(rules.is_ignored("build_x", True))
+        self.assertFalse(rules.is_ignored("src/build_x", True))
+        self.assertTrue(rules.is_ignored("docs/a/b/c.tmp", False))
+        self.assertTrue(rules.is_ignored("logs", True))
+        # 目录被忽略后其中的文件不能被重新包含
+        self.assertTrue(rules.is_ignored("logs/keep", False))
+        self.assertTrue(rules.is_ignored("src/generated.py", False))
+        self.assertFalse(rules.is_ignored("generated.py", False))
+        self.assertTrue(rules.is_ignored("node_modules", True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from src.agent.transforms import (
+    SupersessionPruner,
+    ToolOutputElider,
+    collapse_stack_traces,
+    head_tail_excerpt,
+    strip_terminal_noise,
+)
+
+
+def _tool_round(call_id, name, arguments, output):
+    return [
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+        ]},
+        {"role": "tool", "content": output, "tool_responses": [
+            {"tool_call_id": call_id, "role": "tool", "content": output}
+        ]},
+    ]
+
+
+class TestTransforms(unittest.TestCase):
+    def test_strip_terminal_noise(self):
+        text = "\x1b[32mPASSED\x1b[0m\n 45%|####      | 9/20\rDone\nsame\nsame\nsame\nend"
+        cleaned = strip_terminal_noise(text)
+        self.assertNotIn("\x1b", cleaned)
+        self.assertNotIn("45%", cleaned)
+        self.assertIn("Done", cleaned)
+        self.assertIn("(上一行重复 2 次)", cleaned)
+        self.assertTrue(cleaned.endswith("end"))
+
+    def test_collapse_python_traceback(self):
+        frames = "".join(f'  File "m{i}.py", line {i}, in f{i}\n    call_{i}()\n' for i in range(10))
+        text = "Traceback (most recent call last):\n" + frames + "ValueError: boom"
+        collapsed = collapse_stack_traces(text, keep_frames=2)
+        self.assertIn("m0.py", collapsed)
+        self.assertIn("m9.py", collapsed)
+        self.assertNotIn("m5.py", collapsed)
+        self.assertIn("省略 7 层调用栈", collapsed)
+        self.assertTrue(collapsed.endswith("ValueError: boom"))
+
+    def test_head_tail_excerpt(self):
+        text = "\n".join(f"line {i}" for i in range(1000))
+        excerpt = head_tail_excerpt(text, max_chars=500, head_lines=5, tail_lines=3, pointer="重新调用 read_file")
+        self.assertTrue(excerpt.startswith("line 0\n"))
+        self.assertTrue(excerpt.endswith("line 999"))
+        self.assertIn("省略第 6-997 行（共 1000 行）", excerpt)
+        self.assertIn("重新调用 read_file", excerpt)
+        # 单行超长时按字符截断
+        self.assertLess(len(head_tail_excerpt("x" * 10000, max_chars=300)), 400)
+        self.assertEqual(head_tail_excerpt("short", max_chars=300), "short")
+
+    def test_elider_keeps_recent_and_pairing(self):
+        big = "\n".join(f"content line {i}" for i in range(500))
+        messages = [{"role": "user", "content": "task"}]
+        messages += _tool_round("c1", "read_file", '{"file_path": "a.py"}', big)
+        messages += _tool_round("c2", "read_file", '{"file_path": "b.py"}', big)
+
+        elider = ToolOutputElider(keep_recent=1, max_chars=1000, head_lines=10, tail_lines=5)
+        transformed = elider.apply_transform(messages)
+
+        old, recent = transformed[2], transformed[4]
+        self.assertLess(len(old["tool_responses"][0]["content"]), 1500)
+        self.assertIn('read_file({"file_path": "a.py"})', old["tool_responses"][0]["content"])
+        self.assertEqual(old["tool_responses"][0]["tool_call_id"], "c1")
+        self.assertEqual(old["content"], old["tool_responses"][0]["content"])
+        self.assertEqual(recent["tool_responses"][0]["content"], big)
+        # 原始消息不被修改
+        self.assertEqual(messages[2]["tool_responses"][0]["content"], big)
+        self.assertTrue(elider.get_logs(messages, transformed)[1])
+
+        # 结果是确定的，便于前缀缓存
+        self.assertEqual(elider.apply_transform(messages), transformed)
+
+    def test_pruner_stubs_superseded_reads_and_snapshots(self):
+        messages = [{"role": "user", "content": "task"}]
+        messages += _tool_round("c1", "read_file", '{"path": "a.py"}', "old content of a")
+        messages += _tool_round("c2", "git_status", "{}", "M a.py")
+        messages += _tool_round("c3", "edit_block", '{"path": "./a.py", "pattern": "x", "replacement": "y"}', "ok")
+        messages += _tool_round("c4", "read_file", '{"path": "b.py"}', "content of b")
+        messages += _tool_round("c5", "read_file", '{"path": "b.py"}', "content of b v2")
+        messages += _tool_round("c6", "git_status", "{}", "M a.py")
+
+        transformed = SupersessionPruner(keep_recent=0).apply_transform(messages)
+        outputs = [m["tool_responses"][0]["content"] for m in transformed if m.get("tool_responses")]
+
+        self.assertIn("已在第 6 条消息被修改", outputs[0])
+        self.assertIn("与第 12 条消息的输出完全相同", outputs[1])
+        self.assertEqual(outputs[2], "ok")
+        self.assertIn("已在第 10 条消息重新读取", outputs[3])
+        self.assertEqual(outputs[4:], ["content of b v2", "M a.py"])
+        # 工具调用与结果的对应关系不变
+        self.assertEqual(len(transformed), len(messages))
+        self.assertEqual(transformed[2]["tool_responses"][0]["tool_call_id"], "c1")
+        self.assertEqual(transformed[2]["content"], outputs[0])
+
+    def test_pruner_respects_read_ranges(self):
+        messages = [{"role": "user", "content": "task"}]
+        messages += _tool_round("c1", "read_file", '{"path": "a.py", "start_line": 10, "end_line": 20}', "lines 10-20")
+        messages += _tool_round("c2", "read_file", '{"path": "a.py", "start_line": 100, "end_line": 120}', "lines 100-120")
+        messages += _tool_round("c3", "read_file", '{"path": "a.py", "start_line": 1, "end_line": 50}', "lines 1-50")
+
+        transformed = SupersessionPruner(keep_recent=0).apply_transform(messages)
+        outputs = [m["tool_responses"][0]["content"] for m in transformed if m.get("tool_responses")]
+        self.assertIn("已在第 6 条消息重新读取", outputs[0])
+        # 不同的行范围互不取代
+        self.assertEqual(outputs[1:], ["lines 100-120", "lines 1-50"])
+
+    def test_reads_backing_unchanged_markers_are_kept(self):
+        big = "\n".join(f"content line {i}" for i in range(500))
+        messages = [{"role": "user", "content": "task"}]
+        messages += _tool_round("c1", "read_file", '{"path": "a.py"}', big)
+        messages += _tool_round("c2", "edit_block", '{"path": "a.py", "pattern": "x", "replacement": "y"}', "ok")
+        messages += _tool_round("c3", "read_file", '{"path": "a.py"}', "[文件已修改，仅显示差异] 'a.py' ...")
+        messages += _tool_round("c4", "read_file", '{"path": "a.py"}', "[文件未修改] 'a.py' ...")
+        messages += _tool_round("c5", "execute_shell", '{"command": "pytest"}', "ok")
+
+        pruned = SupersessionPruner(keep_recent=0).apply_transform(messages)
+        elided = ToolOutputElider(keep_recent=1, max_chars=1000).apply_transform(pruned)
+        self.assertEqual(elided[2]["tool_responses"][0]["content"], big)
+        self.assertTrue(elided[6]["content"].startswith("[文件已修改"))
+
+    def test_pruner_stubs_failed_call_retried_successfully(self):
+        messages = [{"role": "user", "content": "task"}]
+        messages += _tool_round("c1", "execute_shell", '{"command": "pytest"}', "命令执行失败，退出码：1")
+        messages += _tool_round("c2", "execute_shell", '{"command": "pytest"}', "命令执行成功。")
+        messages += _tool_round("c3", "execute_shell", '{"command": "make"}', "命令执行失败，退出码：2")
+
+        pruner = SupersessionPruner(keep_recent=1)
+        transformed = pruner.apply_transform(messages)
+        self.assertIn("已在第 4 条消息重试成功", transformed[2]["content"])
+        self.assertEqual(transformed[4]["content"], "命令执行成功。")
+        # 没有成功重试的失败调用保持原样
+        self.assertEqual(transformed[6]["content"], "命令执行失败，退出码：2")
+        self.assertTrue(pruner.get_logs(messages, transformed)[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from src.tools import search, trigram_index
+from src.tools.file_tools import search_code
+from src.tools.trigram_index import TrigramIndex
+from tests.bench_search import run_benchmark
+
+
+class TestTrigramIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="test_trigram_")
+        self._write("a.py", "def alpha():\n    return beta()\n")
+        self._write("pkg/b.py", "def beta():\n    return 2\n")
+        self._write("pkg/data.bin", "beta\0binary")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, rel, content):
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_candidates_and_incremental_updates(self):
+        index = TrigramIndex(self.root)
+        index.build()
+        self.assertEqual(index.candidates("beta()"), ["a.py", "pkg/b.py"])
+        self.assertEqual(index.candidates("def alpha"), ["a.py"])
+        self.assertEqual(index.candidates("gamma"), [])
+        self.assertIsNone(index.candidates("be"))
+
+        # 文件监听器的增量更新：修改、新增、删除
+        index.on_change("modified", self._write("a.py", "def gamma():\n    pass\n"), False)
+        index.on_change("created", self._write("pkg/c.py", "gamma = beta()\n"), False)
+        os.remove(os.path.join(self.root, "pkg", "b.py"))
+        index.on_change("deleted", os.path.join(self.root, "pkg", "b.py"), False)
+        self.assertEqual(index.candidates("beta()"), ["pkg/c.py"])
+        self.assertEqual(index.candidates("gamma"), ["a.py", "pkg/c.py"])
+
+        # 合并写出新段后重新加载，离线期间的修改在加载时补齐
+        index.save()
+        self.assertEqual(len(os.listdir(index.index_dir)), 2)
+        self._write("pkg/d.py", "delta = 1\n")
+        reloaded = TrigramIndex(self.root)
+        self.assertTrue(reloaded.load())
+        self.assertEqual(reloaded.candidates("gamma"), ["a.py", "pkg/c.py"])
+        self.assertEqual(reloaded.candidates("delta"), ["pkg/d.py"])
+
+    def test_large_files_are_always_candidates(self):
+        with patch.object(trigram_index, "MAX_FILE_BYTES", 40):
+            self._write("big.py", "# " + "x" * 100 + "\nneedle\n")
+            index = TrigramIndex(self.root)
+            index.build()
+        self.assertEqual(index.candidates("needle"), ["big.py"])
+
+    def test_build_and_merge_in_bounded_chunks(self):
+        for i in range(30):
+            self._write(f"gen/m{i}.py", f"def func_{i}():\n    return value_{i % 4}\n")
+        reference = TrigramIndex(self.root)
+        reference.build()
+        queries = ["beta()", "func_1", "value_3", "def ", "missing"]
+        expected = {query: reference.candidates(query) for query in queries}
+
+        with patch.object(trigram_index, "MERGE_CHUNK_PAIRS", 64):
+            index = TrigramIndex(self.root)
+            index.build()
+            self.assertEqual({query: index.candidates(query) for query in queries}, expected)
+            index.on_change("modified", self._write("gen/m1.py", "value_3 = 1\n"), False)
+            index.save()
+        self.assertEqual(index.candidates("func_1"), [f"gen/m{i}.py" for i in (10, 11, 12, 13, 14, 15, 16, 17, 18, 19)])
+        self.assertIn("gen/m1.py", index.candidates("value_3"))
+        self.assertEqual(sorted(os.listdir(index.index_dir))[0], "CURRENT")
+        self.assertEqual(len(os.listdir(index.index_dir)), 2)
+
+    def test_merge_does_not_block_queries(self):
+        index = TrigramIndex(self.root)
+        index.build()
+        index.on_change("created", self._write("pkg/c.py", "gamma = 1\n"), False)
+        write_runs = trigram_index._write_runs
+        observed = {}
+
+        def slow_write(runs, directory):
+            # 合并写盘期间，另一个线程的查询与文件变更不应被阻塞
+            def other():
+                observed["candidates"] = index.candidates("gamma")
+                index.on_change("created", self._write("pkg/d.py", "gamma = 2\n"), False)
+                os.remove(os.path.join(self.root, "a.py"))
+                index.on_change("deleted", os.path.join(self.root, "a.py"), False)
+
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join(5)
+            observed["blocked"] = thread.is_alive()
+            write_runs(runs, directory)
+
+        with patch.object(trigram_index, "_write_runs", slow_write):
+            index.save()
+        self.assertFalse(observed["blocked"])
+        self.assertEqual(observed["candidates"], ["pkg/c.py"])
+        # 合并期间的变更在切换到新段后仍然有效
+        self.assertEqual(index.candidates("gamma"), ["pkg/c.py", "pkg/d.py"])
+        self.assertEqual(index.candidates("alpha"), [])
+        index.save()
+        self.assertEqual(index.candidates("gamma"), ["pkg/c.py", "pkg/d.py"])
+
+    def test_background_merge_during_save(self):
+        index = TrigramIndex(self.root)
+        index.build()
+        index.on_change("created", self._write("pkg/c.py", "gamma = 1\n"), False)
+        merge_lock = index._merge_lock
+        write_runs = trigram_index._write_runs
+        observed = {}
+
+        def slow_write(runs, directory):
+            # 保存期间增量超过上限，触发后台合并：合并需要等待当前保存结束，且不能丢失期间的变更
+            if "dirty" not in observed:
+                with patch.object(trigram_index, "MAX_OVERLAY_FILES", 0):
+                    index.on_change("created", self._write("pkg/d.py", "gamma = 2\n"), False)
+                observed["dirty"] = set(index._dirty or ())
+                observed["lock"] = index._merge_lock
+            write_runs(runs, directory)
+
+        with patch.object(trigram_index, "_write_runs", slow_write):
+            index.save()
+            for _ in range(500):
+                if not index._merging:
+                    break
+                threading.Event().wait(0.01)
+        self.assertFalse(index._merging)
+        self.assertIs(observed["lock"], merge_lock)
+        self.assertEqual(observed["dirty"], {os.path.join("pkg", "d.py")})
+        self.assertEqual(index.candidates("gamma"), ["pkg/c.py", "pkg/d.py"])
+
+    def test_hidden_files_match_plain_search(self):
+        self._write(".env", "SECRET = beta()\n")
+        self._write(".github/wf.yml", "run: beta()\n")
+        plain = search_code("beta()", self.root)
+        index = TrigramIndex(self.root)
+        index.build()
+        self.assertEqual(index.candidates("beta()"), ["a.py", "pkg/b.py"])
+        with patch.object(trigram_index, "_index", index):
+            self.assertEqual(search_code("beta()", self.root), plain)
+        self.assertNotIn(".env", plain)
+
+    def test_search_code_uses_index(self):
+        index = TrigramIndex(self.root)
+        index.build()
+        with patch.object(trigram_index, "_index", index):
+            with patch("src.tools.search.search_with_ripgrep", wraps=search.search_with_ripgrep) as rg:
+                result = search_code("beta()", self.root)
+                self.assertEqual(sorted(rg.call_args.args[7]), [os.path.join(self.root, "a.py"), os.path.join(self.root, "pkg", "b.py")])
+            self.assertIn("  2:     return beta()", result)
+            self.assertEqual(search_code("missing_name", self.root), "未找到匹配项。")
+            # 子目录与 glob 过滤后的候选文件
+            self.assertNotIn("a.py", search_code("beta", os.path.join(self.root, "pkg")))
+            self.assertIn("a.py", search_code("beta", self.root, glob="a.*"))
+
+
+class TestSearchBenchmark(unittest.TestCase):
+    def test_benchmark_reports_metrics(self):
+        result = run_benchmark(files=60, lines=20, repeat=1)
+        self.assertGreater(result["index_bytes"], 0)
+        for stats in result["queries"].values():
+            self.assertEqual(stats["plain_matches"], stats["indexed_matches"])
+        self.assertEqual(result["queries"]["rare"]["candidates"], 1)
+        self.assertEqual(result["queries"]["missing"]["candidates"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()